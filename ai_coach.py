@@ -0,0 +1,149 @@
+import json
+import os
+import time
+
+from utils.cache import cache_path, config_hash
+
+DEFAULT_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com/v1')  # 可指向本地测试服务
+DEFAULT_MODEL = 'deepseek-chat'
+SYSTEM_PROMPT = "你是一位专业的跳远教练，需要对运动员的表现进行专业评价。"
+
+
+def build_prompt(record):
+    """根据评分记录（score.json）构建评价提示，不包含速度评价"""
+    composite_score = "未知"
+    details = ""
+    if record:
+        composite_score = record['composite']
+        for item in record.get('postures', {}).values():
+            score = "未检测到" if item['score'] is None else f"{item['score']:g}/100"
+            angles = "、".join(f"{a:.1f}°" for a in item['angles'])
+            details += f"        - {item['name']}: {score}" + (f"（关键角度: {angles}）" if angles else "") + "\n"
+
+    return f"""
+        作为一位专业的跳远训练教练，请对一名运动员的挺身式跳远姿态表现进行评价。
+
+        运动员的姿态评分数据如下：
+        - 综合评分: {composite_score}/100
+{details}
+        请从以下几个方面对运动员的姿态表现进行评价：
+        1. 起跳姿态
+        2. 髋关节伸展
+        3. 腹部收缩
+        4. 给出针对性的训练建议
+
+        请用专业、鼓励的语气进行点评，控制在300字以内。
+        要求：评价内容要分段落组织，每个要点一个段落，不要所有内容都在一段里。
+        """
+
+
+class CoachClient(object):
+    """AI 教练评价接口（OpenAI 兼容的 chat/completions）
+
+    - 复用同一个 requests.Session，保持连接池；
+    - 连接和读取均有超时，连接失败及 429/5xx 响应按指数退避自动重试；
+    - 以流式方式接收回答，每收到一段内容调用一次 on_delta；
+    - 相同模型和提示的回答缓存在本地，再次评价时直接返回。
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, model=DEFAULT_MODEL, timeout=(5, 60), retries=2,
+                 temperature=0.7, max_tokens=800, use_cache=True):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout  # (连接超时, 读取超时)，读取超时为两段数据之间的最长间隔
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.use_cache = use_cache
+
+        # requests 在创建客户端时才导入，不影响程序启动
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['POST']), raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+        self.session.headers.update({"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"})
+
+    def payload(self, prompt, stream=True):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    def cache_file(self, prompt):
+        # 缓存键不含 API 密钥和 stream 参数，更换密钥不影响已有评价
+        return cache_path('coach', config_hash(self.base_url, self.payload(prompt, stream=False)), '.json')
+
+    def cached(self, prompt):
+        path = self.cache_file(prompt)
+        if not (self.use_cache and path.is_file()):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['content']
+        except Exception as e:
+            print(f"读取评价缓存失败: {e}")
+            return None
+
+    def evaluate(self, prompt, on_delta=None):
+        """返回完整的评价文本；on_delta(text) 在每收到一段新内容时调用"""
+        content = self.cached(prompt)
+        if content is not None:
+            if on_delta is not None:
+                on_delta(content)
+            return content
+
+        start = time.perf_counter()
+        response = self.session.post(f"{self.base_url}/chat/completions", json=self.payload(prompt),
+                                     timeout=self.timeout, stream=True)
+        with response:
+            response.raise_for_status()
+            if 'text/event-stream' in response.headers.get('Content-Type', ''):
+                parts = []
+                for delta in self.iter_deltas(response):
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+                content = "".join(parts)
+            else:
+                # 不支持流式输出的服务直接返回完整结果
+                content = response.json()['choices'][0]['message']['content']
+                if on_delta is not None:
+                    on_delta(content)
+        print(f"AI 评价耗时 {time.perf_counter() - start:.2f}s")
+
+        if self.use_cache and content:
+            path = self.cache_file(prompt)
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model, 'content': content}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        return content
+
+    @staticmethod
+    def iter_deltas(response):
+        """解析 Server-Sent Events 流，逐段返回回答内容"""
+        response.encoding = 'utf-8'  # text/event-stream 未声明编码时 requests 默认按 ISO-8859-1 解码
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            choices = json.loads(data).get('choices') or [{}]
+            delta = choices[0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+ATHLETE_INDEX_DIR = os.getenv('RUNNER_ATHLETE_INDEX', os.path.join(os.getcwd(), 'athlete_index'))  # 可用环境变量修改
+ROSTER_FILE = 'roster.json'
+EMBEDDINGS_FILE = 'embeddings.f32'
+OWNERS_FILE = 'owners.i32'
+ANN_FILE = 'embeddings.hnsw'
+
+
+def normalize(features):
+    """按行 L2 归一化，归一化后的内积即余弦相似度"""
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=-1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+class AthleteIndex(object):
+    """登记运动员的 ReID 特征索引，把跟踪轨迹识别为名册中的运动员
+
+    每名运动员登记多个外观特征（来自 DeepSort 使用的 ReID 网络，512 维、L2 归一化），全部特征按行追加到
+    float32 矩阵文件 embeddings.f32，owners.i32 记录每行所属的运动员，roster.json 记录名册、特征维度和有效行数。
+    读取时以内存映射方式打开，登记数千名运动员、每人数十个特征也无需一次读入内存。
+
+    查询时一条轨迹与某名运动员的相似度为其平均特征与该运动员各登记特征余弦相似度的最大值：
+    - 默认用 NumPy 分块计算与全部特征的相似度（精确）；
+    - 安装了 faiss 且特征数不少于 ann_min_rows 时，使用 HNSW 近似最近邻索引，只比较最近的 ann_neighbors 个特征，
+      索引保存为 embeddings.hnsw，登记新特征后自动重建。
+    一段视频中的多条轨迹一次批量查询，并按相似度一对一分配（同一名运动员不会分给两条轨迹）。
+
+    Usage:
+        index = AthleteIndex()
+        index.register('张三', session.track_embeddings()[track_id])
+        index.assign(session.track_embeddings())  # {跟踪 ID: (姓名, 相似度)}
+    """
+
+    def __init__(self, path=ATHLETE_INDEX_DIR):
+        self.path = str(path)
+        self.min_similarity = 0.75  # 低于此相似度的轨迹不分配身份（同一视频内 DeepSort 使用 0.8）
+        self.per_track = 32  # 登记时每条轨迹最多保存的特征数，在轨迹中均匀抽取
+        self.ann_min_rows = 50000
+        self.ann_neighbors = 64
+        self.chunk_rows = 65536  # 精确查询时每次读入的特征行数
+        self.names = []
+        self.dim = None
+        self.rows = 0
+        self._embeddings = None
+        self._owners = None
+        self._ann = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def load(self):
+        """重新读取名册并内存映射特征矩阵（其他进程登记后调用）"""
+        with self._lock:
+            roster = {}
+            if os.path.isfile(self.file(ROSTER_FILE)):
+                with open(self.file(ROSTER_FILE), encoding='utf-8') as f:
+                    roster = json.load(f)
+            self.names = roster.get('athletes', [])
+            self.dim = roster.get('dim')
+            self.rows = roster.get('rows', 0)
+            self._ann = None
+            if self.rows:
+                # 只映射名册记录的行，正在追加、尚未写入名册的行不会被读到
+                self._embeddings = np.memmap(self.file(EMBEDDINGS_FILE), dtype=np.float32, mode='r',
+                                             shape=(self.rows, self.dim))
+                self._owners = np.array(np.memmap(self.file(OWNERS_FILE), dtype=np.int32, mode='r',
+                                                  shape=(self.rows,)))
+            else:
+                self._embeddings = np.empty((0, self.dim or 0), dtype=np.float32)
+                self._owners = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    def register(self, name, embeddings):
+        """为运动员登记外观特征 (n, d)，名册中没有该运动员时新增，返回登记的特征数"""
+        return self.register_many({name: embeddings})
+
+    def register_many(self, athletes):
+        """批量登记 {姓名: (n, d) 特征}，一次追加写入并更新名册，返回登记的特征数"""
+        blocks = []
+        for name, embeddings in athletes.items():
+            embeddings = normalize(np.atleast_2d(embeddings))
+            if len(embeddings) > self.per_track:
+                embeddings = embeddings[np.linspace(0, len(embeddings) - 1, self.per_track).round().astype(int)]
+            if len(embeddings) > 0:
+                blocks.append((name, embeddings))
+        if not blocks:
+            return 0
+        with self._lock:
+            dim = self.dim or blocks[0][1].shape[1]
+            for name, embeddings in blocks:
+                if embeddings.shape[1] != dim:
+                    raise ValueError(f"{name} 的特征维度 {embeddings.shape[1]} 与索引的 {dim} 不一致")
+            names = list(self.names)
+            owners = []
+            for name, embeddings in blocks:
+                if name not in names:
+                    names.append(name)
+                owners.append(np.full(len(embeddings), names.index(name), np.int32))
+            embeddings = np.concatenate([e for _, e in blocks])
+            owners = np.concatenate(owners)
+
+            # 先追加特征，再替换名册，中途中断时名册仍指向完整的旧数据
+            os.makedirs(self.path, exist_ok=True)
+            for filename, data, row_bytes in ((EMBEDDINGS_FILE, embeddings, dim * 4), (OWNERS_FILE, owners, 4)):
+                with open(self.file(filename), 'r+b' if os.path.isfile(self.file(filename)) else 'wb') as f:
+                    f.seek(self.rows * row_bytes)
+                    f.write(data.tobytes())
+                    f.truncate()
+            roster = {'dim': int(dim), 'rows': self.rows + len(embeddings), 'athletes': names}
+            tmp = self.file(ROSTER_FILE) + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(roster, f, ensure_ascii=False)
+            os.replace(tmp, self.file(ROSTER_FILE))
+        self.load()
+        return len(embeddings)
+
+    def similarities(self, queries):
+        """查询特征 (q, d) 与各运动员的相似度矩阵 (q, 运动员数)，没有登记特征的运动员为 -1"""
+        queries = normalize(np.atleast_2d(queries))
+        result = np.full((len(queries), len(self.names)), -1.0, dtype=np.float32)
+        if self.rows == 0 or len(queries) == 0:
+            return result
+        ann = self.ann_index()
+        if ann is not None:
+            scores, neighbors = ann.search(queries, min(self.ann_neighbors, self.rows))
+            for i in range(len(queries)):
+                valid = neighbors[i] >= 0
+                np.maximum.at(result[i], self._owners[neighbors[i][valid]], scores[i][valid])
+            return result
+        for start in range(0, self.rows, self.chunk_rows):
+            end = min(start + self.chunk_rows, self.rows)
+            scores = queries @ np.asarray(self._embeddings[start:end]).T
+            owners = self._owners[start:end]
+            # 按运动员分组后逐组取最大值
+            order = np.argsort(owners, kind='stable')
+            groups, first = np.unique(owners[order], return_index=True)
+            result[:, groups] = np.maximum(result[:, groups], np.maximum.reduceat(scores[:, order], first, axis=1))
+        return result
+
+    def ann_index(self):
+        """faiss HNSW 索引，未安装 faiss 或特征数少于 ann_min_rows 时返回 None"""
+        if self.rows < self.ann_min_rows:
+            return None
+        try:
+            import faiss
+        except ImportError:
+            return None
+        with self._lock:
+            if self._ann is not None:
+                return self._ann
+            path = self.file(ANN_FILE)
+            if os.path.isfile(path):
+                ann = faiss.read_index(path)
+                if ann.ntotal == self.rows:
+                    self._ann = ann
+                    return ann
+            print(f"构建运动员特征的近似最近邻索引（{self.rows} 个特征）")
+            ann = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            for start in range(0, self.rows, self.chunk_rows):
+                ann.add(np.ascontiguousarray(self._embeddings[start:start + self.chunk_rows]))
+            faiss.write_index(ann, path)
+            self._ann = ann
+            return ann
+
+    def identify(self, queries):
+        """每个查询特征最相似的运动员 [(姓名, 相似度), ...]，低于 min_similarity 时姓名为 None"""
+        scores = self.similarities(queries)
+        if scores.shape[1] == 0:
+            return [(None, None) for _ in range(len(scores))]
+        best = scores.argmax(axis=1)
+        return [(self.names[j] if scores[i, j] >= self.min_similarity else None, float(scores[i, j]))
+                for i, j in enumerate(best.tolist())]
+
+    def assign(self, track_embeddings):
+        """把一段视频中已确认的轨迹批量分配为名册中的运动员
+
+        Args:
+            track_embeddings: {跟踪 ID: (n, d) 特征}，如 TrackerSession.track_embeddings()
+
+        Returns:
+            {跟踪 ID: (姓名, 相似度)}，只包含相似度不低于 min_similarity 的轨迹，每名运动员最多分配一条轨迹
+        """
+        track_ids = [track_id for track_id, features in track_embeddings.items() if len(features) > 0]
+        if not track_ids or not self.names:
+            return {}
+        queries = np.stack([normalize(normalize(track_embeddings[t]).mean(axis=0)) for t in track_ids])
+        scores = self.similarities(queries)
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(-scores)
+        return {int(track_ids[i]): (self.names[j], float(scores[i, j]))
+                for i, j in zip(rows.tolist(), cols.tolist()) if scores[i, j] >= self.min_similarity}
+
+
+def collect_track_embeddings(video_path, step=2, process_size=(960, 540)):
+    """检测并跟踪视频中的人，返回各已确认轨迹的 ReID 特征 {跟踪 ID: (n, 512)}，每隔 step 帧处理一帧"""
+    import tracker
+    from model_registry import REGISTRY
+    from utils.frame_source import FrameSource
+
+    session = tracker.TrackerSession(keep_embeddings=True)
+    source = FrameSource(video_path, step=step, resize=process_size, reuse_buffers=True)
+    try:
+        with REGISTRY.lease('detector') as detector:
+            detector.reset()
+            for frame in source:
+                bboxes = detector.detect(frame.image)
+                if len(bboxes) > 0:
+                    session.update(bboxes, frame.image)
+    finally:
+        source.release()
+    return session.track_embeddings()
+
+
+if __name__ == '__main__':
+    # 在仓库根目录下运行:
+    #   python athlete_index.py register 张三 video/test.mp4   登记视频中出现时间最长的人
+    #   python athlete_index.py identify video/test.mp4        识别视频中各轨迹的身份
+    import argparse
+
+    parser = argparse.ArgumentParser(description='运动员 ReID 特征名册')
+    parser.add_argument('command', choices=['register', 'identify', 'list'])
+    parser.add_argument('args', nargs='*')
+    opt = parser.parse_args()
+
+    index = AthleteIndex()
+    if opt.command == 'list':
+        print(f"{len(index)} 名运动员，{index.rows} 个特征: {', '.join(index.names)}")
+    elif opt.command == 'register':
+        name, video = opt.args
+        tracks = collect_track_embeddings(video)
+        if not tracks:
+            print("视频中没有已确认的跟踪轨迹")
+        else:
+            track_id, features = max(tracks.items(), key=lambda item: len(item[1]))
+            print(f"登记 {name}: 轨迹 {track_id}，{index.register(name, features)} 个特征")
+    else:
+        for track_id, (name, similarity) in sorted(index.assign(collect_track_embeddings(opt.args[0])).items()):
+            print(f"轨迹 {track_id}: {name}（相似度 {similarity:.3f}）")
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from landmark_cache import LandmarkRecorder
+from model_registry import REGISTRY
+from utils.profiler import span
+
+
+def select_athlete(list_bboxs, gate_counter=None, previous_id=None, exclude=()):
+    """在本帧的跟踪框中选出运动员
+
+    优先选择最近进入黄色、蓝色测速区域的目标，其次是上一帧选中的目标，否则取面积最大的框；
+    exclude 中的跟踪 ID 不参与选择。本帧没有可选的跟踪框时返回 None。
+    """
+    list_bboxs = [bbox for bbox in list_bboxs if bbox[5] not in exclude]
+    if len(list_bboxs) == 0:
+        return None
+    by_id = {bbox[5]: bbox for bbox in list_bboxs}
+    candidates = [previous_id]
+    if gate_counter is not None:
+        candidates = list(reversed(gate_counter.yellow_ids)) + list(reversed(gate_counter.blue_ids)) + candidates
+    for track_id in candidates:
+        if track_id in by_id:
+            return by_id[track_id]
+    return max(list_bboxs, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]))
+
+
+class AthleteCropper(object):
+    """把运动员框扩展为正方形区域，缩放为固定尺寸的 RGB 图像，供 MediaPipe 姿态估计
+
+    区域超出画面的部分填充黑色，运动员靠近画面边缘时比例不变。输出图像写入复用的缓冲区，
+    下一次调用时被覆盖。
+    """
+
+    def __init__(self, size=256, margin=0.25):
+        self.size = size
+        self.margin = margin  # 框的长边两侧各扩展的比例，保证伸展的四肢在区域内
+        self._bgr = np.empty((size, size, 3), dtype=np.uint8)
+        self._rgb = np.empty((size, size, 3), dtype=np.uint8)
+
+    def region(self, box):
+        """框 (x1, y1, x2, y2) 对应的正方形区域 (x0, y0, 边长)，像素坐标"""
+        x1, y1, x2, y2 = box
+        side = max(x2 - x1, y2 - y1) * (1 + 2 * self.margin)
+        return (x1 + x2 - side) / 2, (y1 + y2 - side) / 2, side
+
+    def crop(self, frame, box):
+        """返回 (固定尺寸的 RGB 图像, 区域在整帧中的归一化位置 (x, y, 宽, 高))，框太小时返回 (None, None)"""
+        x0, y0, side = self.region(box)
+        if side < 2:
+            return None, None
+        height, width = frame.shape[:2]
+        scale = self.size / side
+        matrix = np.float32([[scale, 0, -x0 * scale], [0, scale, -y0 * scale]])
+        cv2.warpAffine(frame, matrix, (self.size, self.size), dst=self._bgr, flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB, dst=self._rgb)  # MediaPipe 需要 RGB 输入
+        return self._rgb, (x0 / width, y0 / height, side / width, side / height)
+
+
+class AthletePoseTracker(object):
+    """只在被跟踪的运动员周围进行姿态估计
+
+    由 YOLO 检测和 DeepSort 跟踪的结果确定运动员，每个运动员占用一个槽位，拥有自己的姿态模型实例
+    （MediaPipe 带有跟踪状态，不能在运动员之间共用）、裁剪缓冲区和关键点记录。第一个槽位是主要运动员
+    （最近过线的目标，否则是面积最大的目标）；max_athletes > 1 时其余槽位依次分配给其他目标，
+    各运动员的姿态估计在线程池中并行进行。所有槽位每帧都记录一行关键点（不在画面中时为 NaN），
+    帧号与视频对齐，关键点为整帧的归一化坐标，评分方法与整帧姿态估计相同。
+
+    Usage:
+        athletes = AthletePoseTracker(pose_options, frame_count)
+        rows = athletes.update(frame, list_bboxs, scale=(sx, sy))  # 每帧调用
+        athletes.close()
+        athletes.athletes()  # [(跟踪 ID, 关键点数组), ...]，第一个为主要运动员
+    """
+
+    def __init__(self, pose_options, frame_count=0, max_athletes=1, crop_size=256, margin=0.25, hold_frames=5,
+                 start_frame=0):
+        self.pose_options = pose_options
+        self.frame_count = frame_count
+        self.max_athletes = max(int(max_athletes), 1)
+        limit = REGISTRY.max_replicas['pose']
+        if self.max_athletes > limit:
+            # 每个槽位独占一个姿态模型实例直到 close()，超过上限的槽位会一直等待归还
+            print(f"同时估计的运动员数 {self.max_athletes} 超过姿态模型实例上限 {limit}，改为 {limit}")
+            self.max_athletes = limit
+        self.crop_size = crop_size
+        self.margin = margin
+        self.hold_frames = hold_frames  # 运动员短暂丢失跟踪时沿用上一个框的帧数
+        self.slots = []
+        self.frames = start_frame  # 已记录的帧数，从 start_frame 开始处理时之前的帧记为未检测到
+        self._executor = ThreadPoolExecutor(self.max_athletes, thread_name_prefix='pose') \
+            if self.max_athletes > 1 else None
+
+    def _new_slot(self):
+        slot = {'track_id': None, 'box': None, 'missing': 0, 'pose': None,
+                'cropper': AthleteCropper(self.crop_size, self.margin),
+                'recorder': LandmarkRecorder(self.frame_count)}
+        slot['recorder'].skip(self.frames)  # 中途出现的运动员，之前的帧记为未检测到
+        self.slots.append(slot)
+        return slot
+
+    def _assign(self, slot, bbox, scale):
+        if bbox is None:
+            if slot['box'] is not None:
+                slot['missing'] += 1
+                if slot['missing'] > self.hold_frames:
+                    slot['box'] = None
+            return
+        if slot['track_id'] is not None and bbox[5] != slot['track_id'] and hasattr(slot['pose'], 'reset'):
+            slot['pose'].reset()  # 换了一个目标，清除姿态模型的跟踪状态
+        sx, sy = scale
+        slot['track_id'], slot['missing'] = bbox[5], 0
+        slot['box'] = (bbox[0] * sx, bbox[1] * sy, bbox[2] * sx, bbox[3] * sy)
+
+    def update(self, frame, list_bboxs, scale=(1.0, 1.0), gate_counter=None):
+        """处理一帧：分配运动员，在各自的裁剪区域内估计姿态
+
+        Args:
+            frame: 整帧 BGR 图像
+            list_bboxs: 跟踪结果 [(x1, y1, x2, y2, label, track_id), ...]
+            scale: 跟踪框坐标换算到 frame 像素坐标的比例 (sx, sy)
+            gate_counter: 测速时传入，优先选择过线的目标
+
+        Returns:
+            每个槽位本帧的关键点 (33, 4)，未检测到时为 None
+        """
+        if not self.slots:
+            self._new_slot()
+        primary = self.slots[0]
+        self._assign(primary, select_athlete(list_bboxs, gate_counter, primary['track_id']), scale)
+        taken = {primary['track_id']}
+        for slot in self.slots[1:]:
+            bbox = next((b for b in list_bboxs if b[5] == slot['track_id'] and b[5] not in taken), None)
+            self._assign(slot, bbox, scale)
+            taken.add(slot['track_id'])
+        while len(self.slots) < self.max_athletes:
+            bbox = select_athlete(list_bboxs, exclude=taken)
+            if bbox is None:
+                break
+            self._assign(self._new_slot(), bbox, scale)
+            taken.add(bbox[5])
+
+        active = [slot for slot in self.slots if slot['box'] is not None]
+        for slot in active:
+            if slot['pose'] is None:
+                slot['pose'] = REGISTRY.acquire('pose', **self.pose_options)
+                if hasattr(slot['pose'], 'reset'):
+                    slot['pose'].reset()
+        if self._executor is not None and len(active) > 1:
+            results = dict(zip(map(id, active), self._executor.map(lambda s: self._estimate(s, frame), active)))
+        else:
+            results = {id(slot): self._estimate(slot, frame) for slot in active}
+
+        rows = []
+        for slot in self.slots:
+            pose_landmarks, crop = results.get(id(slot), (None, None))
+            rows.append(slot['recorder'].add(pose_landmarks, crop))
+        self.frames += 1
+        return rows
+
+    @staticmethod
+    def _estimate(slot, frame):
+        image, crop = slot['cropper'].crop(frame, slot['box'])
+        if image is None:
+            return None, None
+        with span('pose_estimate'):
+            results = slot['pose'].process(image)
+        return results.pose_landmarks, crop
+
+    def athletes(self):
+        """[(最后一次的跟踪 ID, 关键点数组 (帧数, 33, 4)), ...]，第一个为主要运动员"""
+        if not self.slots:
+            self._new_slot()
+        return [(slot['track_id'], slot['recorder'].landmarks()) for slot in self.slots]
+
+    def close(self):
+        """归还姿态模型，关闭线程池"""
+        for slot in self.slots:
+            if slot['pose'] is not None:
+                REGISTRY.release('pose', slot['pose'], **self.pose_options)
+                slot['pose'] = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
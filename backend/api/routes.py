@@ -1 +1,209 @@
- 
\ No newline at end of file
+import base64
+import json
+import os
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from backend.utils.config import ALLOWED_EXTENSIONS, JOB_KINDS, MAX_CONTENT_LENGTH
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+
+def job_manager():
+    return current_app.extensions['jobs']
+
+
+def upload_store():
+    return current_app.extensions['uploads']
+
+
+def error(message, status):
+    return jsonify({'error': message}), status
+
+
+@api.route('/health', methods=['GET'])
+def health():
+    manager = job_manager()
+    return jsonify({'status': 'ok', 'workers': manager.workers, 'ready': len(manager.ready)})
+
+
+@api.route('/jobs', methods=['POST'])
+def create_job():
+    """上传视频并创建分析任务，表单字段: file（视频文件）、kind（speed 或 posture）、athlete、event（可选，记入历史）"""
+    kind = request.form.get('kind', 'speed')
+    if kind not in JOB_KINDS:
+        return error(f"kind 必须为 {' / '.join(JOB_KINDS)}", 400)
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return error("缺少视频文件", 400)
+    if os.path.splitext(file.filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        return error("不支持的视频格式", 400)
+    job = job_manager().submit(kind, file.filename, file.save, athlete=request.form.get('athlete') or None,
+                               event=request.form.get('event') or None)
+    return jsonify(job), 202
+
+
+@api.route('/uploads', methods=['POST'])
+def create_upload():
+    """创建分片上传，JSON 字段: filename、size（字节数）、kind、sha256（可选，完成时校验）、athlete、event（可选）"""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind', 'speed')
+    filename = data.get('filename') or ''
+    size = data.get('size')
+    if kind not in JOB_KINDS:
+        return error(f"kind 必须为 {' / '.join(JOB_KINDS)}", 400)
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        return error("不支持的视频格式", 400)
+    if not isinstance(size, int) or not 0 < size <= MAX_CONTENT_LENGTH:
+        return error("文件大小无效或超出限制", 400)
+    return jsonify(upload_store().create(kind, filename, size, data.get('sha256'), data.get('athlete') or None,
+                                         data.get('event') or None)), 201
+
+
+@api.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """上传状态，ranges 为已接收的字节区间，续传时只需补传缺失部分"""
+    upload = upload_store().get(upload_id)
+    if upload is None:
+        return error("上传不存在", 404)
+    return jsonify(upload_store().view(upload))
+
+
+@api.route('/uploads/<upload_id>', methods=['PUT'])
+def put_chunk(upload_id):
+    """上传一个分片，请求体为原始字节，查询参数 offset 为分片在文件中的起始位置"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return error("缺少 offset", 400)
+    try:
+        upload = upload_store().write(upload_id, offset, request.stream, request.content_length)
+    except KeyError:
+        return error("上传不存在", 404)
+    except ValueError as e:
+        return error(str(e), 409)
+    return jsonify(upload)
+
+
+@api.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """全部分片上传后调用，校验文件哈希并返回对应的分析任务"""
+    try:
+        upload, message = upload_store().complete(upload_id)
+    except KeyError:
+        return error("上传不存在", 404)
+    if message is not None:
+        return error(message, 422 if upload['status'] == 'failed' else 409)
+    return jsonify(job_manager().get(upload['job'])), 202
+
+
+@api.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(job_manager().list())
+
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager().get(job_id)
+    if job is None:
+        return error("任务不存在", 404)
+    return jsonify(job)
+
+
+@api.route('/jobs/<job_id>/result', methods=['GET'])
+def get_result(job_id):
+    job = job_manager().get(job_id, result=True)
+    if job is None:
+        return error("任务不存在", 404)
+    if job['status'] == 'failed':
+        return error(job['error'], 500)
+    if job['status'] != 'done':
+        return error("任务尚未完成", 409)
+    return jsonify(job['result'])
+
+
+@api.route('/history', methods=['GET'])
+def get_history():
+    """历史记录摘要，查询参数 athlete、event、kind、since、until（YYYY-MM-DD）、limit（最近的条数）"""
+    from results_db import default_db
+    args = request.args
+    return jsonify(default_db().history(args.get('athlete'), args.get('event'), args.get('kind'), args.get('since'),
+                                        args.get('until'), args.get('limit', type=int)))
+
+
+@api.route('/history/scores', methods=['GET'])
+def get_history_scores():
+    """各次评分中各姿态的得分和角度，查询参数 athlete、event、posture、since、until，用于进步曲线"""
+    from results_db import default_db
+    args = request.args
+    return jsonify(default_db().scores(args.get('athlete'), args.get('event'), args.get('posture'),
+                                       args.get('since'), args.get('until')))
+
+
+@api.route('/history/<int:session_id>', methods=['GET'])
+def get_history_record(session_id):
+    from results_db import default_db
+    record = default_db().record(session_id)
+    if record is None:
+        return error("记录不存在", 404)
+    return jsonify(record)
+
+
+def sse_message(version, event, value):
+    """格式化一条 SSE 消息，预览图像以 base64 编码的 JPEG 发送"""
+    if event == 'preview':
+        value = {'image': 'data:image/jpeg;base64,' + base64.b64encode(value).decode('ascii')}
+    data = json.dumps(value, ensure_ascii=False)
+    return f"id: {version}\nevent: {event}\ndata: {data}\n\n"
+
+
+@api.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """以 Server-Sent Events 推送任务的状态、进度、过线事件、速度和预览，任务结束后关闭
+
+    状态、进度、速度和预览只推送最新值，客户端处理慢时会跳过中间值；断线重连时浏览器带上
+    Last-Event-ID，只补发之后的事件。
+    """
+    job = job_manager().get(job_id, result=True)
+    if job is None:
+        return error("任务不存在", 404)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    events = job_manager().hub.get(job_id)
+    if events is None and job['status'] in ('done', 'failed'):
+        # 结束较久的任务事件流已释放，只发送最终状态和结果
+        result = job.pop('result')
+        final = sse_message(1, 'status', job)
+        if job['status'] == 'done':
+            final += sse_message(2, 'result', result)
+        return Response(final + "event: end\ndata: {}\n\n", mimetype='text/event-stream', headers=headers)
+    if events is None:
+        events = job_manager().hub.get(job_id, create=True)
+    try:
+        since = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        since = 0
+
+    def stream():
+        nonlocal since
+        yield "retry: 3000\n\n"
+        while True:
+            version, items, closed = events.wait(since, timeout=15.0)
+            for item in items:
+                yield sse_message(*item)
+            since = version
+            if closed and not items:
+                yield "event: end\ndata: {}\n\n"
+                return
+            if not items:
+                yield ": keep-alive\n\n"  # 防止代理因长时间无数据断开连接
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers=headers)
+
+
+@api.route('/jobs/<job_id>/preview.jpg', methods=['GET'])
+def job_preview(job_id):
+    """任务最新一帧预览图像，尚无预览时返回 204"""
+    events = job_manager().hub.get(job_id)
+    latest = events.latest.get('preview') if events is not None else None
+    if latest is None:
+        return ('', 404) if job_manager().get(job_id) is None else ('', 204)
+    return Response(latest[1], mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
@@ -1 +1,39 @@
- 
\ No newline at end of file
+import argparse
+import atexit
+
+from flask import Flask
+
+from backend.api.routes import api
+from backend.core.upload_store import UploadStore
+from backend.core.video_processor import JobManager
+from backend.utils.config import MAX_CONTENT_LENGTH, PRELOAD, WORKERS
+
+
+def create_app(workers=WORKERS, preload=PRELOAD, start_workers=True):
+    """创建 HTTP 分析服务，启动常驻工作进程"""
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.config['JSON_AS_ASCII'] = False
+    app.json.ensure_ascii = False
+
+    manager = JobManager(workers=workers, preload=preload)
+    app.extensions['jobs'] = manager
+    app.extensions['uploads'] = UploadStore(manager)
+    app.register_blueprint(api)
+
+    if start_workers:
+        manager.start()
+        atexit.register(manager.shutdown)
+    return app
+
+
+if __name__ == '__main__':
+    # 在仓库根目录下运行: python -m backend.app
+    parser = argparse.ArgumentParser(description='测速与姿态评分分析服务')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=WORKERS, help='常驻工作进程数')
+    opt = parser.parse_args()
+
+    app = create_app(workers=opt.workers)
+    app.run(host=opt.host, port=opt.port, threaded=True, use_reloader=False)
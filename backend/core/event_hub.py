@@ -0,0 +1,84 @@
+import threading
+import time
+
+
+# 只保留最新值的事件类型，客户端跟不上时跳过中间值；其余事件（如过线）按顺序完整保留
+COALESCED_EVENTS = ('status', 'progress', 'speed', 'preview')
+
+
+class JobEvents(object):
+    """单个任务的事件流
+
+    发布方（工作进程事件的监听线程）从不等待订阅方：进度、速度和预览每种只保留最新一条，
+    过线等离散事件追加到日志中。每条事件有递增的版本号，订阅方记住自己读到的版本，
+    下次只取更新的内容，因此慢速客户端只会丢掉中间状态，不会拖慢工作进程。
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.version = 0
+        self.latest = {}  # 事件类型 -> (版本号, 内容)
+        self.log = []  # [(版本号, 事件类型, 内容), ...]
+        self.closed = False
+        self.closed_at = None
+
+    def publish(self, event, value):
+        with self.cond:
+            self.version += 1
+            if event in COALESCED_EVENTS:
+                self.latest[event] = (self.version, value)
+            else:
+                self.log.append((self.version, event, value))
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.closed_at = time.monotonic()
+            self.cond.notify_all()
+
+    def changes(self, since):
+        """版本号大于 since 的事件，按版本号排序，返回 (最新版本号, [(版本号, 事件类型, 内容), ...])"""
+        items = [(v, event, value) for event, (v, value) in self.latest.items() if v > since]
+        items += [item for item in self.log if item[0] > since]
+        items.sort(key=lambda item: item[0])
+        return self.version, items
+
+    def wait(self, since, timeout=15.0):
+        """等待新事件，返回 (最新版本号, 事件列表, 是否已结束)；超时时事件列表为空"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > since or self.closed, timeout)
+            version, items = self.changes(since)
+            return version, items, self.closed
+
+
+class EventHub(object):
+    """所有任务的事件流，已结束的任务在 retention 秒后释放"""
+
+    def __init__(self, retention=600.0):
+        self.retention = retention
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def get(self, job_id, create=False):
+        with self.lock:
+            events = self.jobs.get(job_id)
+            if events is None and create:
+                events = self.jobs[job_id] = JobEvents()
+            return events
+
+    def publish(self, job_id, event, value):
+        events = self.get(job_id, create=True)
+        events.publish(event, value)
+
+    def close(self, job_id):
+        events = self.get(job_id)
+        if events is not None:
+            events.close()
+        self.prune()
+
+    def prune(self):
+        now = time.monotonic()
+        with self.lock:
+            for job_id in [j for j, e in self.jobs.items() if e.closed and now - e.closed_at > self.retention]:
+                del self.jobs[job_id]
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from backend.utils import mp4_index
+from backend.utils.config import EARLY_START_BYTES, UPLOAD_STALL_TIMEOUT
+
+CHUNK_READ_SIZE = 1 << 20  # 从请求体读取、写入磁盘的块大小
+UPLOAD_META = 'upload.json'
+
+
+def merge_ranges(ranges, start, end):
+    """把 [start, end) 并入已接收区间，返回按起点排序、互不重叠的新区间列表"""
+    merged = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def prefix_length(ranges):
+    """从文件开头起连续接收的字节数"""
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def save_meta(path, meta):
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class UploadStore(object):
+    """分片、可续传的视频上传
+
+    客户端先声明文件大小（可附带 SHA-256），再以任意顺序、任意大小的分片 PUT 文件内容，每个分片按偏移量
+    直接写入磁盘上预先分配好的文件，不在内存中缓存整个文件。已接收的区间保存在 upload.json 中，
+    断线或服务重启后客户端查询已接收的区间，只补传缺失部分。全部接收后校验哈希并提交任务。
+
+    对于测速任务，MP4 的索引（moov）和开头若干 MB 到达后即提前提交任务：工作进程按帧在文件中的位置
+    等待数据到达（见 UploadWaiter），粗扫描与后续分片的上传同时进行。
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def create(self, kind, filename, size, sha256=None, athlete=None, event=None):
+        upload_id = uuid.uuid4().hex
+        video_path = self.manager.video_path(upload_id, filename)
+        with open(video_path, 'wb') as f:
+            f.truncate(size)  # 预先分配，分片按偏移量写入
+        meta = {'id': upload_id, 'kind': kind, 'filename': filename, 'size': size, 'athlete': athlete, 'event': event,
+                'sha256': sha256.lower() if sha256 else None, 'ranges': [], 'status': 'uploading',
+                'error': None, 'job': None, 'created': time.time(), 'updated': time.time()}
+        upload = self._upload(upload_id, video_path, meta)
+        save_meta(upload['meta_path'], meta)
+        return self.view(upload)
+
+    def _upload(self, upload_id, video_path, meta):
+        upload = {'meta': meta, 'video_path': video_path, 'meta_path': video_path.parent / UPLOAD_META,
+                  'lock': threading.Lock(), 'hasher': hashlib.sha256(), 'hashed': 0}
+        with self.lock:
+            self.uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        """内存中或磁盘上（服务重启前创建）的上传，不存在时返回 None"""
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+        if upload is not None:
+            return upload
+        folder = self.manager.upload_dir / upload_id
+        if len(upload_id) != 32 or not (folder / UPLOAD_META).is_file():
+            return None
+        with open(folder / UPLOAD_META, encoding='utf-8') as f:
+            meta = json.load(f)
+        return self._upload(upload_id, self.manager.video_path(upload_id, meta['filename']), meta)
+
+    @staticmethod
+    def view(upload):
+        meta = upload['meta']
+        ranges = meta['ranges']
+        received = sum(e - s for s, e in ranges)
+        return {'id': meta['id'], 'kind': meta['kind'], 'filename': meta['filename'], 'size': meta['size'],
+                'received': received, 'ranges': ranges, 'next_offset': prefix_length(ranges),
+                'status': meta['status'], 'error': meta['error'], 'job': meta['job']}
+
+    def write(self, upload_id, offset, stream, length):
+        """把请求体中的一个分片写入 offset 处，返回上传状态
+
+        Raises:
+            KeyError: 上传不存在
+            ValueError: 分片超出文件范围，或上传已结束
+        """
+        upload = self.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        meta = upload['meta']
+        if meta['status'] != 'uploading':
+            raise ValueError(f"上传已{'完成' if meta['status'] == 'complete' else '失败'}")
+        if offset < 0 or length is None or offset + length > meta['size']:
+            raise ValueError("分片超出文件范围")
+
+        written = 0
+        with open(upload['video_path'], 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                block = stream.read(min(CHUNK_READ_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+
+        with upload['lock']:
+            if written:
+                meta['ranges'] = merge_ranges(meta['ranges'], offset, offset + written)
+                meta['updated'] = time.time()
+                save_meta(upload['meta_path'], meta)
+            self._advance_hash(upload)
+            if meta['job'] is None and self._early_start_ready(upload):
+                self._submit(upload, early=True)
+        return self.view(upload)
+
+    def _advance_hash(self, upload):
+        """分片基本按顺序到达，随上传对新增的连续数据计算哈希，完成时无需再读一遍整个文件"""
+        end = prefix_length(upload['meta']['ranges'])
+        if end <= upload['hashed']:
+            return
+        with open(upload['video_path'], 'rb') as f:
+            f.seek(upload['hashed'])
+            while upload['hashed'] < end:
+                block = f.read(min(CHUNK_READ_SIZE, end - upload['hashed']))
+                upload['hasher'].update(block)
+                upload['hashed'] += len(block)
+
+    def _early_start_ready(self, upload):
+        """测速任务在 MP4 索引和开头 EARLY_START_BYTES 字节到达后即可开始"""
+        meta = upload['meta']
+        if meta['kind'] != 'speed' or upload['video_path'].suffix not in ('.mp4', '.mov'):
+            return False
+        if prefix_length(meta['ranges']) < min(EARLY_START_BYTES, meta['size']):
+            return False
+        return mp4_index.find_moov(upload['video_path'], meta['size'], meta['ranges']) is not None
+
+    def _submit(self, upload, early=False):
+        meta = upload['meta']
+        job = self.manager.submit(meta['kind'], meta['filename'], job_id=meta['id'],
+                                  upload=str(upload['meta_path']) if early else None,
+                                  athlete=meta.get('athlete'), event=meta.get('event'))
+        meta['job'] = job['id']
+        save_meta(upload['meta_path'], meta)
+        if early:
+            print(f"上传 {meta['id']} 已收到视频索引，提前开始分析")
+
+    def complete(self, upload_id):
+        """确认上传完成：检查所有字节均已接收并校验 SHA-256，然后提交任务（已提前提交的任务继续处理）
+
+        Returns:
+            (上传状态, 错误信息)，错误信息为 None 表示成功
+        """
+        upload = self.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        meta = upload['meta']
+        with upload['lock']:
+            if meta['status'] == 'complete':
+                return self.view(upload), None
+            if meta['status'] == 'failed':
+                return self.view(upload), meta['error']
+            if prefix_length(meta['ranges']) < meta['size']:
+                return self.view(upload), "文件尚未全部上传"
+            self._advance_hash(upload)
+            digest = upload['hasher'].hexdigest()
+            if meta['sha256'] and digest != meta['sha256']:
+                # 已提前开始的任务在等待数据时读到 failed 状态后中止
+                meta.update(status='failed', error=f"SHA-256 校验失败: {digest}")
+            else:
+                meta.update(status='complete', sha256=digest)
+            meta['updated'] = time.time()
+            save_meta(upload['meta_path'], meta)
+            if meta['status'] == 'complete' and meta['job'] is None:
+                self._submit(upload)
+            return self.view(upload), meta['error']
+
+
+class UploadWaiter(object):
+    """在工作进程中等待上传中视频的数据到达，用作 FrameSource 的 wait 回调
+
+    根据 MP4 索引得到每帧数据在文件中的结束位置，读取第 i 帧前等待从文件开头起的连续数据覆盖到该位置
+    （多留 lookahead 帧和 margin 字节，解码器会预读）。上传失败或超过 stall_timeout 秒没有新数据时返回 False。
+    """
+
+    def __init__(self, meta_path, lookahead=16, margin=1 << 20, poll=0.2, stall_timeout=UPLOAD_STALL_TIMEOUT):
+        self.meta_path = meta_path
+        self.lookahead = lookahead
+        self.margin = margin
+        self.poll = poll
+        self.stall_timeout = stall_timeout
+        self.meta = self._load()
+        video_path = os.path.join(os.path.dirname(meta_path), f"video{os.path.splitext(self.meta['filename'])[1].lower()}")
+        moov = mp4_index.find_moov(video_path, self.meta['size'], self.meta['ranges'])
+        self.sample_ends = mp4_index.sample_ends(video_path, moov) if moov else None
+
+    def _load(self):
+        with open(self.meta_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def needed(self, index):
+        """读取第 index 帧（None 表示整个文件）需要的连续字节数"""
+        size = self.meta['size']
+        if index is None or self.sample_ends is None or not len(self.sample_ends):
+            return size
+        end = self.sample_ends[min(index + self.lookahead, len(self.sample_ends) - 1)]
+        return min(int(end) + self.margin, size)
+
+    def __call__(self, index=None):
+        """等待第 index 帧的数据到达；index 为 None 时等待上传完成并通过校验"""
+        needed = self.needed(index)
+        last_change = time.monotonic()
+        received = None
+        while True:
+            status = self.meta['status']
+            if status == 'failed':
+                return False
+            if status == 'complete' or (index is not None and prefix_length(self.meta['ranges']) >= needed):
+                return True
+            if self.meta['ranges'] != received:
+                received = self.meta['ranges']
+                last_change = time.monotonic()
+            elif time.monotonic() - last_change > self.stall_timeout:
+                print(f"上传超过 {self.stall_timeout}s 没有新数据，停止等待")
+                return False
+            time.sleep(self.poll)
+            try:
+                self.meta = self._load()
+            except (OSError, ValueError):
+                pass
@@ -1 +1,252 @@
- 
\ No newline at end of file
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from backend.core.event_hub import EventHub
+from backend.utils.config import BASE_DIR, JOB_KINDS, PRELOAD, PREVIEW_FPS, PREVIEW_SIZE, UPLOAD_DIR, WORKERS
+
+
+class QueueSignal(object):
+    """把工作进程中的事件通过进程间队列发送给服务进程，接口与 pyqtSignal.emit 相同"""
+
+    def __init__(self, events, job_id, event):
+        self.events = events
+        self.job_id = job_id
+        self.event = event
+
+    def emit(self, value):
+        self.events.put((self.job_id, self.event, value))
+
+
+def load_engine(kind):
+    """加载指定任务类型的处理流程，并在工作进程的模型注册表中加载、预热所需模型，每个工作进程只加载一次"""
+    from model_registry import REGISTRY
+    if kind == 'speed':
+        from speed_measure import SpeedMeasure
+        REGISTRY.preload(['detector', 'reid'], background=False)
+        return SpeedMeasure()
+    from posture import Posture
+    REGISTRY.preload(['pose'], background=False)
+    return Posture()
+
+
+def run_job(engine, kind, video_path, output_dir, progress, preview, events, wait=None, athlete=None, event=None):
+    """在工作进程中执行一个任务，返回结构化结果记录。wait 为上传中视频的数据等待回调，athlete、event 记入历史数据库"""
+    engine.athlete, engine.event = athlete, event
+    if kind == 'speed':
+        return engine.measure(video_path, preview=preview, progress=progress, output_dir=output_dir, events=events,
+                              wait=wait)
+    from result_record import SCORE_RECORD, load_record
+    folder = engine.imageflow(video_path, preview=preview, progress=progress, output_dir=output_dir)
+    return load_record(folder, SCORE_RECORD)
+
+
+def worker_main(worker_id, tasks, events, preload):
+    """常驻工作进程：启动时加载模型，之后循环处理任务队列，直到收到 None"""
+    os.chdir(BASE_DIR)
+    from backend.core.upload_store import UploadWaiter
+    from preview import PreviewChannel, ProgressEmitter, encode_jpeg
+
+    engines = {}
+    for kind in preload:
+        engines[kind] = load_engine(kind)
+    events.put((None, 'ready', worker_id))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, kind, video_path, output_dir, upload, athlete, event = task
+        events.put((job_id, 'running', worker_id))
+        progress = ProgressEmitter(QueueSignal(events, job_id, 'progress'), min_interval=0.5)
+        # 低帧率的 JPEG 预览，不等待客户端确认
+        preview = PreviewChannel(QueueSignal(events, job_id, 'preview'), max_fps=PREVIEW_FPS, size=PREVIEW_SIZE,
+                                 enabled=PREVIEW_FPS > 0, wait_ack=False, convert=encode_jpeg)
+        try:
+            if kind not in engines:
+                engines[kind] = load_engine(kind)
+            start = time.perf_counter()
+            wait = UploadWaiter(upload) if upload else None
+            result = run_job(engines[kind], kind, video_path, output_dir, progress, preview,
+                             QueueSignal(events, job_id, 'event'), wait, athlete, event)
+            print(f"[worker {worker_id}] 任务 {job_id} 完成，用时 {time.perf_counter() - start:.2f}s")
+            events.put((job_id, 'result', result))
+        except Exception as e:
+            traceback.print_exc()
+            events.put((job_id, 'error', f"{type(e).__name__}: {e}"))
+
+
+class JobManager(object):
+    """分析任务管理：保存上传的视频，把任务分发给常驻工作进程，并汇总各任务的状态、进度和结果
+
+    工作进程在启动时加载 YOLOv5、ReID 和 MediaPipe 模型并一直保留，多个客户端同时提交的任务
+    排队由空闲进程处理，不会为每个请求重新加载模型。工作进程异常退出时，其正在处理的任务标记为失败，
+    并自动重启该进程。
+    """
+
+    def __init__(self, workers=WORKERS, preload=PRELOAD, upload_dir=UPLOAD_DIR):
+        self.workers = workers
+        self.preload = tuple(preload)
+        self.upload_dir = upload_dir
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.ready = set()
+        self.hub = EventHub()  # 各任务的进度、过线事件和预览，供 SSE 推送
+
+        self._ctx = mp.get_context('spawn')  # CUDA 不支持在 fork 出的子进程中使用
+        self.tasks = self._ctx.Queue()
+        self.events = self._ctx.Queue()
+        self.processes = [None] * workers
+        self._running = False
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+
+    def _start_worker(self, worker_id):
+        process = self._ctx.Process(target=worker_main, args=(worker_id, self.tasks, self.events, self.preload),
+                                    daemon=True, name=f'runner-worker-{worker_id}')
+        process.start()
+        self.processes[worker_id] = process
+
+    def start(self):
+        self._running = True
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+        self._listener.start()
+        print(f"已启动 {self.workers} 个工作进程")
+
+    def video_path(self, job_id, filename):
+        """任务的视频保存位置，原始文件名可能含中文等字符，磁盘上统一命名，原名只作记录"""
+        job_dir = self.upload_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        return job_dir / ('video' + os.path.splitext(filename)[1].lower())
+
+    def submit(self, kind, filename, save=None, job_id=None, upload=None, athlete=None, event=None):
+        """创建任务并排队
+
+        Args:
+            kind: 'speed' 或 'posture'
+            filename: 客户端上传的原始文件名
+            save: save(path) 把上传内容写入 path，如 werkzeug FileStorage.save；None 表示视频已在 video_path() 处
+            job_id: 指定任务 ID（分片上传时与上传 ID 相同），默认自动生成
+            upload: 仍在上传中的视频的 upload.json 路径，工作进程边等待数据边处理
+            athlete, event: 运动员和项目，记入历史数据库
+
+        Returns:
+            任务状态字典
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job_id = job_id or uuid.uuid4().hex
+        video_path = self.video_path(job_id, filename)
+        job_dir = video_path.parent
+        if save is not None:
+            save(str(video_path))
+
+        job = {'id': job_id, 'kind': kind, 'filename': filename, 'athlete': athlete, 'event': event,
+               'status': 'queued', 'progress': 0,
+               'created': time.time(), 'started': None, 'finished': None, 'worker': None,
+               'error': None, 'result': None}
+        with self.lock:
+            self.jobs[job_id] = job
+        self.hub.publish(job_id, 'status', self.view(job))
+        self.tasks.put((job_id, kind, str(video_path), str(job_dir), upload, athlete, event))
+        return self.view(job)
+
+    @staticmethod
+    def view(job, result=False):
+        data = {k: v for k, v in job.items() if k != 'result'}
+        if result:
+            data['result'] = job['result']
+        return data
+
+    def get(self, job_id, result=False):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else self.view(job, result)
+
+    def list(self):
+        with self.lock:
+            return [self.view(job) for job in sorted(self.jobs.values(), key=lambda j: j['created'], reverse=True)]
+
+    def _update(self, job_id, event, value):
+        with self.lock:
+            if event == 'ready':
+                self.ready.add(value)
+                return
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            if event == 'running':
+                job.update(status='running', worker=value, started=time.time())
+            elif event == 'progress':
+                job['progress'] = value
+            elif event == 'result':
+                job.update(status='done', progress=100, result=value, finished=time.time())
+            elif event == 'error':
+                job.update(status='failed', error=value, finished=time.time())
+            status = self.view(job)
+
+        # 推送给订阅的客户端，发布方不等待客户端
+        if event in ('running', 'result', 'error'):
+            self.hub.publish(job_id, 'status', status)
+        if event == 'progress':
+            self.hub.publish(job_id, 'progress', value)
+        elif event == 'preview':
+            self.hub.publish(job_id, 'preview', value)
+        elif event == 'event':
+            self.hub.publish(job_id, value['type'], value)
+        elif event == 'result':
+            self.hub.publish(job_id, 'result', value)
+        if event in ('result', 'error'):
+            self.hub.close(job_id)
+
+    def _check_workers(self):
+        """重启异常退出的工作进程，并把其正在处理的任务标记为失败"""
+        for worker_id, process in enumerate(self.processes):
+            if process is None or process.is_alive():
+                continue
+            failed = []
+            with self.lock:
+                was_ready = worker_id in self.ready
+                self.ready.discard(worker_id)
+                for job in self.jobs.values():
+                    if job['status'] == 'running' and job['worker'] == worker_id:
+                        job.update(status='failed', error='工作进程异常退出', finished=time.time())
+                        failed.append(self.view(job))
+            for status in failed:
+                self.hub.publish(status['id'], 'status', status)
+                self.hub.close(status['id'])
+            if not was_ready:
+                # 加载模型时就已退出（如缺少权重文件），重启也会同样失败
+                print(f"工作进程 {worker_id} 启动失败（退出码 {process.exitcode}），不再重启")
+                self.processes[worker_id] = None
+                continue
+            print(f"工作进程 {worker_id} 异常退出（退出码 {process.exitcode}），正在重启")
+            self._start_worker(worker_id)
+
+    def _listen(self):
+        last_check = time.monotonic()
+        while self._running:
+            try:
+                job_id, event, value = self.events.get(timeout=1.0)
+                self._update(job_id, event, value)
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_check >= 1.0:
+                last_check = time.monotonic()
+                self._check_workers()
+
+    def shutdown(self, timeout=5.0):
+        if not self._running:
+            return
+        self._running = False
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
@@ -1 +1,18 @@
- 
\ No newline at end of file
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[2]  # 仓库根目录，模型权重和标准姿态文件按相对此目录的路径加载
+
+UPLOAD_DIR = Path(os.getenv('RUNNER_UPLOAD_DIR', BASE_DIR / 'uploads'))  # 上传视频和任务结果
+# 测速和评分的历史数据库，写入环境变量，工作进程（spawn）与服务进程使用同一个文件
+RESULTS_DB = os.environ.setdefault('RUNNER_RESULTS_DB', str(BASE_DIR / 'results.db'))
+WORKERS = int(os.getenv('RUNNER_WORKERS', 2))  # 常驻工作进程数，每个进程各自加载一份模型
+PRELOAD = tuple(k for k in os.getenv('RUNNER_PRELOAD', 'speed,posture').split(',') if k)  # 工作进程启动时预加载的模型
+PREVIEW_FPS = float(os.getenv('RUNNER_PREVIEW_FPS', 2))  # 推送给网页客户端的预览帧率，0 表示不推送预览
+PREVIEW_SIZE = (640, 360)
+MAX_CONTENT_LENGTH = int(os.getenv('RUNNER_MAX_UPLOAD_MB', 1024)) * 1024 * 1024
+EARLY_START_BYTES = 4 * 1024 * 1024  # 分片上传时，MP4 索引和开头这么多字节到达后即开始测速的粗扫描
+UPLOAD_STALL_TIMEOUT = 600  # 提前开始的任务等待上传数据的最长时间（秒）
+
+JOB_KINDS = ('speed', 'posture')  # 测速、姿态评分
+ALLOWED_EXTENSIONS = {'.mp4', '.avi', '.flv', '.ts', '.mts', '.mov'}
@@ -0,0 +1,132 @@
+import struct
+
+import numpy as np
+
+# 需要进入其内部查找子 box 的容器类型
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf'}
+
+
+def covered(ranges, start, end):
+    """[start, end) 是否完全落在已接收的区间 ranges（按起点排序、互不重叠的 [s, e)）中"""
+    for s, e in ranges:
+        if s <= start and end <= e:
+            return True
+    return False
+
+
+def read_boxes(data, start=0, end=None):
+    """遍历 data[start:end] 中的同级 box，逐个返回 (类型, 内容起点, 内容终点)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            break
+        yield kind, offset + header, min(offset + size, end)
+        offset += size
+
+
+def find_moov(path, size, ranges):
+    """在部分上传的 MP4 文件中查找 moov（索引）box
+
+    只读取已接收的字节，依次跳过顶层 box（mdat 等只需要其头部）。moov 可能在文件开头（faststart），
+    也可能在末尾（手机录像常见），后者需要客户端先上传文件末尾的分片。
+
+    Returns:
+        moov 的 (起点, 终点)，moov 尚未完整接收或文件不是 MP4 时返回 None
+    """
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset + 8 <= size:
+            if not covered(ranges, offset, offset + 16 if offset + 16 <= size else offset + 8):
+                return None
+            f.seek(offset)
+            header = f.read(16)
+            box_size, kind = struct.unpack('>I4s', header[:8])
+            if box_size == 1:
+                box_size = struct.unpack('>Q', header[8:16])[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < 8 or (offset == 0 and kind != b'ftyp'):
+                return None
+            if kind == b'moov':
+                return (offset, offset + box_size) if covered(ranges, offset, offset + box_size) else None
+            offset += box_size
+    return None
+
+
+def _video_sample_table(moov):
+    """返回第一条视频轨道的 stbl 各子 box 内容 {类型: bytes}"""
+    for kind, start, end in read_boxes(moov):
+        if kind != b'trak':
+            continue
+        tables = {}
+        handler = None
+        stack = [(start, end)]
+        while stack:
+            s, e = stack.pop()
+            for child, cs, ce in read_boxes(moov, s, e):
+                if child in CONTAINER_BOXES:
+                    stack.append((cs, ce))
+                elif child == b'hdlr':
+                    handler = moov[cs + 8:cs + 12]
+                elif child in (b'stsz', b'stsc', b'stco', b'co64'):
+                    tables[child] = moov[cs:ce]
+        if handler == b'vide':
+            return tables
+    return None
+
+
+def sample_ends(path, moov_range):
+    """视频轨道中每个样本（帧，按解码顺序）在文件中的结束位置
+
+    由 stsz（样本大小）、stsc（每个 chunk 的样本数）和 stco/co64（chunk 位置）计算。
+
+    Returns:
+        int64 数组，第 i 个元素为第 i 帧数据的结束字节位置；无法解析时返回 None
+    """
+    with open(path, 'rb') as f:
+        f.seek(moov_range[0])
+        moov = f.read(moov_range[1] - moov_range[0])
+    moov_boxes = list(read_boxes(moov))
+    if not moov_boxes or moov_boxes[0][0] != b'moov':
+        return None
+    tables = _video_sample_table(moov[moov_boxes[0][1]:moov_boxes[0][2]])
+    if tables is None or b'stsz' not in tables or b'stsc' not in tables:
+        return None
+
+    stsz = tables[b'stsz']
+    uniform, count = struct.unpack('>II', stsz[4:12])
+    sizes = np.full(count, uniform, np.int64) if uniform else np.frombuffer(stsz, '>u4', count, 12).astype(np.int64)
+    if b'co64' in tables:
+        n = struct.unpack('>I', tables[b'co64'][4:8])[0]
+        chunk_offsets = np.frombuffer(tables[b'co64'], '>u8', n, 8).astype(np.int64)
+    elif b'stco' in tables:
+        n = struct.unpack('>I', tables[b'stco'][4:8])[0]
+        chunk_offsets = np.frombuffer(tables[b'stco'], '>u4', n, 8).astype(np.int64)
+    else:
+        return None
+    n = struct.unpack('>I', tables[b'stsc'][4:8])[0]
+    stsc = np.frombuffer(tables[b'stsc'], '>u4', n * 3, 8).reshape(n, 3).astype(np.int64)
+
+    # 每个 chunk 的样本数：stsc 的每一项从 first_chunk 起生效，直到下一项
+    samples_per_chunk = np.zeros(len(chunk_offsets), np.int64)
+    for i, (first_chunk, per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+        samples_per_chunk[first_chunk - 1:last_chunk] = per_chunk
+
+    ends = np.empty(count, np.int64)
+    sample = 0
+    for offset, per_chunk in zip(chunk_offsets, samples_per_chunk):
+        chunk_sizes = sizes[sample:sample + per_chunk]
+        ends[sample:sample + len(chunk_sizes)] = offset + np.cumsum(chunk_sizes)
+        sample += len(chunk_sizes)
+        if sample >= count:
+            break
+    return ends[:sample]
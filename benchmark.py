@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# 基准测试使用仓库自带的视频，参数固定，保证每次运行可比较
+BENCHMARK_CASES = [
+    ('speed', 'video/test.mp4'),
+    ('speed', 'video/mynewtest.mp4'),
+    ('posture', 'video/test.mp4'),
+]
+BASELINE_PATH = 'benchmarks/baseline.json'  # 吞吐量和内存与机器相关，基线在每台测试机器上生成，不提交到仓库
+# 回归阈值：吞吐量下降、峰值内存上升按相对比例，测速和评分结果按绝对差值
+THRESHOLDS = {'fps': 0.10, 'peak_rss_mb': 0.15, 'speed': 0.05, 'score': 1.0}
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # macOS 单位为字节，Linux 为 KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)  # Windows 提供峰值工作集
+    except ImportError:
+        return None
+
+
+def run_case(kind, video, output_dir):
+    """在当前进程中运行一个基准用例：加载模型、关闭缓存后处理视频，返回测量结果"""
+    from model_registry import REGISTRY
+    from utils.profiler import Profiler
+
+    t0 = time.perf_counter()
+    if kind == 'speed':
+        from speed_measure import SpeedMeasure
+        REGISTRY.preload(['detector', 'reid'], background=False)
+        engine = SpeedMeasure()
+        engine.use_cache = False
+        engine.profile = False  # 由这里统一统计，不在结果文件夹中另存
+        engine.history = False
+    else:
+        from posture import Posture
+        from result_record import SCORE_RECORD, load_record
+        REGISTRY.preload(['pose'], background=False)
+        engine = Posture()
+        engine.use_cache = False
+        engine.history = False
+    load_seconds = time.perf_counter() - t0
+
+    profiler = Profiler()
+    t0 = time.perf_counter()
+    with profiler.activate():
+        if kind == 'speed':
+            record = engine.measure(video, output_dir=output_dir)
+        else:
+            record = load_record(engine.imageflow(video, output_dir=output_dir), SCORE_RECORD)
+    seconds = time.perf_counter() - t0
+
+    import cv2
+    cap = cv2.VideoCapture(video)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    result = {
+        'kind': kind,
+        'video': video,
+        'frames': frames,
+        'load_seconds': round(load_seconds, 3),
+        'models': REGISTRY.report(),
+        'seconds': round(seconds, 3),
+        'fps': round(frames / seconds, 2) if seconds > 0 else None,  # 视频帧数 / 处理用时，包括跳过的帧
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': {name: {k: s[k] for k in ('count', 'total', 'p50', 'p95', 'p99')}
+                   for name, s in profiler.summary().items()},
+    }
+    if kind == 'speed':
+        result['speed'] = record['speed'] if record else None
+        result['processed_frames'] = record['processed_frames'] if record else None
+    else:
+        result['scores'] = {name: p['score'] for name, p in record['postures'].items()}
+        result['scores']['composite'] = record['composite']
+    return result
+
+
+def run_case_subprocess(kind, video, threads, device):
+    """在独立进程中运行用例，峰值内存和模型加载时间不受其他用例影响"""
+    env = dict(os.environ)
+    if threads:
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            env[name] = str(threads)
+    if device == 'cpu':
+        env['CUDA_VISIBLE_DEVICES'] = ''
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', kind, video, '--threads', str(threads or 0)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith('BENCHMARK_RESULT '):
+            return json.loads(line[len('BENCHMARK_RESULT '):])
+    tail = '\n'.join((proc.stderr or proc.stdout).strip().splitlines()[-5:])
+    return {'kind': kind, 'video': video, 'error': f"退出码 {proc.returncode}: {tail}"}
+
+
+def case_key(result):
+    return f"{result['kind']}:{result['video']}"
+
+
+def compare(results, baseline, thresholds=THRESHOLDS):
+    """与基线比较，返回回归说明列表（为空表示没有回归）"""
+    regressions = []
+    base = {case_key(r): r for r in baseline.get('results', [])}
+    for result in results:
+        key = case_key(result)
+        if 'error' in result:
+            regressions.append(f"{key}: 运行失败 {result['error']}")
+            continue
+        old = base.get(key)
+        if old is None or 'error' in old:
+            continue
+        if old.get('fps') and result['fps'] is not None and result['fps'] < old['fps'] * (1 - thresholds['fps']):
+            regressions.append(f"{key}: 吞吐量 {result['fps']} fps，基线 {old['fps']} fps")
+        if (old.get('peak_rss_mb') and result['peak_rss_mb'] is not None and
+                result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + thresholds['peak_rss_mb'])):
+            regressions.append(f"{key}: 峰值内存 {result['peak_rss_mb']} MB，基线 {old['peak_rss_mb']} MB")
+        if result['kind'] == 'speed':
+            if (result['speed'] is None) != (old['speed'] is None) or (
+                    result['speed'] is not None and abs(result['speed'] - old['speed']) > thresholds['speed']):
+                regressions.append(f"{key}: 速度 {result['speed']} m/s，基线 {old['speed']} m/s")
+        else:
+            # 未检测到的姿态分数为 None：一边有分数一边没有视为回归，两边都没有时跳过
+            old_scores = old.get('scores', {})
+            for name, score in result['scores'].items():
+                if name not in old_scores:
+                    continue
+                old_score = old_scores[name]
+                if (score is None) != (old_score is None) or (
+                        score is not None and abs(score - old_score) > thresholds['score']):
+                    regressions.append(f"{key}: {name} 分数 {score}，基线 {old_score}")
+    return regressions
+
+
+def print_results(results, baseline=None):
+    base = {case_key(r): r for r in (baseline or {}).get('results', [])}
+    print(f"\n{'用例':<34}{'fps':>9}{'基线':>9}{'用时s':>9}{'内存MB':>9}  结果")
+    for r in results:
+        key = case_key(r)
+        if 'error' in r:
+            print(f"{key:<34}  失败: {r['error'].splitlines()[-1] if r['error'] else ''}")
+            continue
+        old = base.get(key, {})
+        value = f"speed={r['speed']}" if r['kind'] == 'speed' else f"composite={r['scores']['composite']}"
+        print(f"{key:<34}{str(r['fps']):>9}{str(old.get('fps', '-')):>9}{r['seconds']:>9}{str(r['peak_rss_mb']):>9}  {value}")
+        slowest = sorted(r['stages'].items(), key=lambda item: -item[1]['total'])[:4]
+        print('    ' + ', '.join(f"{name} p50={s['p50']}ms p95={s['p95']}ms" for name, s in slowest))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测速与姿态评分流程的端到端基准测试')
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH, help='基线文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为新的基线')
+    parser.add_argument('--output', type=str, default=None, help='另存本次结果的 JSON 文件')
+    parser.add_argument('--only', type=str, default=None, help='只运行 speed 或 posture 用例')
+    parser.add_argument('--threads', type=int, default=4, help='固定 CPU 线程数，0 表示不限制')
+    parser.add_argument('--device', type=str, default='cpu', help='cpu 或 auto（有 GPU 时使用 GPU）')
+    parser.add_argument('--case', nargs=2, metavar=('KIND', 'VIDEO'), help=argparse.SUPPRESS)
+    opt = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # 模型权重和标准姿态文件按仓库根目录的相对路径加载
+
+    if opt.case:
+        # 子进程：运行单个用例，最后一行输出结果
+        if opt.threads:
+            try:
+                import torch
+                torch.set_num_threads(opt.threads)
+            except ImportError:
+                pass
+        output_dir = tempfile.mkdtemp(prefix='runner-bench-')
+        try:
+            result = run_case(opt.case[0], opt.case[1], output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        print('BENCHMARK_RESULT ' + json.dumps(result, ensure_ascii=False))
+        return 0
+
+    results = []
+    for kind, video in BENCHMARK_CASES:
+        if opt.only and kind != opt.only:
+            continue
+        print(f"运行 {kind}: {video} ...")
+        results.append(run_case_subprocess(kind, video, opt.threads, opt.device))
+
+    baseline = None
+    if os.path.isfile(opt.baseline):
+        with open(opt.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'processor': platform.processor(), 'threads': opt.threads,
+              'device': opt.device, 'thresholds': THRESHOLDS, 'results': results}
+    if opt.output:
+        with open(opt.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if opt.save_baseline:
+        os.makedirs(os.path.dirname(opt.baseline) or '.', exist_ok=True)
+        with open(opt.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {opt.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"\n没有基线文件 {opt.baseline}，未检查回归。基线与机器相关，请先在本机运行:\n"
+              f"  python benchmark.py --save-baseline --threads {opt.threads} --device {opt.device}")
+        return 0 if all('error' not in r for r in results) else 1
+    changed = [f"{key}: {baseline.get(key)} -> {report[key]}" for key in ('platform', 'processor', 'threads', 'device')
+               if baseline.get(key) != report[key]]
+    if changed:
+        print("\n警告: 基线不是在相同的机器和参数下生成的，吞吐量和内存的比较可能不可靠（" + '; '.join(changed) + "）")
+    regressions = compare(results, baseline, baseline.get('thresholds', THRESHOLDS))
+    if regressions:
+        print("\n发现性能或结果回归:")
+        for line in regressions:
+            print('  ' + line)
+        return 1
+    print("\n与基线相比没有回归")
+    return 0
+
+
+if __name__ == '__main__':
+    # 在仓库根目录下运行: python benchmark.py [--save-baseline]
+    # 基线不随仓库提供，首次在测试机器上运行 python benchmark.py --save-baseline --threads 4 --device cpu
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import time
+
+from athlete_pose import AthletePoseTracker
+from gate import GateZones, GateCounter
+from posture import Posture
+from result_record import result_folder
+from results_db import save_history
+from speed_measure import SpeedMeasure
+from utils.frame_source import FrameSource
+from utils.profiler import span
+from utils.video_writer import AsyncVideoWriter
+
+
+class CombinedAnalysis(object):
+    """一次解码同时完成测速和姿态评分
+
+    每帧只解码一次，整帧图像直接用于姿态估计，同时缩放出处理分辨率（检测、跟踪、过线计时）和
+    显示分辨率（预览）两份图像。姿态估计只在被跟踪的运动员周围的固定尺寸区域内进行（见 AthletePoseTracker，
+    裁剪尺寸和边距使用 Posture 的设置），关键点换算回整帧坐标后按姿态评分相同的方法评分。助跑加起跳的视频只需选择一次，解码开销减半。
+
+    与单独测速不同，这里不做粗扫描，也不在测得速度后提前结束：起跳动作在测速区域之后。
+    测速记录 speed.json、评分记录 score.json、跟踪日志和带骨架的 _jump 视频写入同一个结果文件夹；
+    _jump 视频按 Posture.video_mode 写出完整视频、只写关键帧或不写。
+    """
+
+    def __init__(self, speed_measure=None, posture=None):
+        self.speed_measure = speed_measure or SpeedMeasure()
+        self.posture = posture or Posture()
+        self.speed_result = None
+        self.score_result = None
+        self._is_running = True
+
+    def analyze(self, filename, preview=None, progress=None, output_dir=None, events=None):
+        """测速并评分，返回结果文件夹路径；被 stop() 中止时返回 None
+
+        Args:
+            preview: 预览通道 PreviewChannel，None 表示不显示预览
+            progress: 进度 ProgressEmitter，None 表示不报告进度
+            output_dir: 结果文件夹的上级目录，默认为当前工作目录
+            events: 过线和测速事件的接收方（有 emit(dict) 方法），None 表示不发送
+        """
+        with self.speed_measure.borrowed_detector():
+            return self.run(filename, preview, progress, output_dir, events)
+
+    def run(self, filename, preview, progress, output_dir, events):
+        run_start = time.perf_counter()
+        measure = self.speed_measure
+        measure.begin(filename, preview, progress, output_dir, events)
+        self._is_running = True
+        self.speed_result = None
+        self.score_result = None
+        save_folder, safe_file_name = result_folder(filename, output_dir)
+
+        # 整帧（姿态估计）、处理分辨率（检测和跟踪）、显示分辨率（预览）三份图像来自同一次解码
+        source = FrameSource(filename, resize=[None, (measure.process_width, measure.process_height),
+                                               (measure.display_width, measure.display_height)], reuse_buffers=True)
+        fps, frame_count = source.fps, source.frame_count
+        width, height = source.width, source.height
+        scale_x, scale_y = width / measure.process_width, height / measure.process_height
+
+        zones = GateZones(measure.process_width, measure.process_height, margin=measure.overlap_margin)
+        gate_counter = GateCounter(zones, fps, distance=measure.gate_distance)
+        color_polygons_image = zones.color_image()
+        athletes = AthletePoseTracker(self.posture.pose_options(), frame_count, crop_size=self.posture.crop_size,
+                                      margin=self.posture.crop_margin)
+        track_log = measure.open_track_log(fps, frame_count, None) if measure.track_log else None
+        save_path = self.posture.video_path(save_folder, safe_file_name, filename)
+        vid_writer = None
+        if self.posture.video_mode == 'full':
+            vid_writer = AsyncVideoWriter(save_path, fps, fourcc=self.posture.video_fourcc)
+
+        processed_frames = 0
+        last_display_frame = None
+        try:
+            for frame in source:
+                if not self._is_running:
+                    break
+                full_frame, small_frame, display_frame = frame.image
+                last_display_frame = display_frame
+                processed_frames += 1
+
+                list_bboxs = measure.process_frame(frame.index, small_frame, gate_counter, fps, track_log=track_log)
+                if gate_counter.complete:
+                    measure.speed_calculated = True
+
+                # 姿态估计只在运动员（优先选择过线的目标）周围进行
+                row = athletes.update(full_frame, list_bboxs, (scale_x, scale_y), gate_counter)[0]
+
+                if vid_writer is not None:
+                    # 整帧来自复用的缓冲区，复制一份交给编码线程，骨架在编码线程中直接画在副本上
+                    vid_writer.write(full_frame.copy(), self.posture.skeleton_drawer([row]))
+
+                if measure.preview.due():
+                    processing_info = f"Frame: {frame.index + 1}/{frame_count} Speed + posture"
+                    with span('overlay'):
+                        output_image_frame = measure.draw_overlay(display_frame, list_bboxs, color_polygons_image,
+                                                                  gate_counter, gate_counter.speed, processing_info)
+                    measure.preview.emit(output_image_frame)
+                if frame_count > 0:
+                    measure.progress.emit(int((frame.index + 1) / frame_count * 100))
+        finally:
+            source.release()
+            if track_log is not None:
+                track_log.close()
+            athletes.close()
+            if vid_writer is not None:
+                vid_writer.close()
+
+        if not self._is_running:
+            return None
+        measure.speed = gate_counter.speed
+        total = round(time.perf_counter() - run_start, 3)
+        measure.save_result(gate_counter, fps, frame_count, None, processed_frames, {'combined': total})
+        self.speed_result = measure.result
+        print(f"一次解码完成测速和姿态估计：{processed_frames} 帧，速度={measure.speed}m/s，用时 {total}s")
+        landmarks = athletes.athletes()[0][1]
+        self.score_result = self.posture.score(filename, landmarks, save_folder, timings={'combined': total})
+        if self.posture.history:
+            save_history('posture', self.score_result, self.posture.athlete, self.posture.event, save_folder)
+        if self.posture.video_mode == 'keyframes':
+            self.posture.write_keyframe_video(filename, landmarks, self.score_result, save_path, fps)
+        measure.progress.emit(100, force=True)
+        if last_display_frame is not None and measure.speed > 0:
+            measure.show_result(last_display_frame, gate_counter, processed_frames)
+        return save_folder
+
+    def stop(self):
+        self._is_running = False
+        self.speed_measure.stop()
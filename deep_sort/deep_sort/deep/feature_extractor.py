@@ -5,6 +5,7 @@ import cv2
 import logging
 
 from .model import Net
+from utils.profiler import span
 
 class Extractor(object):
     def __init__(self, model_path, use_cuda=True):
@@ -40,11 +41,12 @@ class Extractor(object):
 
 
     def __call__(self, im_crops):
-        im_batch = self._preprocess(im_crops)
-        with torch.no_grad():
+        with span('reid_preprocess'):
+            im_batch = self._preprocess(im_crops)
+        with torch.no_grad(), span('reid_forward', cuda=True):
             im_batch = im_batch.to(self.device)
             features = self.net(im_batch)
-        return features.cpu().numpy()
+            return features.cpu().numpy()
 
 
 if __name__ == '__main__':
@@ -6,22 +6,39 @@ from .sort.nn_matching import NearestNeighborDistanceMetric
 from .sort.preprocessing import non_max_suppression
 from .sort.detection import Detection
 from .sort.tracker import Tracker
+from utils.profiler import span
 
 
 __all__ = ['DeepSort']
 
 
 class DeepSort(object):
-    def __init__(self, model_path, max_dist=0.2, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=70, n_init=3, nn_budget=100, use_cuda=True):
+    def __init__(self, model_path, max_dist=0.2, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=70, n_init=3, nn_budget=100, use_cuda=True, extractor=None):
         self.min_confidence = min_confidence
         self.nms_max_overlap = nms_max_overlap
 
-        self.extractor = Extractor(model_path, use_cuda=use_cuda)
+        # an already loaded extractor can be shared between several trackers
+        self.extractor = extractor if extractor is not None else Extractor(model_path, use_cuda=use_cuda)
 
         max_cosine_distance = max_dist
         nn_budget = 100
         metric = NearestNeighborDistanceMetric("cosine", max_cosine_distance, nn_budget)
         self.tracker = Tracker(metric, max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init)
+        # track_id -> appearance features of a confirmed track, kept after the track dies (see keep_embeddings)
+        self.embeddings = None
+        self.embedding_budget = 0
+        # detector confidence of each box returned by the last update(), NaN for tracks not matched in that frame
+        self.last_confidences = np.empty(0, dtype=np.float32)
+
+    def keep_embeddings(self, budget=100):
+        """Keep the last `budget` appearance features of every confirmed track, e.g. to identify athletes afterwards"""
+        self.embeddings = {}
+        self.embedding_budget = budget
+
+    def track_embeddings(self):
+        """{track_id: (n, d) float32 features} of every confirmed track seen since keep_embeddings()"""
+        return {track_id: np.asarray(features, dtype=np.float32)
+                for track_id, features in (self.embeddings or {}).items()}
 
     def update(self, bbox_xywh, confidences, ori_img):
         self.height, self.width = ori_img.shape[:2]
@@ -37,18 +54,28 @@ class DeepSort(object):
         detections = [detections[i] for i in indices]
 
         # update tracker
-        self.tracker.predict()
-        self.tracker.update(detections)
+        with span('kalman_predict'):
+            self.tracker.predict()
+        with span('associate'):
+            self.tracker.update(detections)
 
         # output bbox identities
         outputs = []
+        confidences = []
         for track in self.tracker.tracks:
             if not track.is_confirmed() or track.time_since_update > 1:
                 continue
+            if self.embeddings is not None and track.time_since_update == 0:
+                features = self.embeddings.setdefault(track.track_id, [])
+                features.append(track.last_feature)
+                if len(features) > self.embedding_budget:
+                    del features[0]
             box = track.to_tlwh()
             x1,y1,x2,y2 = self._tlwh_to_xyxy(box)
             track_id = track.track_id
             outputs.append(np.array([x1,y1,x2,y2,track_id], dtype=int))
+            confidences.append(track.last_confidence if track.time_since_update == 0 else np.nan)
+        self.last_confidences = np.array(confidences, dtype=np.float32)
         if len(outputs) > 0:
             outputs = np.stack(outputs,axis=0)
         return outputs
@@ -102,10 +129,11 @@ class DeepSort(object):
     
     def _get_features(self, bbox_xywh, ori_img):
         im_crops = []
-        for box in bbox_xywh:
-            x1,y1,x2,y2 = self._xywh_to_xyxy(box)
-            im = ori_img[y1:y2,x1:x2]
-            im_crops.append(im)
+        with span('reid_crop'):
+            for box in bbox_xywh:
+                x1,y1,x2,y2 = self._xywh_to_xyxy(box)
+                im = ori_img[y1:y2,x1:x2]
+                im_crops.append(im)
         if im_crops:
             features = self.extractor(im_crops)
         else:
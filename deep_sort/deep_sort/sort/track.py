@@ -64,7 +64,7 @@ class Track:
     """
 
     def __init__(self, mean, covariance, track_id, n_init, max_age,
-                 feature=None):
+                 feature=None, confidence=None):
         self.mean = mean
         self.covariance = covariance
         self.track_id = track_id
@@ -76,6 +76,8 @@ class Track:
         self.features = []
         if feature is not None:
             self.features.append(feature)
+        self.last_feature = feature  # appearance feature of the most recent associated detection
+        self.last_confidence = confidence  # detector confidence of the most recent associated detection
 
         self._n_init = n_init
         self._max_age = max_age
@@ -138,6 +140,8 @@ class Track:
         self.mean, self.covariance = kf.update(
             self.mean, self.covariance, detection.to_xyah())
         self.features.append(detection.feature)
+        self.last_feature = detection.feature
+        self.last_confidence = detection.confidence
 
         self.hits += 1
         self.time_since_update = 0
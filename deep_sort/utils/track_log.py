@@ -0,0 +1,273 @@
+"""
+Append-only columnar track log.
+
+Rows (one per tracked box per frame) are buffered in preallocated column arrays and written as blocks:
+
+    header:  MAGIC, uint32 meta length, meta JSON (utf-8)
+    block:   BLOCK_MAGIC, uint32 row count, then each column of COLUMNS as raw little-endian arrays
+
+Blocks are flushed when full or every `flush_interval` seconds, so memory stays bounded for recordings of any
+length and a crash loses at most the last unflushed block. A truncated trailing block is ignored on read.
+Exporters write MOTChallenge text and JSON frame by frame without building per-box Python objects.
+"""
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'TRKLOG1\n'
+BLOCK_MAGIC = b'BLK1'
+
+# frame: 0-based frame index, box: x1, y1, x2, y2 in pixels, conf: NaN when the tracker does not report one
+COLUMNS = (
+    ('frame', np.dtype('<i4'), ()),
+    ('track_id', np.dtype('<i4'), ()),
+    ('box', np.dtype('<f4'), (4,)),
+    ('conf', np.dtype('<f4'), ()),
+    ('gate', np.dtype('u1'), ()),
+)
+
+# gate state bit flags
+GATE_BLUE = 1  # box overlaps the blue (start) zone
+GATE_YELLOW = 2  # box overlaps the yellow (finish) zone
+GATE_BLUE_EVENT = 4  # first blue overlap of this track (timing event)
+GATE_YELLOW_EVENT = 8  # first yellow overlap of this track (timing event)
+
+
+class TrackLogWriter(object):
+    """
+    Incremental writer.
+
+    Usage:
+        with TrackLogWriter('tracks.trk', meta={'fps': 25}) as log:
+            log.add(frame_index, list_bboxs, gates=counter.states)
+    """
+
+    def __init__(self, path, block_rows=4096, flush_interval=2.0, meta=None):
+        self.path = path
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self.rows = 0  # rows written so far, including buffered ones
+        self._columns = {name: np.empty((block_rows,) + shape, dtype) for name, dtype, shape in COLUMNS}
+        self._n = 0
+        self._last_flush = time.monotonic()
+        meta_bytes = json.dumps(meta or {}, ensure_ascii=False).encode('utf-8')
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + struct.pack('<I', len(meta_bytes)) + meta_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, frame, track_ids, boxes, confs=None, gates=None):
+        """Append the boxes of one frame; boxes is (n, 4) x1, y1, x2, y2, the other arguments are length n"""
+        count = len(track_ids)
+        if count == 0:
+            return
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(count, 4)
+        track_ids = np.asarray(track_ids, dtype=np.int32)
+        confs = np.full(count, np.nan, np.float32) if confs is None else np.asarray(confs, dtype=np.float32)
+        gates = np.zeros(count, np.uint8) if gates is None else np.asarray(gates, dtype=np.uint8)
+        start = 0
+        while start < count:
+            take = min(count - start, self.block_rows - self._n)
+            end, n = start + take, self._n
+            self._columns['frame'][n:n + take] = frame
+            self._columns['track_id'][n:n + take] = track_ids[start:end]
+            self._columns['box'][n:n + take] = boxes[start:end]
+            self._columns['conf'][n:n + take] = confs[start:end]
+            self._columns['gate'][n:n + take] = gates[start:end]
+            self._n += take
+            start = end
+            if self._n == self.block_rows:
+                self.flush()
+        self.rows += count
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def add(self, frame, list_bboxs, confs=None, gates=None):
+        """Append tracker.update() output [(x1, y1, x2, y2, label, track_id), ...] for one frame"""
+        if len(list_bboxs) == 0:
+            return
+        boxes = [b[:4] for b in list_bboxs]
+        track_ids = [b[5] for b in list_bboxs]
+        self.append(frame, track_ids, boxes, confs, gates)
+
+    def flush(self):
+        if self._n:
+            self._file.write(BLOCK_MAGIC + struct.pack('<I', self._n))
+            for name, dtype, shape in COLUMNS:
+                self._file.write(self._columns[name][:self._n].tobytes())
+            self._n = 0
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class TrackLog(object):
+    """
+    Memory-mapped reader. Columns (frame, track_id, box, conf, gate) are views into the file, one per block;
+    the exporters walk the blocks frame by frame, so only the rows of the current frame become Python objects.
+
+    The whole-column attributes (log.frame, log.box, ...) concatenate the blocks on first access. Logs whose
+    frames are not in increasing order (e.g. the writer was given frames out of order) are read through these
+    sorted columns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) < len(MAGIC) + 4:
+            raise ValueError('not a track log: {}'.format(path))
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._data[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a track log: {}'.format(path))
+        offset = len(MAGIC)
+        meta_len = struct.unpack_from('<I', self._data, offset)[0]
+        offset += 4
+        self.meta = json.loads(bytes(self._data[offset:offset + meta_len]).decode('utf-8'))
+        offset += meta_len
+
+        row_size = sum(dtype.itemsize * int(np.prod(shape)) for _, dtype, shape in COLUMNS)
+        size = len(self._data)
+        self._blocks = []
+        while offset + 8 <= size and bytes(self._data[offset:offset + 4]) == BLOCK_MAGIC:
+            n = struct.unpack_from('<I', self._data, offset + 4)[0]
+            if offset + 8 + n * row_size > size:
+                break  # truncated last block (writer was interrupted)
+            offset += 8
+            block = {}
+            for name, dtype, shape in COLUMNS:
+                count = n * int(np.prod(shape))
+                block[name] = np.frombuffer(self._data, dtype, count, offset).reshape((n,) + shape)
+                offset += count * dtype.itemsize
+            if n:
+                self._blocks.append(block)
+        self._rows = sum(len(block['frame']) for block in self._blocks)
+
+        # frames are normally appended in order; only an out-of-order log needs a (materialized) sort
+        self._columns = {}
+        self._order = None
+        last = None
+        for block in self._blocks:
+            frame = block['frame']
+            if (last is not None and frame[0] < last) or np.any(frame[1:] < frame[:-1]):
+                self._order = np.argsort(self.column('frame'), kind='stable')
+                self._columns = {}
+                break
+            last = frame[-1]
+
+    def __len__(self):
+        return self._rows
+
+    def column(self, name):
+        """One whole column in frame order"""
+        if name not in self._columns:
+            parts = [block[name] for block in self._blocks]
+            if not parts:
+                dtype, shape = {n: (d, s) for n, d, s in COLUMNS}[name]
+                column = np.empty((0,) + shape, dtype)
+            else:
+                column = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            if self._order is not None:
+                column = column[self._order]
+            self._columns[name] = column
+        return self._columns[name]
+
+    @property
+    def frame(self):
+        return self.column('frame')
+
+    @property
+    def track_id(self):
+        return self.column('track_id')
+
+    @property
+    def box(self):
+        return self.column('box')
+
+    @property
+    def conf(self):
+        return self.column('conf')
+
+    @property
+    def gate(self):
+        return self.column('gate')
+
+    def blocks(self):
+        """Yields {column name: rows} blocks in frame order"""
+        if self._order is None:
+            for block in self._blocks:
+                yield block
+        elif self._rows:
+            yield {name: self.column(name) for name, _, _ in COLUMNS}
+
+    def frames(self):
+        """Yields (frame, {column name: rows of this frame}) for every frame that has at least one box"""
+        pending = None
+        for block in self.blocks():
+            frame = block['frame']
+            starts = np.flatnonzero(np.r_[True, frame[1:] != frame[:-1]])
+            ends = np.r_[starts[1:], len(frame)]
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                rows = {name: block[name][s:e] for name, _, _ in COLUMNS}
+                index = int(frame[s])
+                if pending is not None and pending[0] == index:
+                    # a frame split across two blocks (the writer flushed in the middle of it)
+                    rows = {name: np.concatenate([pending[1][name], rows[name]]) for name in rows}
+                elif pending is not None:
+                    yield pending
+                pending = (index, rows)
+        if pending is not None:
+            yield pending
+
+    def to_mot(self, path):
+        """
+        MOTChallenge text: frame (1-based), id, bb_left, bb_top, bb_width, bb_height, conf, -1, -1, -1.
+        Unknown confidences are written as 1. Written block by block.
+        """
+        fmt = ['%d', '%d', '%.2f', '%.2f', '%.2f', '%.2f', '%.3f', '%d', '%d', '%d']
+        with open(path, 'wb') as f:
+            for block in self.blocks():
+                x1, y1, x2, y2 = block['box'].T
+                conf = np.where(np.isnan(block['conf']), 1.0, block['conf'])
+                table = np.column_stack([block['frame'] + 1, block['track_id'], x1, y1, x2 - x1, y2 - y1, conf,
+                                         -np.ones((len(conf), 3))])
+                np.savetxt(f, table, fmt=fmt, delimiter=',')
+        return path
+
+    def to_json(self, path):
+        """{"meta": ..., "frames": [{"frame": f, "tracks": [{"id", "box", "conf", "gate"}, ...]}, ...]}, streamed"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"meta": ' + json.dumps(self.meta, ensure_ascii=False) + ', "frames": [')
+            for i, (frame, rows) in enumerate(self.frames()):
+                confs = [None if np.isnan(c) else round(c, 3) for c in rows['conf'].tolist()]
+                tracks = [{'id': track_id, 'box': box, 'conf': conf, 'gate': gate} for track_id, box, conf, gate
+                          in zip(rows['track_id'].tolist(), np.round(rows['box'], 2).tolist(), confs,
+                                 rows['gate'].tolist())]
+                f.write((', ' if i else '') + json.dumps({'frame': frame, 'tracks': tracks}))
+            f.write(']}')
+        return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a binary track log')
+    parser.add_argument('log', type=str)
+    parser.add_argument('--mot', type=str, default='', help='write MOTChallenge text')
+    parser.add_argument('--json', type=str, default='', help='write JSON')
+    opt = parser.parse_args()
+
+    log = TrackLog(opt.log)
+    print('{} rows, {} tracks, meta: {}'.format(len(log), len(np.unique(log.track_id)), log.meta))
+    if opt.mot:
+        print('MOT: {}'.format(log.to_mot(opt.mot)))
+    if opt.json:
+        print('JSON: {}'.format(log.to_json(opt.json)))
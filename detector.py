@@ -6,6 +6,7 @@ import time
 from models.experimental import attempt_load
 from utils.datasets import letterbox
 from utils.general import non_max_suppression, scale_coords
+from utils.profiler import span
 from utils.torch_utils import select_device
 
 
@@ -21,6 +22,7 @@ class Detector:
         self.device = '0' if torch.cuda.is_available() else 'cpu'
         print(f"Using device: {self.device}")
         self.device = select_device(self.device)
+        load_start = time.perf_counter()
 
         '''加载 YOLOv5 模型的权重文件
         并将模型加载到设备上进行推断
@@ -40,11 +42,18 @@ class Detector:
         self.warmup_runs = 2
         
         # 性能优化 - 预热模型
+        self.load_time = time.perf_counter() - load_start
+        warmup_start = time.perf_counter()
         self.warmup()
+        self.warmup_time = time.perf_counter() - warmup_start
+        print(f"YOLOv5 加载 {self.load_time:.2f}s，预热 {self.warmup_time:.2f}s")
         
-        # 上一帧图像的特征缓存
-        self.last_img = None
+        # 上一帧的灰度直方图（用于相似度判断，不保留整帧图像）和检测结果缓存
+        self.last_hist = None
         self.last_features = None
+        # letterbox 画布按输入尺寸预先分配，缩放结果直接写入画布中间，填充区域只需初始化一次
+        self._canvas = None
+        self._canvas_key = None
         self.skip_count = 0  # 跳帧计数器
         self.max_skip = 2  # 降低最多连续跳过帧数，提高检测准确性
         
@@ -58,12 +67,45 @@ class Detector:
             _ = self.m(dummy_input)
         print("Model warmup complete")
 
+    def reset(self):
+        """清除上一帧缓存，用于切换到不连续的帧序列（如粗扫描结束后跳转到测速窗口）"""
+        self.last_hist = None
+        self.last_features = None
+        self.skip_count = 0
+
+    def letterbox(self, img):
+        """与 utils.datasets.letterbox(img, new_shape=self.img_size) 结果相同，但复用预先分配的画布
+
+        返回的画布在下一次调用时被覆盖。
+        """
+        shape = img.shape
+        if self._canvas_key != (shape, self.img_size):
+            h, w = shape[:2]
+            r = min(self.img_size / h, self.img_size / w)
+            new_w, new_h = int(round(w * r)), int(round(h * r))
+            dw, dh = ((self.img_size - new_w) % 32) / 2, ((self.img_size - new_h) % 32) / 2
+            top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+            left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+            self._canvas = np.full((new_h + top + bottom, new_w + left + right, 3), 114, dtype=np.uint8)
+            self._canvas_roi = (slice(top, top + new_h), slice(left, left + new_w))
+            self._canvas_size = (new_w, new_h)
+            self._canvas_key = (shape, self.img_size)
+        roi = self._canvas[self._canvas_roi]
+        if self._canvas_size == (shape[1], shape[0]):
+            roi[...] = img
+        else:
+            cv2.resize(img, self._canvas_size, dst=roi, interpolation=cv2.INTER_LINEAR)
+        return self._canvas
+
     def preprocess(self, img):
-        img0 = img.copy()  # 创建一个原始图像 img 的副本 img0，以便后续使用
-        
+        # 检测框只需要原图的尺寸，原图不会被修改，无需复制
+        img0 = img
+
         # 检查图像相似度，如果图像与上一帧非常相似，可以考虑复用特征
-        if self.last_img is not None and self.skip_count < self.max_skip:
-            similarity = self.check_similarity(img, self.last_img)
+        with span('similarity'):
+            hist = self.histogram(img)
+        if self.last_hist is not None and self.skip_count < self.max_skip:
+            similarity = self.compare_histograms(hist, self.last_hist)
             if similarity > 0.98:  # 提高相似度阈值，降低复用概率，增加检测准确性
                 self.skip_count += 1
                 # 返回None表示可以复用上一帧的特征
@@ -71,19 +113,20 @@ class Detector:
         
         # 重置跳帧计数器
         self.skip_count = 0
-        self.last_img = img.copy()
+        self.last_hist = hist
         
-        img = letterbox(img, new_shape=self.img_size)[
-            0]  # 函数对图像进行填充（或裁剪）操作，将图像大小调整为指定的 self.img_size 尺寸。返回的结果是调整后的图像 img
+        with span('letterbox'):
+            img = self.letterbox(img)  # 对图像进行缩放和填充，将图像大小调整为 self.img_size 尺寸
         img = img[:, :, ::-1].transpose(2, 0, 1)
         '''对调整后的图像 img 进行通道顺序转换和维度转置操作，
         将通道顺序从 BGR（Blue-Green-Red）转换为 RGB（Red-Green-Blue），
         并将通道维度从 HWC（高-宽-通道）转换为 CHW（通道-高-宽）。
         这样做是因为许多深度学习模型的输入要求为 RGB 通道顺序和 CHW 维度顺序'''
-        img = np.ascontiguousarray(img)  # 将图像 img 转换为连续内存的数组。这是由于 PyTorch 要求输入的数据需要是连续内存的
-        img = torch.from_numpy(img).to(self.device)  # 将图像 img 转换为 PyTorch 张量，并将其移动到指定的设备（例如 GPU）上进行加速计算
-        img = img.float()  # 将图像数据类型转换为浮点型
-        img /= 255.0  # 将图像像素值归一化到 [0, 1] 的范围，通过除以 255.0 实现
+        with span('to_tensor', cuda=True):
+            img = np.ascontiguousarray(img)  # 将图像 img 转换为连续内存的数组。这是由于 PyTorch 要求输入的数据需要是连续内存的
+            img = torch.from_numpy(img).to(self.device)  # 将图像 img 转换为 PyTorch 张量，并将其移动到指定的设备（例如 GPU）上进行加速计算
+            img = img.float()  # 将图像数据类型转换为浮点型
+            img /= 255.0  # 将图像像素值归一化到 [0, 1] 的范围，通过除以 255.0 实现
         if img.ndimension() == 3:
             '''如果图像的维度为 3，表示没有批次维度
             那么通过 unsqueeze(0) 在最前面添加一个维度
@@ -92,30 +135,27 @@ class Detector:
 
         return img0, img, False
         
-    def check_similarity(self, img1, img2):
-        """检查两个图像的相似度"""
+    @staticmethod
+    def histogram(img):
+        """用于相似度判断的归一化灰度直方图，出错时返回 None"""
         try:
-            # 转换为灰度
-            gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-            
-            # 调整大小以加快计算
-            small1 = cv2.resize(gray1, (64, 64))  # 增大比较分辨率
-            small2 = cv2.resize(gray2, (64, 64))  # 增大比较分辨率
-            
-            # 计算直方图相似度
-            hist1 = cv2.calcHist([small1], [0], None, [16], [0, 256])  # 增加直方图bins
-            hist2 = cv2.calcHist([small2], [0], None, [16], [0, 256])  # 增加直方图bins
-            
-            # 归一化直方图
-            cv2.normalize(hist1, hist1, 0, 1, cv2.NORM_MINMAX)
-            cv2.normalize(hist2, hist2, 0, 1, cv2.NORM_MINMAX)
-            
-            # 计算相似度
-            similarity = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
-            return similarity
-        except:
+            # 转换为灰度并缩小以加快计算
+            small = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (64, 64))  # 增大比较分辨率
+            hist = cv2.calcHist([small], [0], None, [16], [0, 256])  # 增加直方图bins
+            cv2.normalize(hist, hist, 0, 1, cv2.NORM_MINMAX)
+            return hist
+        except cv2.error:
+            return None
+
+    @staticmethod
+    def compare_histograms(hist1, hist2):
+        if hist1 is None or hist2 is None:
             return 0  # 如果出错，返回0（不相似）
+        return cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
+
+    def check_similarity(self, img1, img2):
+        """检查两个图像的相似度"""
+        return self.compare_histograms(self.histogram(img1), self.histogram(img2))
 
     def detect(self, im):
         im0, img, can_reuse = self.preprocess(im)  # 调用 preprocess() 函数对输入图像进行预处理
@@ -132,19 +172,14 @@ class Detector:
         pred = None
         with torch.no_grad():  # 禁用梯度计算以减少内存使用
             try:
-                # 设置超时触发器（仅对CPU模式有效）
-                if self.device == 'cpu':
-                    # 使用较低的置信度阈值和IoU阈值，在CPU上的较低配置上也能工作
-                    temp_threshold = max(0.45, self.threshold - 0.1)  # 适度降低检测阈值
-                    temp_iou = 0.45  # 降低NMS的IoU阈值
-                else:
-                    temp_threshold = self.threshold
-                    temp_iou = 0.4
-                
+                temp_threshold, temp_iou = self.nms_thresholds()
+
                 # 执行推理
-                pred = self.m(img, augment=False)[0]  # 关闭augment以提高速度
-                pred = pred.float()
-                pred = non_max_suppression(pred, temp_threshold, temp_iou)
+                with span('yolo_forward', cuda=True):
+                    pred = self.m(img, augment=False)[0]  # 关闭augment以提高速度
+                    pred = pred.float()
+                with span('nms', cuda=True):
+                    pred = non_max_suppression(pred, temp_threshold, temp_iou)
                 
                 # 检查是否超时
                 if time.time() - start_time > max_inference_time:
@@ -166,26 +201,10 @@ class Detector:
                     return []
 
         boxes = []  # 创建一个空列表，用于存储检测到的目标框信息
-        for det in pred:  # 遍历模型输出中的每个检测结果
-
-            if det is not None and len(det):  # 检查检测结果是否为非空并且有检测到目标
-                '''对检测框的坐标进行缩放和转换
-                使其与原始图像的尺寸相匹配
-                scale_coords() 函数用于将检测框的坐标从模型输出的特征图坐标系转换为原始图像坐标系'''
-                det[:, :4] = scale_coords(
-                    img.shape[2:], det[:, :4], im0.shape).round()
-
-                # 遍历每个检测框的信息，包括坐标、置信度和类别标签
-                for *x, conf, cls_id in det:
-                    lbl = self.names[int(cls_id)]  # 根据类别标签的索引获取对应的类别名称
-                    if lbl not in ['person']:
-                        continue
-                    pass
-                    x1, y1 = int(x[0]), int(x[1])
-                    x2, y2 = int(x[2]), int(x[3])
-                    boxes.append(
-                        (x1, y1, x2, y2, lbl, conf))
-        
+        with span('parse_boxes'):
+            for det in pred:  # 遍历模型输出中的每个检测结果
+                boxes.extend(self.parse_detections(det, img.shape[2:], im0.shape))
+
         # 保存当前帧的检测结果以供下一帧可能复用
         self.last_features = boxes
         
@@ -194,3 +213,55 @@ class Detector:
             print(f"Detected {len(boxes)} persons")
         
         return boxes
+
+    def nms_thresholds(self):
+        """返回 NMS 使用的置信度阈值和 IoU 阈值"""
+        # 设置超时触发器（仅对CPU模式有效）
+        if self.device == 'cpu':
+            # 使用较低的置信度阈值和IoU阈值，在CPU上的较低配置上也能工作
+            return max(0.45, self.threshold - 0.1), 0.45  # 适度降低检测阈值，降低NMS的IoU阈值
+        return self.threshold, 0.4
+
+    def parse_detections(self, det, img_shape, im0_shape):
+        """把一张图像的 NMS 输出转换为原图坐标下的 person 检测框列表"""
+        boxes = []
+        if det is not None and len(det):  # 检查检测结果是否为非空并且有检测到目标
+            '''对检测框的坐标进行缩放和转换
+            使其与原始图像的尺寸相匹配
+            scale_coords() 函数用于将检测框的坐标从模型输出的特征图坐标系转换为原始图像坐标系'''
+            det[:, :4] = scale_coords(img_shape, det[:, :4], im0_shape).round()
+
+            # 遍历每个检测框的信息，包括坐标、置信度和类别标签
+            for *x, conf, cls_id in det:
+                lbl = self.names[int(cls_id)]  # 根据类别标签的索引获取对应的类别名称
+                if lbl not in ['person']:
+                    continue
+                x1, y1 = int(x[0]), int(x[1])
+                x2, y2 = int(x[2]), int(x[3])
+                boxes.append((x1, y1, x2, y2, lbl, conf))
+        return boxes
+
+    def detect_batch(self, images):
+        """多路图像合并为一个批次做一次前向推理，返回与 images 一一对应的检测框列表
+
+        批量模式不使用相邻帧复用，每路图像都进行完整检测。
+        """
+        if len(images) == 0:
+            return []
+        # 所有图像尺寸相同时使用矩形填充，否则统一填充为正方形以便堆叠
+        rect = len(set(im.shape for im in images)) == 1
+        with span('letterbox'):
+            batch = np.stack([letterbox(im, new_shape=self.img_size, auto=rect)[0] for im in images], 0)
+        with span('to_tensor', cuda=True):
+            batch = np.ascontiguousarray(batch[:, :, :, ::-1].transpose(0, 3, 1, 2))  # BGR 转 RGB，NHWC 转 NCHW
+            batch = torch.from_numpy(batch).to(self.device).float()
+            batch /= 255.0
+
+        temp_threshold, temp_iou = self.nms_thresholds()
+        with torch.no_grad():
+            with span('yolo_forward', cuda=True):
+                pred = self.m(batch, augment=False)[0].float()
+            with span('nms', cuda=True):
+                pred = non_max_suppression(pred, temp_threshold, temp_iou)
+
+        return [self.parse_detections(det, batch.shape[2:], im.shape) for det, im in zip(pred, images)]
@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+
+
+# 测速区域多边形，坐标基于 1280x720 的参考分辨率
+REFERENCE_WIDTH = 1280
+REFERENCE_HEIGHT = 720
+BLUE_GATE_POINTS = [[30, 474], [81, 475], [171, 430], [113, 431]]
+YELLOW_GATE_POINTS = [[1015, 475], [938, 434], [985, 433], [1087, 475]]
+
+
+class GateZones(object):
+    """蓝色（起点）和黄色（终点）测速区域
+
+    多边形按参考分辨率定义，构造时缩放到处理分辨率。
+    重叠检测使用预先膨胀过的掩码，一次查表即可完成，
+    与逐像素检查边界容差内所有点的结果一致。
+    """
+
+    def __init__(self, width, height, margin=5, blue_points=None, yellow_points=None):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        scale_x = width / float(REFERENCE_WIDTH)
+        scale_y = height / float(REFERENCE_HEIGHT)
+
+        self.blue_points = np.array([[int(x * scale_x), int(y * scale_y)]
+                                     for x, y in (blue_points or BLUE_GATE_POINTS)], np.int32)
+        self.yellow_points = np.array([[int(x * scale_x), int(y * scale_y)]
+                                       for x, y in (yellow_points or YELLOW_GATE_POINTS)], np.int32)
+
+        self.blue_mask = cv2.fillPoly(np.zeros((height, width), dtype=np.uint8), [self.blue_points], color=1)
+        self.yellow_mask = cv2.fillPoly(np.zeros((height, width), dtype=np.uint8), [self.yellow_points], color=1)
+
+        # 按容差膨胀掩码，等价于检查点周围 (2*margin+1)^2 的邻域
+        if margin > 0:
+            kernel = np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8)
+            self._blue_hit = cv2.dilate(self.blue_mask, kernel)
+            self._yellow_hit = cv2.dilate(self.yellow_mask, kernel)
+        else:
+            self._blue_hit = self.blue_mask
+            self._yellow_hit = self.yellow_mask
+
+    def color_image(self):
+        """生成用于可视化的彩色多边形图像（BGR）"""
+        image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        image[self.blue_mask == 1] = (255, 0, 0)
+        image[self.yellow_mask == 1] = (0, 255, 255)
+        return image
+
+    def overlap(self, x1, y1, x2, y2):
+        """检查边界框四个角点和中心点是否与蓝色或黄色区域重叠
+
+        Returns:
+            (blue_overlap, yellow_overlap)
+        """
+        check_points = [
+            (x1, y1),  # 左上
+            (x2, y1),  # 右上
+            (x1, y2),  # 左下
+            (x2, y2),  # 右下
+            ((x1 + x2) // 2, (y1 + y2) // 2)  # 中心点
+        ]
+        blue_overlap = False
+        yellow_overlap = False
+        for px, py in check_points:
+            px, py = int(px), int(py)
+            if 0 <= py < self.height and 0 <= px < self.width:
+                if self._blue_hit[py, px]:
+                    blue_overlap = True
+                if self._yellow_hit[py, px]:
+                    yellow_overlap = True
+        return blue_overlap, yellow_overlap
+
+    def near(self, x1, y1, x2, y2, expand=1.0):
+        """粗略判断目标是否接近测速区域
+
+        把边界框在水平方向按自身宽度的 expand 倍扩展后检查整个矩形区域，
+        用于稀疏采样的粗扫描，避免两次采样之间目标越过区域而漏检。
+
+        Returns:
+            (blue_near, yellow_near)
+        """
+        pad = int((x2 - x1) * expand)
+        x1, x2 = max(int(x1) - pad, 0), min(int(x2) + pad + 1, self.width)
+        y1, y2 = max(int(y1), 0), min(int(y2) + 1, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return False, False
+        return bool(self._blue_hit[y1:y2, x1:x2].any()), bool(self._yellow_hit[y1:y2, x1:x2].any())
+
+
+class GateCounter(object):
+    """根据跟踪结果记录过线事件并计算速度
+
+    frame_index 使用视频中的绝对帧号，速度 = 距离 * fps / 帧数差。
+    """
+
+    def __init__(self, zones, fps, distance=4.0):
+        self.zones = zones
+        self.fps = fps
+        self.distance = distance
+        self.blue_ids = []
+        self.yellow_ids = []
+        self.count = 0
+        self.start = 0
+        self.ending = 0
+        self.speed = 0
+        # 本帧每个跟踪框的区域状态位（与 deep_sort.utils.track_log 的 GATE_* 一致）：
+        # 1 在蓝色区域，2 在黄色区域，4 首次进入蓝色区域，8 首次进入黄色区域
+        self.states = []
+
+    def update(self, frame_index, list_bboxs):
+        """处理一帧的跟踪结果，返回本帧新产生的过线事件 [(gate, track_id, frame_index), ...]"""
+        events = []
+        self.states = []
+        for x1, y1, x2, y2, label, track_id in list_bboxs:
+            blue_overlap, yellow_overlap = self.zones.overlap(x1, y1, x2, y2)
+            state = (1 if blue_overlap else 0) | (2 if yellow_overlap else 0)
+
+            # 如果检测到蓝色区域重叠
+            if blue_overlap and track_id not in self.blue_ids:
+                self.count += 1
+                self.blue_ids.append(track_id)
+                self.start = frame_index
+                events.append(('blue', track_id, frame_index))
+                state |= 4
+
+            # 如果检测到黄色区域重叠
+            if yellow_overlap and track_id not in self.yellow_ids:
+                self.count += 1
+                self.ending = frame_index
+                self.yellow_ids.append(track_id)
+                events.append(('yellow', track_id, frame_index))
+                state |= 8
+            self.states.append(state)
+
+        if self.frames > 0:
+            self.speed = round(self.distance * self.fps / self.frames, 2)
+        return events
+
+    @property
+    def frames(self):
+        """起点到终点之间的帧数"""
+        return self.ending - self.start
+
+    @property
+    def elapsed(self):
+        """起点到终点之间的时间（秒）"""
+        return self.frames / self.fps if self.fps else 0.0
+
+    @property
+    def complete(self):
+        """是否已完成一次完整的测速（蓝、黄区域均有目标通过）"""
+        return self.frames > 0 and self.count >= 2 and len(self.blue_ids) > 0 and len(self.yellow_ids) > 0
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+
+from utils.cache import cache_path, config_hash, file_hash
+
+NUM_LANDMARKS = 33  # MediaPipe Pose 关键点数量
+
+
+def interpolate_landmarks(landmarks, max_gap):
+    """对关键点数组 (帧数, 33, 4) 中未检测到的帧做线性插值
+
+    只填补前后两侧都有关键点、且两侧帧号相差不超过 max_gap 的帧，更长的空缺（人不在画面中）保持 NaN。
+    """
+    landmarks = np.array(landmarks, dtype=np.float32)
+    valid = ~np.isnan(landmarks[:, 0, 0])
+    if valid.sum() < 2:
+        return landmarks
+    index = np.arange(len(landmarks))
+    before = np.maximum.accumulate(np.where(valid, index, -1))
+    after = np.minimum.accumulate(np.where(valid, index, len(landmarks))[::-1])[::-1]
+    fill = ~valid & (before >= 0) & (after < len(landmarks)) & (after - before <= max_gap)
+    if fill.any():
+        b, a = before[fill], after[fill]
+        t = ((index[fill] - b) / (a - b)).astype(np.float32)[:, None, None]
+        landmarks[fill] = landmarks[b] + (landmarks[a] - landmarks[b]) * t
+    return landmarks
+
+
+class LandmarkRecorder(object):
+    """逐帧收集 MediaPipe 关键点，未检测到人体的帧记为 NaN"""
+
+    def __init__(self, frame_count=0):
+        self.rows = np.full((max(int(frame_count), 1), NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        self.count = 0
+
+    def add(self, pose_landmarks, crop=None):
+        """记录一帧的关键点，返回该帧的 (33, 4) 数组，未检测到人体时返回 None
+
+        crop 为姿态估计所用裁剪区域在整帧中的归一化位置 (x, y, 宽, 高)，关键点换算回整帧的归一化坐标。
+        """
+        if self.count >= len(self.rows):  # 容器中记录的帧数可能偏少
+            self.rows = np.concatenate([self.rows, np.full_like(self.rows, np.nan)])
+        row = None
+        if pose_landmarks is not None:
+            row = self.rows[self.count]
+            row[:] = [(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark]
+            if crop is not None:
+                x, y, w, h = crop
+                row[:, 0] = x + row[:, 0] * w
+                row[:, 1] = y + row[:, 1] * h
+                row[:, 2] *= w  # z 与 x 使用相同的比例
+        self.count += 1
+        return row
+
+    def skip(self, count):
+        """跳过 count 帧（未进行姿态估计的帧，记为 NaN）"""
+        while self.count + count > len(self.rows):
+            self.rows = np.concatenate([self.rows, np.full_like(self.rows, np.nan)])
+        self.count += count
+
+    def landmarks(self):
+        return self.rows[:self.count]
+
+
+class LandmarkStore(object):
+    """按视频内容哈希和姿态估计参数持久化每帧的关键点
+
+    每个视频保存为一个 float32 的 .npy 数组，形状为 (帧数, 33, 4)，依次为 x、y、z、visibility，
+    读取时以内存映射方式打开，只有实际访问的帧才会从磁盘读入。
+    """
+
+    def __init__(self, kind='landmarks'):
+        self.kind = kind
+
+    def key(self, video_path, config):
+        return f'{file_hash(video_path)}_{config_hash(config)}'
+
+    def load(self, key):
+        path = cache_path(self.kind, key, '.npy')
+        meta_path = cache_path(self.kind, key, '.json')
+        if not (path.is_file() and meta_path.is_file()):
+            return None, None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            return np.load(path, mmap_mode='r'), meta
+        except Exception as e:
+            print(f"读取关键点缓存失败: {e}")
+            return None, None
+
+    def save(self, key, landmarks, meta):
+        path = cache_path(self.kind, key, '.npy')
+        tmp = path.with_suffix('.tmp.npy')
+        np.save(tmp, np.ascontiguousarray(landmarks, dtype=np.float32))
+        os.replace(tmp, path)
+        # 元数据最后写入，存在元数据即表示关键点文件完整
+        with open(cache_path(self.kind, key, '.json'), 'w') as f:
+            json.dump(meta, f)
+        return path
@@ -1,12 +1,40 @@
+import time
+start_time = time.perf_counter()
+
 import sys
 import cv2
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QFileDialog,
                              QMessageBox, QProgressBar)
+from model_registry import REGISTRY
 from ui import MainWindow
 
+# 窗口显示后在后台导入的模块和加载的模型，界面启动时不导入 torch、mediapipe 等重量级依赖
+WARM_UP_MODULES = ['torch', 'mediapipe', 'speed_measure', 'posture']
+WARM_UP_MODELS = ['detector', 'reid', 'pose']
+
+
+def warm_up():
+    warm_up_start = time.perf_counter()
+
+    def report():
+        from posture import preload_regressors
+        preload_regressors()
+        print(f"后台预热完成，用时 {time.perf_counter() - warm_up_start:.2f}s")
+        for module, seconds in REGISTRY.import_times.items():
+            print(f"  导入 {module}: {seconds:.2f}s")
+        for label, seconds in REGISTRY.timings.items():
+            print(f"  加载模型 {label}: {sum(seconds):.2f}s")
+
+    REGISTRY.preload(WARM_UP_MODELS, modules=WARM_UP_MODULES, after=report)
+
+
 if __name__ == "__main__":  
     app = QApplication(sys.argv)
     window = MainWindow()
     window.resize(1280, 720)
     window.show()
+    print(f"窗口显示用时 {time.perf_counter() - start_time:.2f}s")
+    # 事件循环开始、窗口绘制完成后再开始预热
+    QTimer.singleShot(0, warm_up)
     sys.exit(app.exec_())       
@@ -0,0 +1,158 @@
+import importlib
+import inspect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def load_detector():
+    from detector import Detector
+    return Detector()  # 构造时加载权重并预热
+
+
+def load_reid():
+    import tracker
+    extractor = tracker.create_extractor()
+    extractor([np.zeros((128, 64, 3), dtype=np.uint8)])  # 预热
+    return extractor
+
+
+def load_pose(min_detection_confidence=0.5, min_tracking_confidence=0.5, model_complexity=1):
+    import mediapipe as mp
+    pose = mp.solutions.pose.Pose(min_detection_confidence=min_detection_confidence,
+                                  min_tracking_confidence=min_tracking_confidence, model_complexity=model_complexity)
+    pose.process(np.zeros((256, 256, 3), dtype=np.uint8))  # 预热，首帧会初始化计算图
+    return pose
+
+
+class ModelRegistry(object):
+    """进程内共享的模型
+
+    每个模型（及其参数组合）只加载一次，之后在各线程、各视频之间复用，切换视频不再重新加载。
+    - lease(name)：独占地借用一个实例，用于带有逐帧状态的模型（检测器的相邻帧复用、MediaPipe 的跟踪状态），
+      实例都在使用中时，未达到 max_replicas 则再加载一个副本，否则等待归还；
+    - get(name)：返回共享实例，用于无状态的模型（ReID 特征提取）；
+    - preload(names)：在后台线程中提前加载并预热，界面启动时调用，选择文件时无需等待。
+
+    同一模型正在加载时，其他线程等待加载完成而不会重复加载。
+    """
+
+    def __init__(self):
+        self.loaders = {}
+        self.max_replicas = {}
+        self.timings = {}  # 模型 -> [每个副本的加载用时（秒）, ...]
+        self.import_times = {}  # 后台预热导入的模块 -> 导入用时（秒）
+        self._idle = defaultdict(list)
+        self._count = defaultdict(int)
+        self._cond = threading.Condition()
+
+    def register(self, name, loader, max_replicas=1):
+        self.loaders[name] = loader
+        self.max_replicas[name] = max_replicas
+
+    def _key(self, name, kwargs):
+        # 补全加载函数的默认参数，get('pose') 与显式传入默认值的调用得到同一个实例
+        bound = inspect.signature(self.loaders[name]).bind(**kwargs)
+        bound.apply_defaults()
+        return (name,) + tuple(sorted(bound.arguments.items()))
+
+    def acquire(self, name, **kwargs):
+        """独占地取得一个实例，用完后调用 release() 归还"""
+        key = self._key(name, kwargs)
+        with self._cond:
+            while True:
+                if self._idle[key]:
+                    return self._idle[key].pop()
+                if self._count[key] < self.max_replicas[name]:
+                    self._count[key] += 1
+                    break
+                self._cond.wait()
+        try:
+            start = time.perf_counter()
+            model = self.loaders[name](**kwargs)
+            seconds = round(time.perf_counter() - start, 3)
+        except Exception:
+            with self._cond:
+                self._count[key] -= 1
+                self._cond.notify_all()
+            raise
+        label = name if not kwargs else f"{name}{kwargs}"
+        self.timings.setdefault(label, []).append(seconds)
+        print(f"模型 {label} 加载完成，用时 {seconds:.2f}s")
+        return model
+
+    def release(self, name, model, **kwargs):
+        with self._cond:
+            self._idle[self._key(name, kwargs)].append(model)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, name, **kwargs):
+        model = self.acquire(name, **kwargs)
+        try:
+            yield model
+        finally:
+            self.release(name, model, **kwargs)
+
+    def get(self, name, **kwargs):
+        """共享实例，不独占，适用于无状态、可并发调用的模型"""
+        model = self.acquire(name, **kwargs)
+        self.release(name, model, **kwargs)
+        return model
+
+    def import_modules(self, modules):
+        """导入模块并记录用时，已导入的模块不重复计时"""
+        for module in modules:
+            start = time.perf_counter()
+            importlib.import_module(module)
+            self.import_times.setdefault(module, round(time.perf_counter() - start, 3))
+
+    def preload(self, names, background=True, modules=(), after=None):
+        """加载并预热指定的模型
+
+        background=True 时在后台线程中进行并立即返回该线程，加载失败只打印错误（使用时会再次尝试加载）；
+        否则在当前线程中加载，失败时抛出异常。modules 为先行导入的模块（如 torch、mediapipe），
+        after 为全部完成后调用的函数（如加载回归模型）。
+        """
+        if not background:
+            self.import_modules(modules)
+            for name in names:
+                self.get(name)
+            if after:
+                after()
+            return None
+
+        def run():
+            try:
+                self.import_modules(modules)
+            except Exception as e:
+                print(f"预加载模块失败: {e}")
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"预加载模型 {name} 失败: {e}")
+            if after:
+                try:
+                    after()
+                except Exception as e:
+                    print(f"预加载失败: {e}")
+
+        thread = threading.Thread(target=run, daemon=True, name='model-preload')
+        thread.start()
+        return thread
+
+    def report(self):
+        report = {label: {'replicas': len(seconds), 'load_seconds': seconds} for label, seconds in self.timings.items()}
+        if self.import_times:
+            report['imports'] = dict(self.import_times)
+        return report
+
+
+REGISTRY = ModelRegistry()
+REGISTRY.register('detector', load_detector)
+REGISTRY.register('reid', load_reid)
+REGISTRY.register('pose', load_pose, max_replicas=4)  # 多名运动员各用一个实例并行估计
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+
+from deep_sort.utils.track_log import TrackLogWriter
+from gate import GateZones, GateCounter
+from model_registry import REGISTRY
+from utils.frame_source import FrameSource
+
+
+class CameraStream(object):
+    """一路摄像头：预读帧源、独立的跟踪会话和本路画面中的测速区域
+
+    gate_distances 把区域颜色映射到跑道上的位置（米），如 {'blue': 0.0, 'yellow': 4.0}，
+    未配置距离的区域不产生计时事件。
+    """
+
+    def __init__(self, name, source, gate_distances, offset=0.0, live=None, process_size=(960, 540),
+                 blue_points=None, yellow_points=None, clock_start=None, overlap_margin=5, tracker=None):
+        if isinstance(source, str) and source.isnumeric():
+            source = int(source)  # 摄像头编号
+        if live is None:
+            live = not (isinstance(source, str) and os.path.isfile(source))
+        self.name = name
+        self.offset = offset
+        self.gate_distances = gate_distances
+        self.process_size = process_size
+        # 实时流只保留最新的几帧，处理跟不上时丢弃旧帧；本地文件则完整读取
+        self.source = FrameSource(source, buffer_size=4 if live else 32, resize=process_size, live=live,
+                                  clock_start=clock_start)
+        if tracker is None:
+            from tracker import TrackerSession  # 按需导入，只用 SplitTimer 时不必加载 torch
+            tracker = TrackerSession()
+        self.tracker = tracker
+        zones = GateZones(process_size[0], process_size[1], margin=overlap_margin,
+                          blue_points=blue_points, yellow_points=yellow_points)
+        self.counter = GateCounter(zones, self.source.fps)
+        self.finished = False
+        self.stalled = False  # 上一次读取超时，之后只取已到达的帧，不再等待
+        self.track_log = None
+
+    def open_track_log(self, folder):
+        """把本路每帧的跟踪框和区域状态写入 folder/<name>.trk，长时间录制也不会在内存中累积"""
+        meta = {'camera': self.name, 'source': str(self.source.source), 'fps': self.source.fps,
+                'width': self.process_size[0], 'height': self.process_size[1], 'offset': self.offset}
+        self.track_log = TrackLogWriter(os.path.join(folder, f'{self.name}.trk'), meta=meta)
+
+    def release(self):
+        self.source.release()
+        if self.track_log is not None:
+            self.track_log.close()
+
+
+class SplitTimer(object):
+    """按统一时钟合并各摄像头的过线事件，计算分段用时和速度"""
+
+    def __init__(self):
+        self.events = []  # (时间, 距离, 摄像头, 区域颜色, 跟踪ID)
+
+    def add(self, event_time, distance, camera, gate, track_id):
+        self.events.append((event_time, distance, camera, gate, track_id))
+
+    def crossings(self):
+        """每个距离标记取最早的有效过线时间，要求过线时间随距离递增
+
+        Returns:
+            [(距离, 时间), ...]，按距离升序
+        """
+        result = []
+        last_time = None
+        for distance in sorted(set(e[1] for e in self.events)):
+            times = [e[0] for e in self.events if e[1] == distance and (last_time is None or e[0] > last_time)]
+            if not times:
+                continue
+            last_time = min(times)
+            result.append((distance, last_time))
+        return result
+
+    def splits(self):
+        """相邻距离标记之间的分段用时和平均速度"""
+        crossings = self.crossings()
+        splits = []
+        for (d0, t0), (d1, t1) in zip(crossings, crossings[1:]):
+            splits.append({'from': d0, 'to': d1, 'time': round(t1 - t0, 3), 'speed': round((d1 - d0) / (t1 - t0), 2)})
+        return splits
+
+    def summary(self):
+        crossings = self.crossings()
+        result = {'crossings': [{'distance': d, 'time': round(t, 3)} for d, t in crossings],
+                  'splits': self.splits(), 'distance': 0.0, 'time': 0.0, 'speed': 0.0}
+        if len(crossings) >= 2:
+            (d0, t0), (d1, t1) = crossings[0], crossings[-1]
+            result.update(distance=d1 - d0, time=round(t1 - t0, 3), speed=round((d1 - d0) / (t1 - t0), 2))
+        return result
+
+
+class MultiCameraSession(object):
+    """多路摄像头测速：所有视频流共享一个批量检测器，每路有独立的跟踪会话，过线事件在统一时钟上合并"""
+
+    def __init__(self, cameras, detector=None, on_frame=None, read_timeout=0.2):
+        self.cameras = cameras
+        self.detector = detector or REGISTRY.get('detector')  # 批量检测不使用相邻帧复用，可与其他线程共享
+        self.read_timeout = read_timeout  # 每路等待新帧的最长秒数，卡住的视频流不会阻塞其他视频流
+        self.timer = SplitTimer()
+        self.on_frame = on_frame  # 可选回调 on_frame(camera, frame, list_bboxs)，用于预览
+        self._is_running = True
+
+    def step(self):
+        """从每路摄像头各取一帧，一次批量检测后分别跟踪和判断过线。所有视频流都结束时返回 False
+
+        读取超时的视频流本次跳过；超时后只要还有其他正常的视频流，该路就不再等待，直到再次读到帧。
+        """
+        streams, frames = [], []
+        healthy = any(not camera.finished and not camera.stalled for camera in self.cameras)
+        for camera in self.cameras:
+            if camera.finished:
+                continue
+            frame = camera.source.read(timeout=0 if camera.stalled and healthy else self.read_timeout)
+            if frame is None:
+                if camera.source.exhausted:
+                    camera.finished = True
+                elif not camera.stalled:
+                    camera.stalled = True
+                    print(f"[{camera.name}] 读取超时，暂时跳过该路")
+                continue
+            camera.stalled = False
+            streams.append(camera)
+            frames.append(frame)
+        if not frames:
+            return not all(camera.finished for camera in self.cameras)
+
+        detections = self.detector.detect_batch([frame.image for frame in frames])
+        for camera, frame, bboxes in zip(streams, frames, detections):
+            list_bboxs = camera.tracker.update(bboxes, frame.image) if len(bboxes) > 0 else []
+            gate_events = camera.counter.update(frame.index, list_bboxs)
+            if camera.track_log is not None:
+                confs = camera.tracker.confidences() if list_bboxs else None
+                camera.track_log.add(frame.index, list_bboxs, confs=confs, gates=camera.counter.states)
+            for gate, track_id, index in gate_events:
+                distance = camera.gate_distances.get(gate)
+                if distance is None:
+                    continue
+                event_time = frame.timestamp + camera.offset
+                self.timer.add(event_time, distance, camera.name, gate, track_id)
+                print(f"[{camera.name}] ID: {track_id} 通过{gate}区域（{distance:g} 米），帧: {index}, 时间: {event_time:.3f}s")
+            if self.on_frame is not None:
+                self.on_frame(camera, frame, list_bboxs)
+        return True
+
+    def complete(self):
+        """所有配置的距离标记都已有人通过"""
+        distances = set(d for camera in self.cameras for d in camera.gate_distances.values())
+        return distances <= set(d for d, t in self.timer.crossings())
+
+    def run(self, stop_when_complete=True):
+        try:
+            while self._is_running and self.step():
+                if stop_when_complete and self.complete():
+                    print("所有测速区域均已通过，停止处理")
+                    break
+        finally:
+            self.release()
+        return self.timer.summary()
+
+    def stop(self):
+        self._is_running = False
+
+    def release(self):
+        for camera in self.cameras:
+            camera.release()
+
+
+def build_cameras(cfg, clock_start=None):
+    """根据配置文件创建各路摄像头"""
+    cameras = []
+    for i, cam in enumerate(cfg.CAMERAS):
+        gate_distances, points = {}, {}
+        for gate in cam.GATES:
+            gate_distances[gate.COLOR] = float(gate.DISTANCE)
+            points[gate.COLOR] = gate.get('POINTS')
+        cameras.append(CameraStream(cam.get('NAME', f'camera{i}'), str(cam.SOURCE), gate_distances,
+                                    offset=float(cam.get('OFFSET', 0.0)), live=cam.get('LIVE'),
+                                    blue_points=points.get('blue'), yellow_points=points.get('yellow'),
+                                    clock_start=clock_start))
+    return cameras
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='多摄像头分段测速')
+    parser.add_argument('--config', type=str, default='configs/multi_camera.yaml', help='摄像头配置文件')
+    parser.add_argument('--output', type=str, default='', help='把测速结果保存为 JSON 文件')
+    parser.add_argument('--no-stop', action='store_true', help='所有区域通过后继续处理，直到视频流结束')
+    parser.add_argument('--track-log', type=str, default='', help='把各路跟踪结果写入该目录下的 <摄像头名>.trk')
+    opt = parser.parse_args()
+
+    from deep_sort.utils.parser import get_config
+
+    cfg = get_config()
+    cfg.merge_from_file(opt.config)
+    cameras = build_cameras(cfg, clock_start=time.perf_counter())
+    if opt.track_log:
+        os.makedirs(opt.track_log, exist_ok=True)
+        for camera in cameras:
+            camera.open_track_log(opt.track_log)
+    session = MultiCameraSession(cameras)
+    summary = session.run(stop_when_complete=not opt.no_stop)
+
+    for split in summary['splits']:
+        print(f"{split['from']:g}-{split['to']:g} 米: {split['time']:.3f} 秒, {split['speed']} m/s")
+    print(f"总距离 {summary['distance']:g} 米, 用时 {summary['time']:.3f} 秒, 平均速度 {summary['speed']} m/s")
+    if opt.output:
+        with open(opt.output, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -1,14 +1,26 @@
 import glob
-from tkinter import filedialog
-import mediapipe as mp
+import hashlib
 import cv2
 import os
 import math
 import numpy as np
-from PyQt5.QtGui import QImage
-from joblib import load
-import pandas as pd
 import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from landmark_cache import LandmarkRecorder, LandmarkStore, interpolate_landmarks
+from model_registry import REGISTRY
+from preview import convert_cv_to_qt
+from result_record import SCORE_RECORD, result_folder, save_record, score_record
+from results_db import save_history
+from utils.frame_source import FrameSource
+from utils.profiler import span
+from utils.video_writer import AsyncVideoWriter
+
+POSTURE_TYPES = ('take_off', 'hip_extension', 'abdominal_contraction')
+# 由 export_regressors() 从三个 .joblib 线性回归模型转换的系数，评分时只需 NumPy，不导入 scikit-learn
+REGRESSOR_FILE = 'regressors.npz'
 
 
 def back_to_origin(points, image_shape):
@@ -29,12 +41,91 @@ def read_points_from_file(filename):
     return points
 
 
+@lru_cache(maxsize=None)
+def _load_regressor(model_name, mtime):
+    # 以文件修改时间作为缓存键的一部分，替换回归模型文件后自动重新加载
+    from joblib import load  # 只有没有转换的系数时才导入 joblib/scikit-learn
+    return load(model_name)
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def export_regressors(path=REGRESSOR_FILE):
+    """把三个姿态的 .joblib 线性回归模型转换为系数数组，保存到一个 .npz 文件
+
+    更新回归模型后运行一次（需要 joblib 和 scikit-learn）。同时记录每个 .joblib 文件的摘要，
+    .joblib 被替换而没有重新转换时，该姿态回退到加载 .joblib。
+    """
+    arrays = {}
+    for posture_type in POSTURE_TYPES:
+        model_name = posture_type + ".joblib"
+        model = _load_regressor(model_name, os.path.getmtime(model_name))
+        if not (hasattr(model, 'coef_') and hasattr(model, 'intercept_')):
+            raise TypeError(f"{model_name} 不是线性回归模型，无法转换: {type(model).__name__}")
+        arrays[posture_type + '_coef'] = np.asarray(model.coef_, dtype=np.float64).reshape(-1)
+        arrays[posture_type + '_intercept'] = np.float64(np.ravel(model.intercept_)[0])
+        arrays[posture_type + '_source'] = np.array(_file_digest(model_name))
+    np.savez(path, **arrays)
+    print(f"回归模型系数已保存: {path}")
+    return path
+
+
+@lru_cache(maxsize=None)
+def _load_coefficients(path, mtimes):
+    # mtimes 为 .npz 和各 .joblib 的修改时间，任一文件变化后重新加载和校验
+    coefficients = {}
+    with np.load(path) as data:
+        for posture_type in POSTURE_TYPES:
+            if posture_type + '_coef' not in data:
+                continue
+            model_name = posture_type + ".joblib"
+            if os.path.isfile(model_name) and str(data[posture_type + '_source']) != _file_digest(model_name):
+                print(f"{model_name} 已更新但没有重新转换，使用 .joblib 模型（运行 python posture.py --export-regressors）")
+                continue
+            coefficients[posture_type] = (data[posture_type + '_coef'].copy(), float(data[posture_type + '_intercept']))
+    return coefficients
+
+
+def load_regressors():
+    """{姿态类型: (系数数组, 截距)}，没有 .npz 文件或其中缺少的姿态不在其中（使用 .joblib 模型）"""
+    if not os.path.isfile(REGRESSOR_FILE):
+        return {}
+    mtimes = tuple(os.path.getmtime(name) if os.path.isfile(name) else None
+                   for name in (REGRESSOR_FILE,) + tuple(t + ".joblib" for t in POSTURE_TYPES))
+    return _load_coefficients(REGRESSOR_FILE, mtimes)
+
+
+def preload_regressors():
+    """提前加载三个姿态的回归模型（后台预热时调用）"""
+    coefficients = load_regressors()
+    for model_str in POSTURE_TYPES:
+        if model_str not in coefficients:
+            model_name = model_str + ".joblib"
+            _load_regressor(model_name, os.path.getmtime(model_name))
+
+
+def score_many(posture, angles_matrix):
+    """批量评分，返回回归模型的原始输出 (行数,)
+
+    Args:
+        posture: 姿态类型，POSTURE_TYPES 之一
+        angles_matrix: (行数, 3) 的起跳角度，如评分记录中保存的 angles
+    """
+    angles = np.asarray(angles_matrix, dtype=np.float64)
+    angles = angles.reshape(-1, angles.shape[-1]) if angles.size else angles.reshape(0, 3)
+    coefficients = load_regressors().get(posture)
+    if coefficients is not None:
+        coef, intercept = coefficients
+        return angles @ coef + intercept
+    model_name = posture + ".joblib"
+    return _load_regressor(model_name, os.path.getmtime(model_name)).predict(angles)
+
+
 def get_Scoring(model_str, angles):
-    model_name = model_str + ".joblib"
-    data = np.array(angles).reshape(1, -1)
-    model = load(model_name)
-    score = model.predict(data)
-    return score
+    return score_many(model_str, np.reshape(angles, (1, -1)))
 
 
 def calculate_angle(A, B, C):
@@ -87,13 +178,76 @@ def calculate_take_off_angles(points):
     return angles
 
 
+@lru_cache(maxsize=None)
+def _standard_angles(filename, mtime):
+    return tuple(calculate_take_off_angles(read_points_from_file(filename)))
+
+
+def load_standard_angles(posture_type):
+    """标准姿态角向量，每个文件只读取一次，修改标准姿态文件后自动重新读取"""
+    filename = posture_type + '.txt'
+    return list(_standard_angles(filename, os.path.getmtime(filename)))
+
+
+def calculate_take_off_angles_batch(landmarks):
+    """对关键点数组 (帧数, 33, 4) 一次性计算每帧的 calculate_take_off_angles
+
+    Returns:
+        (帧数, 3) 的角度数组，未检测到人体的帧为 NaN
+    """
+    xy = np.asarray(landmarks, dtype=np.float64)[:, :, :2]
+    shoulder_l, hip_l, hip_r = xy[:, 11], xy[:, 23], xy[:, 24]
+    knee_l, knee_r, ankle_r = xy[:, 25], xy[:, 26], xy[:, 28]
+
+    def angle(A, B, C):
+        AB, BC = B - A, C - B
+        cos = (AB * BC).sum(1) / (np.linalg.norm(AB, axis=1) * np.linalg.norm(BC, axis=1))
+        degrees = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+        return np.where(np.abs(degrees) < 1e-6, 0.0, degrees)
+
+    # 与 construct_point 重构后的编号对应：3 左肩，9/10 左/右髋，11/12 左/右膝，14 右踝
+    theta1 = angle(hip_l, knee_l, shoulder_l)
+    theta2 = angle(knee_r, hip_r, hip_r + [1.0, 0.0])
+    theta3 = angle(hip_r, knee_r, ankle_r)
+    return np.stack([theta1, theta2, theta3], axis=1)
+
+
+def calculate_distance_batch(angles, posture_type, weights, threshold):
+    """对每帧的角度向量一次性计算与标准姿态的距离，规则与 calculate_distance 相同
+
+    Returns:
+        (帧数,) 的距离数组，未检测到人体的帧为 inf
+    """
+    q = np.asarray(load_standard_angles(posture_type))
+    d = np.sqrt((((angles - q) ** 2) * np.asarray(weights, dtype=np.float64)).sum(1))
+    cosine_distance = angles @ q / (np.linalg.norm(angles, axis=1) * np.linalg.norm(q))
+    d = np.where(d < threshold, 0.7 * d + 0.3 * (1 - cosine_distance), d)
+    return np.where(np.isnan(d), np.inf, d)
+
+
+def jump_peak(hip_y, torso, min_rise):
+    """在髋部高度序列（归一化 y，向下为正，未检测到为 NaN）中找到腾空最高点的下标
+
+    以助跑时髋部高度的中位数为基准，升高量除以躯干长度的中位数，与拍摄距离无关；
+    最大升高量小于 min_rise 时认为没有腾空，返回 None。
+    """
+    valid = ~np.isnan(hip_y)
+    if valid.sum() < 3:
+        return None
+    scale = np.nanmedian(torso)
+    if not scale > 0:
+        return None
+    rise = (np.nanmedian(hip_y) - hip_y) / scale
+    rise[~valid] = -np.inf
+    peak = int(np.argmax(rise))
+    return peak if rise[peak] >= min_rise else None
+
+
 def calculate_distance(test_points, posture_type, weights, threshold):
     # 权重自设
     if posture_type and posture_type != '':
-        filename = posture_type + '.txt'
-        standard_points = read_points_from_file(filename)
         p = calculate_take_off_angles(test_points)  # 测试姿态角向量合集
-        q = calculate_take_off_angles(standard_points)  # 标准姿态角向量合集
+        q = load_standard_angles(posture_type)  # 标准姿态角向量合集
 
         # 计算加权余弦距离
         d = math.sqrt(sum((x - y) ** 2 * w for x, y, w in zip(p, q, weights)))
@@ -111,15 +265,28 @@ def calculate_distance(test_points, posture_type, weights, threshold):
         return d, p
 
 
-def plot_construct_point(image, points, color=(0, 0, 255)):
+def frame_ranges(frames):
+    """把帧号合并为连续的区间 [(起始帧, 结束帧（不含）), ...]"""
+    ranges = []
+    for i in sorted(frames):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return [tuple(r) for r in ranges]
+
+
+def plot_construct_point(image, points, color=(0, 0, 255), copy=True):
     if points != []:
-        image = np.ascontiguousarray(np.copy(image))
+        if copy:
+            image = np.ascontiguousarray(np.copy(image))
         """将点数组画成人体结构
 
         Args:
             image (_type_): _description_
             points (_type_): _description_
             color (tuple, optional): _description_. Defaults to (0, 0, 255).
+            copy (bool, optional): 为 False 时直接画在 image 上（image 须为连续数组）。Defaults to True.
 
         Returns:
             image: _description_
@@ -191,7 +358,16 @@ def construct_point(landmarks):
     return points
 
 
+def construct_point_array(row):
+    """与 construct_point 相同，输入为关键点数组中的一帧 (33, 4)"""
+    construct_num = [11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32]
+    xy = np.asarray(row, dtype=np.float64)[:, :2]
+    points = [xy[0], (xy[11] + xy[12]) / 2, (xy[23] + xy[24]) / 2] + [xy[i] for i in construct_num]
+    return [[float(x), float(y)] for x, y in points]
+
+
 def select_video():
+    from tkinter import filedialog
     video_path = filedialog.askopenfilename(filetypes=[("Video Files", "*.mp4;*.avi")])
     if video_path:
         print("Selected video:", video_path)
@@ -203,161 +379,495 @@ def select_video():
 
 class Posture(object):
     def __init__(self):
-        self.mp_pose = mp.solutions.pose
         self.min_dconf = 0.5
         self.min_tconf = 0.5
         self.weight = [0.3, 0.5, 0.2]
         self.threshold = 1
+        # 运动员裁剪模式：用 YOLO 检测和 DeepSort 跟踪确定运动员，只把其周围固定尺寸的区域送入 MediaPipe，
+        # 推理耗时与视频分辨率无关，也不会锁定到画面中的其他人；max_athletes > 1 时并行评分多名运动员
+        self.athlete_crop = False
+        self.crop_size = 256
+        self.crop_margin = 0.25
+        self.max_athletes = 1
+        self.process_size = (960, 540)  # 检测和跟踪使用的分辨率
+        self.extra_athletes = []  # 最近一次裁剪模式评分中主要运动员以外的 [(跟踪 ID, 关键点数组), ...]
+        # 起跳阶段窗口：先以低帧率、低分辨率估计髋部轨迹，找到腾空最高点，只在其前后的窗口内逐帧估计姿态并评分，
+        # 窗口外的帧记为未检测到；没有明显的腾空时处理整个视频
+        self.jump_window = True
+        self.phase_step = 5  # 阶段检测时每隔多少帧估计一次姿态，其余帧只 grab() 不解码
+        self.phase_size = (640, 360)  # 阶段检测的分辨率
+        self.window_before = 1.0  # 窗口起点在最高点之前的秒数，包含起跳
+        self.window_after = 0.8  # 窗口终点在最高点之后的秒数，包含收腹和落地前的动作
+        self.min_rise = 0.25  # 髋部相对助跑时的最小升高（以躯干长度为单位），低于此值视为没有腾空
+        # 快速姿态估计：每隔 pose_stride 帧、以 model_complexity（0 最快）估计姿态，其余帧线性插值，
+        # 再在各姿态的候选最佳帧前后 refine_radius 帧内以 refine_complexity 逐帧重新估计（不适用于运动员裁剪模式）
+        self.pose_stride = 1
+        self.model_complexity = 1
+        self.refine_complexity = 1
+        self.refine_candidates = 3  # 每种姿态重新估计的候选帧数
+        self.refine_radius = 2
+        self.refine_rounds = 2  # 重新估计后最佳帧仍是插值帧时，再重新估计的轮数上限
+        # 带骨架的 _jump 视频在后台线程中绘制和编码，不阻塞姿态估计：
+        # 'full' 写出处理的每一帧（启用 jump_window 时只有起跳窗口），'keyframes' 评分后只写出各姿态最佳帧
+        # 前后 keyframe_radius 帧，None 不写视频
+        self.video_mode = 'full'
+        self.keyframe_radius = 5
+        self.video_fourcc = 'mp4v'
+
+        # 关键点缓存：同一视频再次评分时跳过姿态估计，只重新计算距离和分数
+        self.use_cache = True
+        self.landmark_store = LandmarkStore()
+        self._angles = {}  # 缓存键 -> 每帧角度数组，供同一视频多次重新评分
+        # 历史记录：每次评分记录到结果数据库（results_db），按运动员和项目查询进步情况
+        self.history = True
+        self.athlete = None
+        self.event = None
+
+    def pose_config(self):
+        """影响关键点结果的参数，作为关键点缓存键的一部分"""
+        import mediapipe as mp
+        config = {'mediapipe': getattr(mp, '__version__', ''), 'input': 'rgb',
+                  'min_dconf': self.min_dconf, 'min_tconf': self.min_tconf, 'complexity': self.model_complexity}
+        if self.refine_needed():
+            config['refine'] = [self.pose_stride, self.refine_complexity, self.refine_candidates, self.refine_radius,
+                                self.refine_rounds, self.weight, self.threshold]
+        if self.athlete_crop:
+            config['athlete_crop'] = [self.crop_size, self.crop_margin, list(self.process_size)]
+        if self.jump_window:
+            config['jump_window'] = [self.phase_step, list(self.phase_size), self.window_before, self.window_after,
+                                     self.min_rise]
+        return config
+
+    def imageflow(self, video_path, preview=None, progress=None, output_dir=None):
+        """对视频评分，返回结果文件夹路径
+
+        Args:
+            preview: 预览通道 PreviewChannel，None 表示不显示预览
+            progress: 进度 ProgressEmitter，None 表示不报告进度
+            output_dir: 结果文件夹的上级目录，默认为当前工作目录
+        """
+        save_folder, safe_file_name = result_folder(video_path, output_dir)
+        timings = {}
+
+        t0 = time.perf_counter()
+        # 多名运动员时只缓存主要运动员的关键点，不使用缓存，保证每名运动员都被评分
+        use_cache = self.use_cache and not (self.athlete_crop and self.max_athletes > 1)
+        key = self.landmark_store.key(video_path, self.pose_config()) if use_cache else None
+        landmarks = None
+        if key is not None:
+            landmarks, meta = self.landmark_store.load(key)
+        cached = landmarks is not None
+        if cached:
+            print(f"使用关键点缓存: {key}")
+            if progress:
+                progress.emit(100, force=True)
+        else:
+            landmarks, meta = self.extract_landmarks(video_path, save_folder, safe_file_name, preview, progress)
+            if key is not None:
+                self.landmark_store.save(key, landmarks, meta)
+        timings['landmarks'] = round(time.perf_counter() - t0, 3)
+
+        record = self.score(video_path, landmarks, save_folder, key=key, timings=timings, cached=cached)
+        if self.history:
+            save_history('posture', record, self.athlete, self.event, save_folder)
+        if self.video_mode == 'keyframes' and not cached:
+            self.write_keyframe_video(video_path, landmarks, record, self.video_path(save_folder, safe_file_name,
+                                                                                     video_path), meta['fps'])
+        # 其他运动员的结果保存在结果文件夹下的 athlete_<序号> 子文件夹中
+        if not cached:
+            for number, (track_id, athlete_landmarks) in enumerate(self.extra_athletes, start=2):
+                athlete_folder = os.path.join(save_folder, f"athlete_{number}")
+                os.makedirs(athlete_folder, exist_ok=True)
+                print(f"评分第 {number} 名运动员（跟踪 ID {track_id}）: {athlete_folder}")
+                athlete_record = self.score(video_path, athlete_landmarks, athlete_folder, timings=timings)
+                if self.history:
+                    save_history('posture', athlete_record, None, self.event, athlete_folder)  # 身份未知
+
+        # 返回结果文件夹路径
+        return save_folder
+
+    def rescore(self, video_path, weight=None, threshold=None, output_dir=None):
+        """用缓存的关键点重新评分，不再运行姿态估计
 
-    def imageflow(self, video_path, change_pixmap_signal, progress_signal=None):
-        cap = cv2.VideoCapture(video_path)
-        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)  # float
-        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)  # float
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))  # 获取总帧数
-
-        file = video_path.split("/")[-1]
-        if "\\" in video_path:
-            file = video_path.split("\\")[-1]
-        file_name = file.split(".")[0]
-        file_type = "." + file.split(".")[1]
-        
-        # 在当前工作目录下创建结果文件夹，避免中文路径问题
-        output_dir = os.getcwd()  # 获取当前工作目录
-        
-        # 确保文件名不包含可能导致问题的字符
-        safe_file_name = re.sub(r'[^\w\-_]', '_', file_name)
-        
-        save_folder = os.path.join(output_dir, safe_file_name)
-        os.makedirs(save_folder, exist_ok=True)
-        save_path = os.path.join(save_folder, safe_file_name + "_jump" + file_type)
-
-        vid_writer = cv2.VideoWriter(
-            save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (int(width), int(height))
-        )
-
-        pose = self.mp_pose.Pose(min_detection_confidence=self.min_dconf, min_tracking_confidence=self.min_tconf)
+        修改权重、阈值、标准姿态文件或回归模型后调用，结果图片和评分记录覆盖原结果文件夹中的文件。
+
+        Returns:
+            结果文件夹路径；该视频没有关键点缓存时返回 None
+        """
+        key = self.landmark_store.key(video_path, self.pose_config())
+        landmarks, meta = self.landmark_store.load(key)
+        if landmarks is None:
+            print(f"没有关键点缓存，请先对该视频完整评分: {video_path}")
+            return None
+        save_folder, _ = result_folder(video_path, output_dir)
+        self.score(video_path, landmarks, save_folder, weight=weight, threshold=threshold, key=key, cached=True)
+        return save_folder
+
+    def extract_landmarks(self, video_path, save_folder, safe_file_name, preview=None, progress=None):
+        """逐帧运行姿态估计，video_mode 为 'full' 时写出带骨架的视频，返回 (关键点数组, 元数据)
+
+        启用 jump_window 时只处理起跳阶段窗口内的帧，带骨架的视频也只包含该窗口。
+        """
+        window = self.find_jump_window(video_path, preview, progress) if self.jump_window else None
+        # 后台线程预读解码帧，解码与姿态估计并行进行；裁剪模式同时缩放出检测和跟踪使用的图像
+        start, end = window or (0, None)
+        source = FrameSource(video_path, start=start, end=end,
+                             resize=[None, self.process_size] if self.athlete_crop else None)
+        total_frames = source.frame_count  # 获取总帧数
+
+        base = 30 if window is not None else 0
+        length = (end or total_frames) - start
+
+        def report(done):
+            # 阶段检测占进度的前 30%
+            if progress and length > 0:
+                progress.emit(base + done / length * (100 - base))
+
+        vid_writer = None
+        if self.video_mode == 'full':
+            vid_writer = AsyncVideoWriter(self.video_path(save_folder, safe_file_name, video_path), source.fps,
+                                          fourcc=self.video_fourcc)
+
+        try:
+            if self.athlete_crop:
+                landmarks, meta = self.track_athlete_landmarks(source, vid_writer, start, total_frames, preview,
+                                                               report)
+            else:
+                with self.borrowed_pose() as pose:
+                    landmarks, meta = self.track_landmarks(pose, source, vid_writer, start, total_frames, preview,
+                                                           report)
+        finally:
+            source.release()
+            if vid_writer is not None:
+                vid_writer.close()
+        meta['window'] = window
+        if self.refine_needed() and not self.athlete_crop:
+            landmarks, meta['refined_frames'] = self.refine_landmarks(video_path, landmarks)
+        return landmarks, meta
+
+    @staticmethod
+    def video_path(save_folder, safe_file_name, video_path):
+        return os.path.join(save_folder, safe_file_name + "_jump" + os.path.splitext(video_path)[1])
+
+    def write_keyframe_video(self, video_path, landmarks, record, save_path, fps):
+        """只把各姿态最佳帧前后 keyframe_radius 帧解码、绘制骨架并写入视频，按帧号顺序拼接"""
+        frames = set()
+        for posture in record['postures'].values():
+            i = posture['frame_id']
+            if i is not None:
+                frames.update(range(max(i - self.keyframe_radius, 0),
+                                    min(i + self.keyframe_radius + 1, len(landmarks))))
+        if not frames:
+            return None
+        with AsyncVideoWriter(save_path, fps, fourcc=self.video_fourcc) as writer:
+            for start, end in frame_ranges(frames):
+                source = FrameSource(video_path, start=start, end=end)
+                try:
+                    for frame in source:
+                        row = landmarks[frame.index]
+                        writer.write(frame.image, self.skeleton_drawer([None if np.isnan(row).any() else row]))
+                finally:
+                    source.release()
+        print(f"关键帧视频已保存（{len(frames)} 帧）: {save_path}")
+        return save_path
+
+    def refine_needed(self):
+        return self.pose_stride > 1 or self.model_complexity != self.refine_complexity
+
+    def refine_landmarks(self, video_path, landmarks):
+        """在各姿态的候选最佳帧附近以完整质量逐帧重新估计姿态，替换插值或低精度的关键点
+
+        第一轮对每种姿态距离最小的 refine_candidates 帧重新估计；之后若某种姿态的最佳帧仍未重新估计过，
+        只对该帧再估计一轮。选出的最佳帧与逐帧完整估计基本一致，重新估计的帧数只占很小一部分。
+
+        Returns:
+            (关键点数组, 重新估计的帧数)
+        """
+        landmarks = np.array(landmarks, dtype=np.float32)
+        refined = np.zeros(len(landmarks), dtype=bool)
+        for round_index in range(self.refine_rounds):
+            angles = calculate_take_off_angles_batch(landmarks)
+            frames = set()
+            for posture_type in POSTURE_TYPES:
+                d = calculate_distance_batch(angles, posture_type, self.weight, self.threshold)
+                candidates = np.argsort(d, kind='stable')[:self.refine_candidates if round_index == 0 else 1]
+                for i in candidates.tolist():
+                    if np.isfinite(d[i]) and not refined[i]:
+                        frames.update(range(max(i - self.refine_radius, 0),
+                                            min(i + self.refine_radius + 1, len(landmarks))))
+            frames = [i for i in frames if not refined[i]]
+            if not frames:
+                break
+            # 连续的帧合并为一段，每段从头解码并重置姿态模型的跟踪状态
+            with self.borrowed_pose(model_complexity=self.refine_complexity) as pose:
+                for start, end in frame_ranges(frames):
+                    if hasattr(pose, 'reset'):
+                        pose.reset()
+                    recorder = LandmarkRecorder(end - start)
+                    source = FrameSource(video_path, start=start, end=end)
+                    try:
+                        for frame in source:
+                            with span('pose_refine'):
+                                results = pose.process(cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB))
+                            recorder.add(results.pose_landmarks)
+                    finally:
+                        source.release()
+                    rows = recorder.landmarks()
+                    landmarks[start:start + len(rows)] = rows
+                    refined[start:end] = True
+        print(f"重新估计 {int(refined.sum())} 帧的姿态（共 {len(landmarks)} 帧）")
+        return landmarks, int(refined.sum())
+
+    def find_jump_window(self, video_path, preview=None, progress=None):
+        """起跳阶段检测：每隔 phase_step 帧在低分辨率图像上估计姿态，由髋部轨迹找到腾空最高点
+
+        Returns:
+            逐帧处理的范围 (start_frame, end_frame)，end_frame 不包含在内；没有明显的腾空时返回 None
+        """
+        source = FrameSource(video_path, step=self.phase_step, resize=self.phase_size, reuse_buffers=True)
+        fps, total_frames = source.fps, source.frame_count
+        frames, hip_y, torso = [], [], []
+        try:
+            with self.borrowed_pose() as pose:
+                for frame in source:
+                    with span('phase_pose'):
+                        results = pose.process(cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB))
+                    frames.append(frame.index)
+                    if results.pose_landmarks:
+                        lm = results.pose_landmarks.landmark
+                        hip = ((lm[23].x + lm[24].x) / 2, (lm[23].y + lm[24].y) / 2)
+                        shoulder = ((lm[11].x + lm[12].x) / 2, (lm[11].y + lm[12].y) / 2)
+                        hip_y.append(hip[1])
+                        # 躯干长度按画面宽高比换算到与 y 相同的单位，作为升高量的尺度
+                        torso.append(math.hypot((hip[0] - shoulder[0]) * source.width / source.height,
+                                                hip[1] - shoulder[1]))
+                    else:
+                        hip_y.append(np.nan)
+                        torso.append(np.nan)
+                    if progress and total_frames > 0:
+                        progress.emit(frame.index / total_frames * 30)
+                    if preview:
+                        preview.emit(frame.image)
+        finally:
+            source.release()
+
+        peak = jump_peak(np.asarray(hip_y), np.asarray(torso), self.min_rise)
+        if peak is None:
+            print("未检测到明显的腾空，处理整个视频")
+            return None
+        peak_frame = frames[peak]
+        start = max(0, peak_frame - self.phase_step - int(self.window_before * fps))
+        end = peak_frame + self.phase_step + int(self.window_after * fps)
+        if total_frames > 0:
+            end = min(total_frames, end)
+        print(f"起跳阶段窗口: 第 {start}-{end} 帧（腾空最高点约在第 {peak_frame} 帧，共 {total_frames} 帧）")
+        return start, end
+
+    def pose_options(self, model_complexity=None):
+        return {'min_detection_confidence': self.min_dconf, 'min_tracking_confidence': self.min_tconf,
+                'model_complexity': self.model_complexity if model_complexity is None else model_complexity}
+
+    @contextmanager
+    def borrowed_pose(self, model_complexity=None):
+        """从模型注册表借用已加载、预热的姿态模型，并清除上一个视频的跟踪状态"""
+        options = self.pose_options(model_complexity)
+        pose = REGISTRY.acquire('pose', **options)
+        if hasattr(pose, 'reset'):
+            pose.reset()
+        try:
+            yield pose
+        finally:
+            REGISTRY.release('pose', pose, **options)
+
+    @staticmethod
+    def annotate(frame, row, copy=True):
+        """在帧上写出起跳角度并绘制骨架，row 为该帧整帧归一化坐标的关键点 (33, 4)，None 表示未检测到人体
+
+        角度文字总是直接写在 frame 上；copy=False 时骨架也直接画在 frame 上，不再复制整帧。
+        """
+        if row is None:
+            return frame
+        # 新增 - 计算起跳角度并显示在视频上
+        anchor = row[13]  # 左脚踝为参考点
+        cg = row[9]  # 左髋关节为重心点
+        angle = calculate_take_off_angle(float(anchor[0]), float(anchor[1]), float(cg[0]), float(cg[1]))
+        angle_text = f'Take off angle: {angle:.2f} degrees'
+        cv2.putText(frame, angle_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+        with span('draw_skeleton'):
+            return plot_construct_point(frame, points=back_to_origin(construct_point_array(row), frame.shape),
+                                        copy=copy)
+
+    @staticmethod
+    def skeleton_drawer(rows):
+        """返回在视频编码线程中把各行关键点直接画在帧上的函数，都未检测到时返回 None"""
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            return None
+
+        def draw(image):
+            for row in rows:
+                image = Posture.annotate(image, row, copy=False)
+            return image
+        return draw
+
+    def track_landmarks(self, pose, source, vid_writer, start, total_frames, preview, report):
+        """逐帧估计姿态；pose_stride > 1 时每隔 pose_stride 帧估计一次，跳过的帧在下一次估计后按插值的关键点绘制"""
+        self.extra_athletes = []
+        recorder = LandmarkRecorder(total_frames)
+        recorder.skip(start)
+        stride = max(int(self.pose_stride), 1)
+        pending = []  # 等待下一次估计后插值写出的帧
+        last_row = None
         frame_id = 0
         flag = True
-        image = None
-        d_take_off = {'d': 1000., 'points': [], 'frame_id': [], 'angles': [], 'score': []}
-        d_hip_extension = {'d': 1000., 'points': [], 'frame_id': [], 'angles': [], 'score': []}
-        d_abdominal_contraction = {'d': 1000., 'points': [], 'frame_id': [], 'angles': [], 'score': []}
 
         while flag:
-            ret_val, frame = cap.read()
-            if ret_val:
-                results = pose.process(frame)
-                normalized_points = []
-                origin_points = []
-
-                if results.pose_landmarks:
-                    landmarks = results.pose_landmarks.landmark
-                    normalized_points = construct_point(landmarks)
-
-                    # 计算是否抵达待测姿态
-                    temp1, angles1 = calculate_distance(normalized_points, 'take_off', self.weight, self.threshold)
-                    temp2, angles2 = calculate_distance(normalized_points, 'hip_extension', self.weight, self.threshold)
-                    temp3, angles3 = calculate_distance(normalized_points, 'abdominal_contraction', self.weight,
-                                                        self.threshold)
-
-                    if d_take_off['d'] is not None and temp1 is not None:
-                        if d_take_off['d'] > temp1:
-                            d_take_off['d'] = temp1
-                            d_take_off['points'] = normalized_points
-                            d_take_off['frame_id'] = frame_id
-                            d_take_off['angles'] = angles1
-
-                    # 计算 'hip_extension'
-                    if d_hip_extension['d'] is not None and temp2 is not None:
-                        if d_hip_extension['d'] > temp2:
-                            d_hip_extension['d'] = temp2
-                            d_hip_extension['points'] = normalized_points
-                            d_hip_extension['frame_id'] = frame_id
-                            d_hip_extension['angles'] = angles2
-
-                    # 计算 'abdominal_contraction'
-                    if d_abdominal_contraction['d'] is not None and temp3 is not None:
-                        if d_abdominal_contraction['d'] > temp3:
-                            d_abdominal_contraction['d'] = temp3
-                            d_abdominal_contraction['points'] = normalized_points
-                            d_abdominal_contraction['frame_id'] = frame_id
-                            d_abdominal_contraction['angles'] = angles3
-
-                    if image is not None:
-                        origin_points = back_to_origin(normalized_points, image.shape)
-
-                    # 新增 - 计算起跳角度并显示在视频上
-                    anchor = results.pose_landmarks.landmark[13]  # 左脚踝为参考点
-                    anchor_x, anchor_y = anchor.x, anchor.y
-                    cg = results.pose_landmarks.landmark[9]  # 左髋关节为重心点
-                    cg_x, cg_y = cg.x, cg.y
-                    angle = calculate_take_off_angle(anchor_x, anchor_y, cg_x, cg_y)
-                    angle_text = f'Take off angle: {angle:.2f} degrees'
-                    cv2.putText(frame, angle_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-
-                image = plot_construct_point(frame, points=origin_points)
-
-                #cv2.imshow('result', image)
-                vid_writer.write(image)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
+            next_frame = source.read()
+            if next_frame is not None:
+                frame = next_frame.image
+                row = None
+                if frame_id % stride:
+                    recorder.skip(1)
+                else:
+                    with span('pose_estimate'):
+                        results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))  # MediaPipe 需要 RGB 输入
+                    row = recorder.add(results.pose_landmarks)
             else:
                 break
-            
-            # 更新进度
-            frame_id += 1
-            if progress_signal and total_frames > 0:
-                progress = int((frame_id / total_frames) * 100)
-                progress_signal.emit(progress)
 
-            # 将 OpenCV 图像转换为 QImage
-            qt_img = self.convert_cv_to_qt(frame)
-            change_pixmap_signal.emit(qt_img)
+            # 发送预览（限速，界面来不及显示的帧直接丢弃）；须在帧交给编码线程之前
+            if preview and preview.due():
+                preview.emit(self.annotate(frame.copy(), row) if row is not None else frame)
+
+            if vid_writer is not None:
+                if frame_id % stride:
+                    pending.append(frame)
+                else:
+                    self.write_pending(vid_writer, pending, last_row, row)
+                    vid_writer.write(frame, self.skeleton_drawer([row]))
+                    last_row = row
+
+            # 更新进度（限速）
+            frame_id += 1
+            report(frame_id)
+
+        if vid_writer is not None:
+            self.write_pending(vid_writer, pending, last_row, None)
+
+        meta = {'fps': source.fps, 'width': source.width, 'height': source.height, 'frames': recorder.count}
+        if stride > 1:
+            return interpolate_landmarks(recorder.landmarks(), stride), meta
+        return recorder.landmarks(), meta
+
+    def write_pending(self, vid_writer, pending, before, after):
+        """写出两次姿态估计之间跳过的帧，骨架按前后两帧的关键点线性插值；任一侧未检测到时不绘制"""
+        for k, frame in enumerate(pending, start=1):
+            row = None
+            if before is not None and after is not None:
+                row = before + (after - before) * (k / (len(pending) + 1))
+            vid_writer.write(frame, self.skeleton_drawer([row]))
+        pending.clear()
+
+    def track_athlete_landmarks(self, source, vid_writer, start, total_frames, preview, report):
+        """裁剪模式：检测和跟踪运动员，只在运动员周围的固定尺寸区域内估计姿态，关键点换算回整帧坐标"""
+        import tracker  # 只有裁剪模式需要 torch 和 ReID 模型
+
+        from athlete_pose import AthletePoseTracker
+
+        scale = (source.width / self.process_size[0], source.height / self.process_size[1])
+        athletes = AthletePoseTracker(self.pose_options(), total_frames, max_athletes=self.max_athletes,
+                                      crop_size=self.crop_size, margin=self.crop_margin, start_frame=start)
+        session = tracker.TrackerSession()
+        frame_id = 0
+        try:
+            with REGISTRY.lease('detector') as detector:
+                detector.reset()
+                for frame in source:
+                    full_frame, small_frame = frame.image
+                    with span('detect'):
+                        bboxes = detector.detect(small_frame)
+                    with span('track'):
+                        list_bboxs = session.update(bboxes, small_frame) if len(bboxes) > 0 else []
+                    draw = self.skeleton_drawer(athletes.update(full_frame, list_bboxs, scale))
+                    if preview and preview.due():
+                        preview.emit(draw(full_frame.copy()) if draw else full_frame)
+                    if vid_writer is not None:
+                        vid_writer.write(full_frame, draw)
+
+                    frame_id += 1
+                    report(frame_id)
+        finally:
+            athletes.close()
+
+        results = athletes.athletes()
+        self.extra_athletes = results[1:]
+        meta = {'fps': source.fps, 'width': source.width, 'height': source.height, 'frames': athletes.frames,
+                'athletes': [None if track_id is None else int(track_id) for track_id, _ in results]}
+        return results[0][1], meta
+
+    def best_frames(self, landmarks, weight=None, threshold=None, key=None):
+        """为每种待测姿态选出与标准姿态距离最小的帧并评分
 
-        cap.release()
-        cv2.destroyAllWindows()
+        Returns:
+            {姿态类型: {'d', 'points', 'frame_id', 'angles', 'score'}}
+        """
+        weight = self.weight if weight is None else weight
+        threshold = self.threshold if threshold is None else threshold
+        angles = self._angles.get(key) if key is not None else None
+        if angles is None:
+            angles = calculate_take_off_angles_batch(landmarks)
+            if key is not None:
+                self._angles[key] = angles
+
+        results = {}
+        for posture_type in POSTURE_TYPES:
+            best = {'d': 1000., 'points': [], 'frame_id': [], 'angles': [], 'score': []}
+            d = calculate_distance_batch(angles, posture_type, weight, threshold)
+            if len(d) > 0:
+                i = int(np.argmin(d))  # 距离相同时取最早的帧
+                if d[i] < best['d']:
+                    best['d'] = float(d[i])
+                    best['points'] = construct_point_array(landmarks[i])
+                    best['frame_id'] = i
+                    best['angles'] = angles[i].tolist()
+            if best['angles']:
+                best['score'] = get_Scoring(posture_type, best['angles'])
+            results[posture_type] = best
+        return results
+
+    def score(self, video_path, landmarks, save_folder, weight=None, threshold=None, key=None, timings=None,
+              cached=False):
+        """评分，把各姿态的骨架和分数绘制保存到结果文件夹，并写出评分记录 score.json"""
+        timings = dict(timings or {})
+        t0 = time.perf_counter()
+        weight = self.weight if weight is None else weight
+        threshold = self.threshold if threshold is None else threshold
+        with span('scoring'):
+            results = self.best_frames(landmarks, weight=weight, threshold=threshold, key=key)
+        timings['scoring'] = round(time.perf_counter() - t0, 3)
 
         width, height = 1280, 720
         canvas = cv2.cvtColor(np.ones((height, width, 3), dtype=np.uint8) * 255, cv2.COLOR_BGR2RGB)  # 创建白色背景画布
-        d_take_off["score"] = get_Scoring("take_off", d_take_off["angles"])
-        d_hip_extension["score"] = get_Scoring("hip_extension", d_hip_extension["angles"])
-        d_abdominal_contraction["score"] = get_Scoring("abdominal_contraction", d_abdominal_contraction["angles"])
-
-        # 创建 'take_off' 图像，将 'take_off' 关键点绘制在画布上，并保存为 'take_off.jpg'
-        take_off_points = back_to_origin(d_take_off['points'], canvas.shape)
-        canvas_take_off = plot_construct_point(canvas, take_off_points, color=(0, 255, 0))
-        # 在左上角写入分数
-        cv2.putText(canvas_take_off, f'Score: {d_take_off["score"]}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 0), 2, cv2.LINE_AA)
-        cv2.imwrite(os.path.join(save_folder, "take_off.jpg"), canvas_take_off)
-
-        # 创建 'hip_extension' 图像，将 'hip_extension' 关键点绘制在画布上，并保存为 'hip_extension.jpg'
-        hip_extension_points = back_to_origin(d_hip_extension['points'], canvas.shape)
-        canvas_hip_extension = plot_construct_point(canvas, hip_extension_points, color=(255, 0, 0))
-        # 在左上角写入分数
-        cv2.putText(canvas_hip_extension, f'Score: {d_hip_extension["score"]}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 0), 2, cv2.LINE_AA)
-        cv2.imwrite(os.path.join(save_folder, "hip_extension.jpg"), canvas_hip_extension)
-
-        # 创建 'abdominal_contraction' 图像，将 'abdominal_contraction' 关键点绘制在画布上，并保存为 'abdominal_contraction.jpg'
-        abdominal_contraction_points = back_to_origin(d_abdominal_contraction['points'], canvas.shape)
-        canvas_abdominal_contraction = plot_construct_point(canvas, abdominal_contraction_points, color=(0, 0, 255))
-        # 在左上角写入分数
-        cv2.putText(canvas_abdominal_contraction, f'Score: {d_abdominal_contraction["score"]}', (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2, cv2.LINE_AA)
-        cv2.imwrite(os.path.join(save_folder, "abdominal_contraction.jpg"), canvas_abdominal_contraction)
-        
-        # 返回结果文件夹路径
-        return save_folder
+        colors = {'take_off': (0, 255, 0), 'hip_extension': (255, 0, 0), 'abdominal_contraction': (0, 0, 255)}
+        for posture_type in POSTURE_TYPES:
+            best = results[posture_type]
+            # 将关键点绘制在画布上，并保存为 '<姿态类型>.jpg'
+            points = back_to_origin(best['points'], canvas.shape)
+            canvas_posture = plot_construct_point(canvas, points, color=colors[posture_type])
+            if canvas_posture is canvas:
+                canvas_posture = canvas.copy()  # 没有关键点时 plot_construct_point 不复制画布
+            # 在左上角写入分数
+            cv2.putText(canvas_posture, f'Score: {best["score"]}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                        (0, 0, 0), 2, cv2.LINE_AA)
+            cv2.imwrite(os.path.join(save_folder, posture_type + ".jpg"), canvas_posture)
+
+        record = score_record(video_path, results, weight, threshold, timings=timings, cached=cached)
+        save_record(save_folder, SCORE_RECORD, record)
+        return record
 
     def convert_cv_to_qt(self, frame):
         """将 OpenCV 图像转换为 QImage"""
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # 将 BGR 转换为 RGB
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        return qt_image
+        return convert_cv_to_qt(frame)
 
 
 def process_video_folder(folder_path):
@@ -383,3 +893,16 @@ def get_video_files(folder_path):
     video_files.sort(key=lambda x: int(re.search(r'\d+', x).group()))
 
     return video_files
+
+
+if __name__ == '__main__':
+    # 更新 .joblib 回归模型后在仓库根目录下运行: python posture.py --export-regressors
+    import argparse
+
+    parser = argparse.ArgumentParser(description='姿态评分工具')
+    parser.add_argument('--export-regressors', action='store_true', help=f'把 .joblib 回归模型转换为 {REGRESSOR_FILE}')
+    opt = parser.parse_args()
+    if opt.export_regressors:
+        export_regressors()
+    else:
+        parser.print_help()
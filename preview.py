@@ -0,0 +1,99 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils.profiler import span
+
+
+def convert_cv_to_qt(frame):
+    """将 OpenCV 图像（BGR）转换为独立持有数据的 QImage，可安全地跨线程发送"""
+    from PyQt5.QtGui import QImage  # 在此导入，无界面的后台服务不依赖 PyQt5
+
+    h, w, ch = frame.shape
+    if hasattr(QImage, 'Format_BGR888'):
+        # Qt 5.14 起可直接使用 BGR 数据，只在 copy() 时复制一次
+        frame = np.ascontiguousarray(frame)
+        return QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888).copy()
+    rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888).copy()
+
+
+def encode_jpeg(frame, quality=70):
+    """将 OpenCV 图像编码为 JPEG 字节，用于向网页客户端发送预览"""
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes() if ok else b''
+
+
+class PreviewChannel(object):
+    """限速的预览通道：处理线程按固定上限的帧率向界面发送缩小后的预览图像
+
+    - 距上次发送不足 1/max_fps 秒时丢弃本帧；
+    - 界面尚未显示完上一帧（未调用 ack）时同样丢弃本帧，Qt 事件队列中最多只有一帧待显示；
+    - 在处理线程中缩放到预览控件的尺寸，界面线程无需再缩放；
+    - enabled 为 False 时完全不转换、不发送，处理速度最快。
+
+    处理线程在绘制叠加信息前可先调用 due() 判断本帧是否会被发送，不发送的帧无需绘制。
+    """
+
+    def __init__(self, signal, max_fps=12, size=None, enabled=True, wait_ack=True, convert=convert_cv_to_qt):
+        self.signal = signal
+        self.convert = convert  # 把缩放后的 BGR 图像转换为发送的对象，默认为 QImage
+        self.max_fps = max_fps
+        self.size = size  # 预览控件尺寸 (宽, 高)，None 表示不缩放
+        self.enabled = enabled
+        self.wait_ack = wait_ack  # 接收方不调用 ack 时设为 False，只按帧率限速
+        self._last = 0.0
+        self._pending = threading.Event()  # 已发送但界面尚未显示的帧
+
+    def set_size(self, width, height):
+        self.size = (int(width), int(height)) if width > 0 and height > 0 else None
+
+    def ack(self):
+        """界面显示完一帧后调用，允许发送下一帧"""
+        self._pending.clear()
+
+    def due(self):
+        """本帧是否会被发送"""
+        return (self.enabled and not (self.wait_ack and self._pending.is_set()) and
+                time.perf_counter() - self._last >= 1.0 / self.max_fps)
+
+    def emit(self, frame, force=False):
+        """发送一帧预览，被限速丢弃时返回 False。force=True 用于最终结果等必须显示的帧"""
+        if not (force or self.due()) or (force and not self.enabled):
+            return False
+        with span('preview_convert'):
+            if self.size is not None:
+                h, w = frame.shape[:2]
+                scale = min(self.size[0] / w, self.size[1] / h)
+                if scale < 1:
+                    frame = cv2.resize(frame, (max(int(w * scale), 1), max(int(h * scale), 1)),
+                                       interpolation=cv2.INTER_AREA)
+            image = self.convert(frame)
+        self._last = time.perf_counter()
+        self._pending.set()
+        self.signal.emit(image)
+        return True
+
+
+class ProgressEmitter(object):
+    """限速的进度信号：进度值变化且距上次发送超过 min_interval 秒时才发送，100% 总是发送。signal 为 None 时不发送"""
+
+    def __init__(self, signal, min_interval=0.2):
+        self.signal = signal
+        self.min_interval = min_interval
+        self._last = 0.0
+        self._value = None
+
+    def emit(self, value, force=False):
+        value = int(value)
+        if self.signal is None or value == self._value:
+            return False
+        now = time.perf_counter()
+        if not force and value < 100 and now - self._last < self.min_interval:
+            return False
+        self._last = now
+        self._value = value
+        self.signal.emit(value)
+        return True
@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import time
+
+SCORE_RECORD = 'score.json'  # 姿态评分结果
+SPEED_RECORD = 'speed.json'  # 测速结果
+RECORD_VERSION = 1
+
+POSTURE_NAMES = {'take_off': '起跳姿态', 'hip_extension': '髋关节伸展', 'abdominal_contraction': '腹部收缩'}
+COMPOSITE_WEIGHTS = {'take_off': 0.4, 'hip_extension': 0.3, 'abdominal_contraction': 0.3}  # 综合得分的加权系数
+
+
+def result_folder(video_path, output_dir=None):
+    """视频对应的结果文件夹，默认在当前工作目录下以视频文件名命名，避免中文路径问题
+
+    Returns:
+        (结果文件夹路径, 处理后的文件名)
+    """
+    file_name = os.path.splitext(os.path.basename(video_path.replace("\\", "/")))[0]
+    # 确保文件名不包含可能导致问题的字符
+    safe_file_name = re.sub(r'[^\w\-_]', '_', file_name)
+    folder = os.path.join(output_dir or os.getcwd(), safe_file_name)
+    os.makedirs(folder, exist_ok=True)
+    return folder, safe_file_name
+
+
+def save_record(folder, name, record):
+    """把结果记录写为 JSON，先写临时文件再替换，读取方不会看到写了一半的文件"""
+    record = dict(record, version=RECORD_VERSION, created=time.strftime('%Y-%m-%d %H:%M:%S'))
+    path = os.path.join(folder, name)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_record(folder, name):
+    """读取结果记录，文件不存在或无法解析时返回 None"""
+    path = os.path.join(folder, name)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取结果记录失败: {e}")
+        return None
+
+
+def score_record(video_path, results, weight, threshold, timings=None, cached=False):
+    """由 Posture.best_frames 的结果构建评分记录
+
+    每项得分为回归模型的原始输出限制到 0-100 之间，未找到对应姿态的项目得分为 None，不计入综合得分。
+    """
+    postures = {}
+    composite = 0.0
+    for posture_type, best in results.items():
+        score = None
+        if len(best['score']) > 0:
+            score = round(min(100.0, max(0.0, float(best['score'][0]))), 2)
+            composite += score * COMPOSITE_WEIGHTS.get(posture_type, 0.0)
+        postures[posture_type] = {
+            'name': POSTURE_NAMES.get(posture_type, posture_type),
+            'score': score,
+            'distance': best['d'] if best['angles'] else None,
+            'frame_id': best['frame_id'] if best['angles'] else None,
+            'angles': [round(a, 3) for a in best['angles']],
+        }
+    return {
+        'video': os.path.abspath(video_path),
+        'postures': postures,
+        'composite': int(composite),
+        'weight': list(weight),
+        'threshold': threshold,
+        'landmark_cache': cached,
+        'timings': timings or {},
+    }
+
+
+def speed_record(video_path, gate_counter, fps, frame_count, window=None, processed_frames=0, timings=None,
+                 cached=False):
+    """由 GateCounter 的状态构建测速记录"""
+    return {
+        'video': os.path.abspath(video_path),
+        'speed': gate_counter.speed,
+        'distance': gate_counter.distance,
+        'elapsed': round(gate_counter.elapsed, 3) if gate_counter.speed > 0 else None,
+        'start_frame': gate_counter.start,
+        'end_frame': gate_counter.ending,
+        'complete': gate_counter.complete,
+        'count': gate_counter.count,
+        'blue_ids': sorted(int(i) for i in gate_counter.blue_ids),
+        'yellow_ids': sorted(int(i) for i in gate_counter.yellow_ids),
+        'fps': fps,
+        'frame_count': int(frame_count),
+        'window': list(window) if window else None,
+        'processed_frames': processed_frames,
+        'track_cache': cached,
+        'timings': timings or {},
+    }
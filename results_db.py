@@ -0,0 +1,233 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from result_record import SCORE_RECORD, SPEED_RECORD, load_record
+
+RESULTS_DB = os.getenv('RUNNER_RESULTS_DB', os.path.join(os.getcwd(), 'results.db'))  # 可用环境变量 RUNNER_RESULTS_DB 修改
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    athlete TEXT,
+    event TEXT,
+    recorded TEXT NOT NULL,
+    video TEXT,
+    folder TEXT,
+    speed REAL,
+    elapsed REAL,
+    distance REAL,
+    start_frame INTEGER,
+    end_frame INTEGER,
+    fps REAL,
+    composite INTEGER,
+    timings TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posture_scores (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    posture TEXT NOT NULL,
+    score REAL,
+    distance REAL,
+    frame_id INTEGER,
+    angle_0 REAL,
+    angle_1 REAL,
+    angle_2 REAL,
+    PRIMARY KEY (session_id, posture)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_athlete ON sessions(athlete, recorded);
+CREATE INDEX IF NOT EXISTS idx_sessions_event ON sessions(event, recorded);
+CREATE INDEX IF NOT EXISTS idx_sessions_recorded ON sessions(recorded);
+CREATE INDEX IF NOT EXISTS idx_scores_posture ON posture_scores(posture, score);
+"""
+
+SESSION_COLUMNS = ('id', 'kind', 'athlete', 'event', 'recorded', 'video', 'folder', 'speed', 'elapsed', 'distance',
+                   'start_frame', 'end_frame', 'fps', 'composite')
+
+
+class ResultsDB(object):
+    """测速和姿态评分结果的历史数据库（SQLite，WAL 模式）
+
+    每次测速或评分记录为 sessions 表中的一行（运动员、项目、时间、速度和分段帧号、综合得分、各阶段用时，
+    以及完整的结果记录 JSON），各姿态的得分、距离、最佳帧和三个角度记录在 posture_scores 表中。
+    按运动员、项目和时间建有索引，成千上万次记录的进步曲线查询在毫秒级完成，无需扫描结果文件夹。
+
+    WAL 模式下读取不阻塞写入，界面、后台服务的多个工作进程可以同时使用同一个数据库文件；
+    每个线程使用自己的连接。
+
+    Usage:
+        db = ResultsDB()
+        db.add('posture', record, athlete='张三', event='跳远')
+        db.history(athlete='张三', kind='posture')
+    """
+
+    def __init__(self, path=RESULTS_DB, timeout=10.0):
+        self.path = str(path)
+        self.timeout = timeout  # 其他进程正在写入时的等待秒数
+        self._local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # WAL 模式下断电最多丢失最后一次提交，数据库不会损坏
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def session_row(kind, record, athlete=None, event=None, folder=None, recorded=None):
+        recorded = recorded or record.get('created') or time.strftime('%Y-%m-%d %H:%M:%S')
+        row = {'kind': kind, 'athlete': athlete, 'event': event, 'recorded': recorded,
+               'video': record.get('video'), 'folder': folder, 'speed': None, 'elapsed': None, 'distance': None,
+               'start_frame': None, 'end_frame': None, 'fps': None, 'composite': None,
+               'timings': json.dumps(record.get('timings') or {}, ensure_ascii=False),
+               'record': json.dumps(record, ensure_ascii=False)}
+        if kind == 'speed':
+            row.update(speed=record.get('speed') or None, elapsed=record.get('elapsed'),
+                       distance=record.get('distance'), start_frame=record.get('start_frame'),
+                       end_frame=record.get('end_frame'), fps=record.get('fps'))
+        else:
+            row['composite'] = record.get('composite')
+        return row
+
+    def add(self, kind, record, athlete=None, event=None, folder=None, recorded=None):
+        """记录一次测速（kind='speed'，speed.json 的内容）或评分（kind='posture'，score.json 的内容），返回记录 ID"""
+        return self.add_many([{'kind': kind, 'record': record, 'athlete': athlete, 'event': event, 'folder': folder,
+                               'recorded': recorded}])[0]
+
+    def add_many(self, items):
+        """在一个事务中批量记录，items 为 add() 参数组成的字典，返回记录 ID 列表"""
+        rows = [self.session_row(**item) for item in items]
+        if not rows:
+            return []
+        conn = self.connect()
+        columns = list(rows[0])
+        session_sql = (f"INSERT INTO sessions ({', '.join(columns)}) "
+                       f"VALUES ({', '.join('?' * len(columns))})")
+        ids = []
+        scores = []
+        with conn:
+            for row in rows:
+                session_id = conn.execute(session_sql, [row[c] for c in columns]).lastrowid
+                ids.append(session_id)
+                if row['kind'] != 'posture':
+                    continue
+                for posture, result in json.loads(row['record']).get('postures', {}).items():
+                    angles = (list(result.get('angles') or []) + [None] * 3)[:3]
+                    scores.append((session_id, posture, result.get('score'), result.get('distance'),
+                                   result.get('frame_id'), *angles))
+            conn.executemany("INSERT INTO posture_scores VALUES (?, ?, ?, ?, ?, ?, ?, ?)", scores)
+        return ids
+
+    def import_folders(self, root, athlete=None, event=None):
+        """把 root 下各结果文件夹中已有的 speed.json 和 score.json 批量导入，返回导入的记录数
+
+        已导入过的结果文件夹（按文件夹路径和记录时间判断）会被跳过，可重复运行。
+        """
+        existing = {(row['folder'], row['kind'], row['recorded'])
+                    for row in self.connect().execute("SELECT folder, kind, recorded FROM sessions")}
+        items = []
+        for dirpath, _, filenames in os.walk(root):
+            for kind, name in (('speed', SPEED_RECORD), ('posture', SCORE_RECORD)):
+                if name not in filenames:
+                    continue
+                record = load_record(dirpath, name)
+                folder = os.path.abspath(dirpath)
+                if record is None or (folder, kind, record.get('created')) in existing:
+                    continue
+                items.append({'kind': kind, 'record': record, 'athlete': athlete, 'event': event, 'folder': folder})
+        return len(self.add_many(items))
+
+    def history(self, athlete=None, event=None, kind=None, since=None, until=None, limit=None):
+        """按时间顺序返回记录摘要（不含完整的结果记录），since/until 为 'YYYY-MM-DD[ HH:MM:SS]'，包含两端"""
+        where, params = self._filters(athlete, event, kind, since, until)
+        sql = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions{where} ORDER BY recorded DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"  # 最近的 limit 条
+            params.append(int(limit))
+        return [dict(row) for row in self.connect().execute(sql, params)][::-1]
+
+    def scores(self, athlete=None, event=None, posture=None, since=None, until=None):
+        """各次评分中各姿态的得分和角度，按时间顺序 [{'session_id', 'recorded', 'athlete', 'posture', 'score', ...}]"""
+        where, params = self._filters(athlete, event, None, since, until, prefix='s.')
+        if posture is not None:
+            where += (' AND' if where else ' WHERE') + ' p.posture = ?'
+            params.append(posture)
+        sql = ("SELECT p.session_id, s.recorded, s.athlete, s.event, p.posture, p.score, p.distance, p.frame_id, "
+               "p.angle_0, p.angle_1, p.angle_2 FROM posture_scores p JOIN sessions s ON s.id = p.session_id"
+               f"{where} ORDER BY s.recorded, p.session_id")
+        return [dict(row) for row in self.connect().execute(sql, params)]
+
+    def angles(self, posture, athlete=None, event=None, since=None, until=None):
+        """某一姿态各次评分的角度，返回 (记录 ID 数组, (行数, 3) 角度矩阵)，可直接用 posture.score_many 批量重新评分"""
+        rows = [r for r in self.scores(athlete, event, posture, since, until) if r['angle_0'] is not None]
+        ids = np.array([r['session_id'] for r in rows], dtype=np.int64)
+        matrix = np.array([[r['angle_0'], r['angle_1'], r['angle_2']] for r in rows], dtype=np.float64)
+        return ids, matrix.reshape(-1, 3)
+
+    def record(self, session_id):
+        """完整的结果记录（与 speed.json / score.json 相同），不存在时返回 None"""
+        row = self.connect().execute("SELECT record FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return None if row is None else json.loads(row['record'])
+
+    def athletes(self):
+        return [row[0] for row in self.connect().execute(
+            "SELECT DISTINCT athlete FROM sessions WHERE athlete IS NOT NULL ORDER BY athlete")]
+
+    @staticmethod
+    def _filters(athlete, event, kind, since, until, prefix=''):
+        clauses, params = [], []
+        for column, value in (('athlete', athlete), ('event', event), ('kind', kind)):
+            if value is not None:
+                clauses.append(f"{prefix}{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append(f"{prefix}recorded >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{prefix}recorded <= ?")
+            params.append(until if len(until) > 10 else until + ' 23:59:59')
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_db():
+    """进程内共享的默认数据库（RESULTS_DB），首次使用时创建"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ResultsDB()
+        return _default
+
+
+def save_history(kind, record, athlete=None, event=None, folder=None):
+    """把一次结果记录到默认数据库；数据库不可用时只打印错误，不影响分析结果"""
+    try:
+        return default_db().add(kind, record, athlete=athlete, event=event, folder=folder)
+    except Exception as e:
+        print(f"保存历史记录失败: {e}")
+        return None
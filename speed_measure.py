@@ -0,0 +1,580 @@
+import os
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import tracker
+from deep_sort.utils.track_log import TrackLogWriter
+from gate import GateZones, GateCounter
+from model_registry import REGISTRY
+from preview import PreviewChannel, ProgressEmitter
+from result_record import SPEED_RECORD, result_folder, save_record, speed_record
+from results_db import save_history
+from track_cache import TrackCache, TrackRecorder
+from utils.cache import file_hash
+from utils.frame_source import FrameSource
+from utils.profiler import Profiler, span
+
+
+TRACK_LOG = 'tracks.trk'  # 测速窗口内每帧的跟踪框和区域状态，可导出为 MOT 文本或 JSON
+
+
+class SpeedMeasure(object):
+    """测速流程（检测、跟踪、过线计时），不依赖界面，可在 VideoThread 或后台工作进程中使用
+
+    同一个实例可以依次处理多个视频。未传入 detector 时，每次测速从模型注册表借用进程内共享的检测器，
+    创建实例不加载模型，切换视频也不会重新加载。
+    """
+
+    def __init__(self, detector=None):
+        self.filename = None
+        self.output_dir = None
+        self._is_running = True
+        self.tracker = None
+        self.detector = detector
+        self.own_detector = detector is not None
+        self.speed = 0.0  # 添加速度属性
+        # 性能优化参数
+        self.frame_skip = 1  # 降低到每1帧处理一次，确保不遗漏关键帧
+        self.process_width = 960  # 提高处理分辨率为原来的75%
+        self.process_height = 540  # 提高处理分辨率为原来的75% 
+        self.display_width = 1280  # 显示分辨率宽度
+        self.display_height = 720  # 显示分辨率高度
+        self.early_stop_threshold = 0.8  # 提高到80%，确保不会错过重要帧
+        self.overlap_margin = 5  # 添加重叠检测的边界容差
+        self.speed_calculated = False  # 新增标志，表示是否已完成测速
+
+        # 粗到细测速：先稀疏扫描定位过线窗口，再只在窗口内逐帧检测和跟踪
+        self.coarse_to_fine = True
+        self.scan_step = 8  # 粗扫描时每隔多少帧检测一次，其余帧只 grab() 不解码
+        self.scan_width = 640  # 粗扫描分辨率
+        self.scan_height = 360
+        self.window_preroll = 1.0  # 窗口起点提前的秒数，保证跟踪器在过线前已确认目标
+        self.window_postroll = 0.5  # 窗口终点延后的秒数
+        self.gate_distance = 4.0  # 蓝、黄区域之间的距离（米）
+        # 检测和跟踪结果缓存：同一视频再次测速时直接回放，无需重新解码和推理
+        self.use_cache = True
+        self.track_cache = TrackCache()
+        self.track_log = True  # 逐帧写出跟踪日志 tracks.trk 到结果文件夹
+        self.result = None  # 最近一次测速的结构化记录，同时保存为结果文件夹中的 speed.json
+        # 历史记录：每次测速记录到结果数据库（results_db），按运动员和项目查询进步情况
+        self.history = True
+        self.athlete = None
+        self.event = None
+        # 运动员名册（athlete_index.AthleteIndex）：设置后未指定 athlete 时，用 ReID 特征识别过线的运动员
+        self.athlete_index = None
+        # 限速预览和进度，在 measure() 中设置
+        self.preview = PreviewChannel(None, enabled=False)
+        self.progress = ProgressEmitter(None)
+        self.events = None  # 过线和测速事件，接口与 pyqtSignal(dict).emit 相同
+        self.wait = None  # 视频仍在上传时，等待第 i 帧数据到达的回调 wait(i)，wait(None) 等待整个文件
+        # 各阶段耗时统计（解码、缩放、YOLO、NMS、ReID、卡尔曼预测、关联、过线判断、绘制、预览转换），
+        # 开启后每个视频在结果文件夹中保存 profile.json（p50/p95/p99）和 trace.json（Chrome 跟踪格式）
+        self.profile = os.getenv('RUNNER_PROFILE', '0') == '1'
+        self.profiler = None
+        # 显示分辨率下的测速区域叠加图和绘制缓冲区，显示尺寸或区域不变时在各帧之间复用
+        self._overlay_key = None
+        self._overlay = None
+
+    def cache_config(self):
+        """影响检测和跟踪结果的模型版本与参数，作为缓存键的一部分（测速区域和距离不在其中，可直接回放）"""
+        def version(path):
+            return file_hash(path) if os.path.isfile(path) else path
+
+        return {
+            'weights': version(self.detector.weights),
+            'reid': version(tracker.cfg.DEEPSORT.REID_CKPT),
+            'deepsort': dict(tracker.cfg.DEEPSORT),
+            'detector': [self.detector.img_size, self.detector.threshold, self.detector.max_skip],
+            'process': [self.process_width, self.process_height, self.frame_skip],
+            'scan': [self.coarse_to_fine, self.scan_step, self.scan_width, self.scan_height],
+        }
+
+    def scan_detections(self, frame_count, recorder=None):
+        """粗扫描：非采样帧只 grab() 不解码，每隔 scan_step 帧在低分辨率图像上检测一次，逐帧返回 (帧号, 检测框)"""
+        source = FrameSource(self.filename, step=self.scan_step, resize=(self.scan_width, self.scan_height),
+                             wait=self.wait, reuse_buffers=True)
+        try:
+            for frame in source:
+                if not self._is_running:
+                    break
+                with span('detect'):
+                    bboxes = self.detector.detect(frame.image)
+                if recorder is not None:
+                    recorder.add_scan(frame.index, bboxes)
+                if frame_count > 0:
+                    self.progress.emit(int(frame.index / frame_count * 30))
+                self.preview.emit(frame.image)
+                yield frame.index, bboxes
+        finally:
+            source.release()
+            self.detector.reset()
+
+    def find_gate_hits(self, scan_detections):
+        """在粗扫描结果中找出运动员接近蓝色区域、随后接近黄色区域的采样帧
+
+        Returns:
+            (blue_frame, yellow_frame)，未找到时为 None
+        """
+        zones = GateZones(self.scan_width, self.scan_height, margin=self.overlap_margin)
+        blue_frame = None
+        yellow_frame = None
+        for index, bboxes in scan_detections:
+            for x1, y1, x2, y2, lbl, conf in bboxes:
+                blue_near, yellow_near = zones.near(x1, y1, x2, y2)
+                if blue_near and blue_frame is None:
+                    blue_frame = index
+                    print(f"粗扫描：第 {index} 帧目标接近蓝色区域")
+                if yellow_near and blue_frame is not None and index > blue_frame:
+                    yellow_frame = index
+                    print(f"粗扫描：第 {index} 帧目标接近黄色区域")
+                    break
+            if yellow_frame is not None:
+                break
+        return blue_frame, yellow_frame
+
+    def gate_window(self, blue_frame, yellow_frame, fps, frame_count):
+        """根据粗扫描找到的帧确定逐帧处理的范围 (start_frame, end_frame)，end_frame 不包含在内"""
+        if blue_frame is None:
+            return None
+        start_frame = max(0, blue_frame - self.scan_step - int(self.window_preroll * fps))
+        if yellow_frame is None:
+            end_frame = int(frame_count)
+        else:
+            end_frame = min(int(frame_count), yellow_frame + self.scan_step + int(self.window_postroll * fps))
+        return start_frame, end_frame
+
+    def scan_gate_window(self, fps, frame_count, recorder=None):
+        """粗扫描定位运动员接近并通过蓝、黄测速区域的大致帧范围，未发现接近蓝色区域的目标时返回 None"""
+        detections = self.scan_detections(frame_count, recorder)
+        try:
+            blue_frame, yellow_frame = self.find_gate_hits(detections)
+        finally:
+            detections.close()
+        return self.gate_window(blue_frame, yellow_frame, fps, frame_count)
+
+    def save_result(self, gate_counter, fps, frame_count, window, processed_frames, timings, cached=False):
+        """保存测速记录 speed.json 到视频对应的结果文件夹"""
+        self.result = speed_record(self.filename, gate_counter, fps, frame_count, window=window,
+                                   processed_frames=processed_frames, timings=timings, cached=cached)
+        athlete = self.athlete
+        if athlete is None and self.athlete_index is not None and not cached:
+            athlete = self.identify_runner(gate_counter)
+            self.result['athlete'] = athlete
+        folder, _ = result_folder(self.filename, self.output_dir)
+        save_record(folder, SPEED_RECORD, self.result)
+        if self.history:
+            save_history('speed', self.result, athlete, self.event, folder)
+
+    def identify_runner(self, gate_counter):
+        """在运动员名册中识别过线的运动员（优先最近进入黄色区域的目标），未登记或不匹配时返回 None"""
+        try:
+            identities = self.athlete_index.assign(self.tracker.track_embeddings())
+        except Exception as e:
+            print(f"识别运动员失败: {e}")
+            return None
+        for track_id in list(reversed(gate_counter.yellow_ids)) + list(reversed(gate_counter.blue_ids)):
+            if int(track_id) in identities:
+                name, similarity = identities[int(track_id)]
+                print(f"识别过线的运动员: 轨迹 {track_id} -> {name}（相似度 {similarity:.3f}）")
+                return name
+        return None
+
+    def replay_cached(self, cached, fps, frame_count, timings=None):
+        """用缓存的检测和跟踪结果重新计算速度
+
+        测速区域、距离或窗口参数改变后同样适用；缓存的帧不足以覆盖新的测速窗口时返回 False，需要重新处理。
+        """
+        replay_start = time.perf_counter()
+        window = None
+        if self.coarse_to_fine and frame_count > 0:
+            blue_frame, yellow_frame = self.find_gate_hits(cached.scan_detections())
+            # 缓存的粗扫描在旧的黄色区域处提前结束，新区域的结果可能在未扫描的部分
+            if yellow_frame is None and not cached.meta['scan_complete']:
+                return False
+            window = self.gate_window(blue_frame, yellow_frame, fps, frame_count)
+        start_frame, end_frame = window or (0, int(frame_count))
+        if len(cached.frames) == 0 or cached.frames[0] > start_frame:
+            return False
+
+        zones = GateZones(self.process_width, self.process_height, margin=self.overlap_margin)
+        gate_counter = GateCounter(zones, fps, distance=self.gate_distance)
+        processed_frames = 0
+        last_index = start_frame
+        stopped = False
+        for index, list_bboxs in cached.tracks():
+            if index < start_frame:
+                continue
+            if index >= end_frame:
+                break
+            processed_frames += 1
+            last_index = index
+            frame_number = index + 1
+            self.report_events(gate_counter.update(frame_number, list_bboxs), gate_counter, fps)
+            if gate_counter.complete:
+                self.speed_calculated = True
+                stopped = True
+                break
+            if gate_counter.speed > 0 and frame_number > frame_count * self.early_stop_threshold:
+                stopped = True
+                break
+        if not stopped and cached.meta['covered_end'] < end_frame:
+            return False
+
+        self.speed = gate_counter.speed
+        print(f"使用缓存回放测速结果：处理 {processed_frames} 帧，速度={self.speed}m/s")
+        timings = dict(timings or {}, replay=round(time.perf_counter() - replay_start, 3))
+        self.save_result(gate_counter, fps, frame_count, window, processed_frames, timings, cached=True)
+        self.progress.emit(100, force=True)
+        if self.speed > 0:
+            source = FrameSource(self.filename, start=last_index, end=last_index + 1,
+                                 resize=(self.display_width, self.display_height))
+            frame = source.read()
+            source.release()
+            if frame is not None:
+                self.show_result(frame.image, gate_counter, processed_frames)
+        return True
+
+    def show_result(self, display_frame, gate_counter, processed_frames):
+        """在最后一帧上绘制最终测速结果并发送到界面"""
+        speed = gate_counter.speed
+        # 创建一个带有最终结果的图像
+        result_frame = display_frame.copy()
+        # 绘制大号的速度文本
+        result_text = f"Final Speed: {speed} m/s"
+        cv2.putText(result_frame, result_text, (int(self.display_width/2) - 250, int(self.display_height/2)),
+                  cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
+
+        # 根据测速是否提前完成显示不同信息
+        if self.speed_calculated:
+            processing_info = f"Speed calculation complete! Processed {processed_frames} frames"
+            cv2.putText(result_frame, processing_info, (int(self.display_width/2) - 250, int(self.display_height/2) + 50),
+                      cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+            # 添加一些测速细节
+            time_info = f"Time: {gate_counter.elapsed:.2f} seconds for {self.gate_distance:g} meters"
+            cv2.putText(result_frame, time_info, (int(self.display_width/2) - 250, int(self.display_height/2) + 100),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+        else:
+            processing_info = f"Processed {processed_frames} frames (every {self.frame_skip} frame)"
+            cv2.putText(result_frame, processing_info, (int(self.display_width/2) - 250, int(self.display_height/2) + 50),
+                      cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+        # 最终结果总是发送
+        self.preview.emit(result_frame, force=True)
+
+    def overlay_base(self, display_frame, color_polygons_image):
+        """把显示帧复制到复用的绘制缓冲区，并叠加半透明的测速区域
+
+        区域图像只在显示尺寸或区域改变时缩放一次；混合只在两个区域的外接矩形内进行，
+        其余像素的区域图像为 0，混合结果与原图相同。
+        """
+        size = (self.display_width, self.display_height)
+        key = (color_polygons_image, size)
+        if self._overlay_key is None or self._overlay_key[0] is not color_polygons_image or self._overlay_key[1] != size:
+            polygons = cv2.resize(color_polygons_image, size)
+            mask = (polygons.max(axis=2) > 0).astype(np.uint8)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            rois = [(slice(y, y + h), slice(x, x + w)) for x, y, w, h, _ in stats[1:count]]
+            self._overlay = (polygons, rois, np.empty((size[1], size[0], 3), dtype=np.uint8))
+            self._overlay_key = key
+        polygons, rois, buffer = self._overlay
+        np.copyto(buffer, display_frame)
+        for roi in rois:
+            cv2.addWeighted(buffer[roi], 1.0, polygons[roi], 0.4, 0, dst=buffer[roi])
+        return buffer
+
+    def draw_overlay(self, display_frame, list_bboxs, color_polygons_image, gate_counter, speed, processing_info):
+        """在显示分辨率的帧上绘制跟踪框、测速区域和文本信息
+
+        绘制在复用的缓冲区中进行，不修改 display_frame；返回的图像在下一次调用时被覆盖。
+        """
+        # 在显示分辨率的帧上添加多边形
+        output_image_frame = self.overlay_base(display_frame, color_polygons_image)
+
+        if len(list_bboxs) > 0:
+            # 在显示帧上绘制边界框 - 需要将坐标缩放回显示分辨率
+            scaled_bboxs = []
+            for bbox in list_bboxs:
+                x1, y1, x2, y2, label, track_id = bbox
+                # 缩放回显示分辨率
+                scaled_x1 = int(x1 * (self.display_width / self.process_width))
+                scaled_y1 = int(y1 * (self.display_height / self.process_height))
+                scaled_x2 = int(x2 * (self.display_width / self.process_width))
+                scaled_y2 = int(y2 * (self.display_height / self.process_height))
+                scaled_bboxs.append((scaled_x1, scaled_y1, scaled_x2, scaled_y2, label, track_id))
+
+            output_image_frame = self.tracker.draw_bboxes(output_image_frame, scaled_bboxs, line_thickness=None)
+
+        # 在显示帧上绘制文本信息
+        text_draw = "Count: " + str(gate_counter.count) + " Speed: " + str(speed) + "m/s"
+        output_image_frame = cv2.putText(img=output_image_frame, text=text_draw, org=(10, 50),
+                                       fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(255, 0, 0),
+                                       thickness=2)
+
+        # 额外显示处理信息
+        output_image_frame = cv2.putText(img=output_image_frame, text=processing_info, org=(10, 90),
+                                       fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.7, color=(0, 255, 0),
+                                       thickness=2)
+
+        # 在检测到蓝色或黄色区域重叠时，在画面上标记
+        if len(gate_counter.blue_ids) > 0:
+            cv2.putText(output_image_frame, "Blue region detected", (10, 130),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+        if len(gate_counter.yellow_ids) > 0:
+            cv2.putText(output_image_frame, "Yellow region detected", (10, 170),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        return output_image_frame
+
+    def report_events(self, events, gate_counter, fps):
+        """发送本帧的过线事件，以及速度更新"""
+        if self.events is None:
+            return
+        for gate, track_id, index in events:
+            self.events.emit({'type': 'gate', 'gate': gate, 'track_id': int(track_id), 'frame': index,
+                              'time': round(index / fps, 3) if fps else None})
+        if events and gate_counter.speed > 0:
+            self.events.emit({'type': 'speed', 'speed': gate_counter.speed, 'complete': gate_counter.complete,
+                              'elapsed': round(gate_counter.elapsed, 3)})
+
+    def open_track_log(self, fps, frame_count, window):
+        """在结果文件夹中创建跟踪日志，坐标为处理分辨率"""
+        folder, _ = result_folder(self.filename, self.output_dir)
+        meta = {'video': os.path.abspath(self.filename), 'fps': fps, 'frame_count': int(frame_count),
+                'width': self.process_width, 'height': self.process_height, 'window': window}
+        return TrackLogWriter(os.path.join(folder, TRACK_LOG), meta=meta)
+
+    def save_profile(self):
+        """保存最近一次测速的各阶段耗时统计 profile.json 和 Chrome 跟踪文件 trace.json"""
+        folder, _ = result_folder(self.filename, self.output_dir)
+        os.makedirs(folder, exist_ok=True)
+        print(self.profiler.report())
+        self.profiler.save_json(os.path.join(folder, 'profile.json'), video=os.path.basename(self.filename),
+                                timings=self.result['timings'] if self.result else None)
+        self.profiler.save_chrome_trace(os.path.join(folder, 'trace.json'))
+
+    def measure(self, filename, preview=None, progress=None, output_dir=None, events=None, wait=None):
+        """测量视频中运动员通过蓝、黄测速区域之间的速度
+
+        Args:
+            preview: 预览通道 PreviewChannel，None 表示不显示预览
+            progress: 进度 ProgressEmitter，None 表示不报告进度
+            output_dir: 结果文件夹的上级目录，默认为当前工作目录
+            events: 过线和测速事件的接收方（有 emit(dict) 方法），None 表示不发送
+            wait: 视频仍在上传时的数据等待回调，见 backend.core.upload_store.UploadWaiter；
+                  此时跳过缓存查找（需要完整文件的哈希），粗扫描与上传同时进行
+
+        Returns:
+            测速记录（同时保存为结果文件夹中的 speed.json）；被 stop() 中止时返回 None
+        """
+        with self.borrowed_detector():
+            return self.profiled_run(filename, preview, progress, output_dir, events, wait)
+
+    @contextmanager
+    def borrowed_detector(self):
+        """处理期间使用的检测器：传入的检测器直接使用，否则从模型注册表借用共享的检测器
+
+        共享检测器含相邻帧复用状态，同一时间只供一个视频使用，首次使用时加载。
+        """
+        if self.own_detector:
+            yield self.detector
+            return
+        with REGISTRY.lease('detector') as detector:
+            self.detector = detector
+            try:
+                yield detector
+            finally:
+                self.detector = None
+
+    def profiled_run(self, filename, preview, progress, output_dir, events, wait):
+        if not self.profile:
+            return self.run(filename, preview, progress, output_dir, events, wait)
+        self.profiler = Profiler()
+        with self.profiler.activate():
+            result = self.run(filename, preview, progress, output_dir, events, wait)
+        self.save_profile()
+        return result
+
+    def begin(self, filename, preview=None, progress=None, output_dir=None, events=None, wait=None):
+        """开始处理一个视频：设置输出通道，重置跟踪会话、检测器和上一次的结果"""
+        self.filename = filename
+        self.output_dir = output_dir
+        self.preview = preview or PreviewChannel(None, enabled=False)
+        self.progress = progress or ProgressEmitter(None)
+        self.events = events
+        self.wait = wait
+        self._is_running = True
+        # 每个视频使用独立的跟踪会话，轨迹和 ID 不会延续到下一个视频；检测器清除上一个视频的相邻帧缓存
+        self.tracker = tracker.TrackerSession(REGISTRY.get('reid'), keep_embeddings=self.athlete_index is not None)
+        self.detector.reset()
+        self.speed = 0.0
+        self.speed_calculated = False
+        self.result = None
+
+    def process_frame(self, index, small_frame, gate_counter, fps, recorder=None, track_log=None):
+        """在处理分辨率的帧上检测、跟踪并更新过线计时，返回跟踪框 [(x1, y1, x2, y2, label, track_id), ...]"""
+        # 在降低分辨率的帧上进行检测
+        with span('detect'):
+            bboxes = self.detector.detect(small_frame)
+        # 在小尺寸帧上更新跟踪器
+        with span('track'):
+            list_bboxs = self.tracker.update(bboxes, small_frame) if len(bboxes) > 0 else []
+
+        if recorder is not None:
+            recorder.add_frame(index, bboxes, list_bboxs)
+
+        # 检查对象是否与蓝色或黄色多边形重叠，使用视频中的绝对帧号计时
+        with span('gate'):
+            gate_events = gate_counter.update(index + 1, list_bboxs)
+        if track_log is not None:
+            track_log.add(index, list_bboxs, confs=self.tracker.confidences() if list_bboxs else None,
+                          gates=gate_counter.states)
+        for gate, track_id, event_index in gate_events:
+            if gate == 'blue':
+                print(f"检测到蓝色区域重叠！ID: {track_id}, 帧: {event_index}")
+            else:
+                print(f"检测到黄色区域重叠！ID: {track_id}, 帧: {event_index}")
+        self.report_events(gate_events, gate_counter, fps)
+        return list_bboxs
+
+    def run(self, filename, preview, progress, output_dir, events, wait):
+        run_start = time.perf_counter()
+        self.begin(filename, preview, progress, output_dir, events, wait)
+
+        # 读取视频信息
+        cap = cv2.VideoCapture(self.filename)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+
+        # 创建处理分辨率下的蓝色和黄色测速区域
+        zones = GateZones(self.process_width, self.process_height, margin=self.overlap_margin)
+        gate_counter = GateCounter(zones, fps, distance=self.gate_distance)
+
+        # 创建用于可视化的蓝色和黄色图像
+        color_polygons_image = zones.color_image()
+        timings = {}
+
+        # 同一视频、同一模型和参数已有缓存时直接回放
+        cache_key = None
+        recorder = None
+        if self.use_cache:
+            if wait is None:
+                cache_key = self.track_cache.key(self.filename, self.cache_config())
+                cached = self.track_cache.load(cache_key)
+                if cached is not None and self.replay_cached(cached, fps, frame_count, timings):
+                    return self.result
+            recorder = TrackRecorder()
+
+        # 确定需要逐帧处理的范围
+        start_frame, end_frame = 0, int(frame_count)
+        window = None
+        if self.coarse_to_fine and frame_count > 0:
+            scan_start = time.perf_counter()
+            window = self.scan_gate_window(fps, frame_count, recorder)
+            timings['scan'] = round(time.perf_counter() - scan_start, 3)
+            if window is not None:
+                start_frame, end_frame = window
+                print(f"测速窗口: 第 {start_frame}-{end_frame} 帧（共 {int(frame_count)} 帧）")
+            else:
+                print("粗扫描未找到过线窗口，处理整个视频")
+        progress_base = 30 if window is not None else 0
+        window_length = max(end_frame - start_frame, 1)
+
+        speed = 0
+        frame_number = start_frame
+        processed_frames = 0
+        last_display_frame = None
+        stopped_early = False
+
+        # 后台线程预读窗口内的帧：跳过的帧只 grab() 不解码，同时缩放出处理分辨率和显示分辨率两份图像，
+        # 缩放结果写入预先分配的缓冲池，不为每帧分配新数组
+        if wait is not None and not wait(start_frame):
+            raise RuntimeError("视频上传中断")
+        source = FrameSource(self.filename, start=start_frame, end=end_frame, step=self.frame_skip,
+                             resize=[(self.process_width, self.process_height),
+                                     (self.display_width, self.display_height)], wait=wait, reuse_buffers=True)
+        track_log = None
+        try:
+            # 出错或中止时也释放预读线程、视频文件和跟踪日志，分析服务的工作进程会反复调用 run()
+            track_log = self.open_track_log(fps, frame_count, window) if self.track_log else None
+            for frame in source:
+                if not self._is_running:
+                    break
+                frame_number = frame.index + 1
+                progress = progress_base + int((frame_number - start_frame) / window_length * (100 - progress_base))
+                processed_frames += 1
+
+                # 降低处理分辨率的帧用于检测，显示分辨率的帧用于绘制
+                small_frame, display_frame = frame.image
+                # 绘制不修改 display_frame；缓冲池中的图像在再读取两帧之前有效，循环结束后不再读取
+                last_display_frame = display_frame
+
+                list_bboxs = self.process_frame(frame.index, small_frame, gate_counter, fps, recorder, track_log)
+
+                if gate_counter.speed > 0:
+                    speed = gate_counter.speed
+                    self.speed = speed  # 保存速度值
+
+                    # 如果已经获得有效的速度值且完成一个完整的测速过程，立即停止处理
+                    if gate_counter.complete:
+                        print(f"Speed calculated: {speed} m/s, stopping early!")
+                        print(f"Blue region objects: {gate_counter.blue_ids}")
+                        print(f"Yellow region objects: {gate_counter.yellow_ids}")
+                        self.speed_calculated = True  # 标记已完成测速
+
+                        # 直接跳到结果显示，无需继续处理后续帧
+                        stopped_early = True
+                        break  # 直接跳出循环，结束处理
+
+                # 只有会被发送的预览帧才绘制叠加信息
+                if self.preview.due():
+                    processing_info = f"Frame: {frame_number}/{int(frame_count)} Skip: {self.frame_skip} Res: {self.process_width}x{self.process_height}"
+                    if window is not None:
+                        processing_info += f" Window: {start_frame}-{end_frame}"
+                    with span('overlay'):
+                        output_image_frame = self.draw_overlay(display_frame, list_bboxs, color_polygons_image,
+                                                               gate_counter, speed, processing_info)
+                    self.preview.emit(output_image_frame)
+
+                self.progress.emit(progress)
+
+                # 检查是否已经有测速结果且已经处理了足够多的帧
+                if speed > 0 and frame_number > frame_count * self.early_stop_threshold:
+                    print(f"提前结束处理：已处理{frame_number}/{int(frame_count)}帧，速度={speed}m/s")
+                    stopped_early = True
+                    break
+        finally:
+            source.release()
+            if track_log is not None:
+                track_log.close()
+        timings['total'] = round(time.perf_counter() - run_start, 3)
+        timings['track'] = round(timings['total'] - timings.get('scan', 0.0), 3)
+
+        # 上传中的视频在全部到达并通过校验后才写入结果
+        if wait is not None and self._is_running:
+            if not wait(None):
+                raise RuntimeError("视频上传中断或校验失败")
+            if recorder is not None:
+                cache_key = self.track_cache.key(self.filename, self.cache_config())
+
+        # 完整处理（未被用户中止）后写入缓存和测速记录
+        if self._is_running:
+            self.save_result(gate_counter, fps, frame_count, window, processed_frames, timings)
+            self.progress.emit(100, force=True)
+        if recorder is not None and self._is_running:
+            meta = {'fps': fps, 'frame_count': int(frame_count), 'window': window,
+                    'scan_complete': not recorder.scan_frames or recorder.scan_frames[-1] + self.scan_step >= int(frame_count),
+                    'covered_end': frame_number if stopped_early else end_frame}
+            print(f"检测和跟踪结果已缓存: {self.track_cache.save(cache_key, recorder, meta)}")
+
+        # 如果有最后一帧，显示处理结果
+        if last_display_frame is not None and speed > 0:
+            self.show_result(last_display_frame, gate_counter, processed_frames)
+
+        return self.result
+
+    def stop(self):
+        self._is_running = False
@@ -0,0 +1,140 @@
+import importlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import ai_coach
+from utils import cache
+
+ANSWER = ['起跳时', '髋关节', '充分伸展。']
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容 chat/completions 的本地桩：先按 server.failures 返回 503，之后返回 SSE 流或完整 JSON"""
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests.append((self.path, self.headers['Authorization'], body))
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if body['stream'] and server.stream:
+            chunks = [': keep-alive', '']  # 注释行和空行应被忽略
+            chunks += [f"data: {json.dumps({'choices': [{'delta': {'role': 'assistant'}}]})}", '']
+            for text in ANSWER:
+                data = json.dumps({'choices': [{'delta': {'content': text}}]}, ensure_ascii=False)
+                chunks += [f"data: {data}", '']
+            chunks += ['data: [DONE]', '', 'data: {"choices": [{"delta": {"content": "之后的内容"}}]}', '']
+            payload = '\n'.join(chunks).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')  # 不声明编码，客户端应按 UTF-8 解码
+        else:
+            content = ''.join(ANSWER)
+            payload = json.dumps({'choices': [{'message': {'content': content}}]}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.failures = 0
+    server.stream = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_ROOT', tmp_path / 'cache')
+    return tmp_path / 'cache'
+
+
+def test_stream_parsing(stub):
+    client = ai_coach.CoachClient('test-key', base_url=stub.url)
+    deltas = []
+    assert client.evaluate('提示', on_delta=deltas.append) == ''.join(ANSWER)
+    assert deltas == ANSWER
+    path, authorization, body = stub.requests[0]
+    assert path == '/v1/chat/completions'
+    assert authorization == 'Bearer test-key'
+    assert body['stream'] is True
+    assert body['messages'][-1] == {'role': 'user', 'content': '提示'}
+    client.close()
+
+
+def test_retry_after_server_error(stub):
+    stub.failures = 2
+    client = ai_coach.CoachClient('test-key', base_url=stub.url, retries=2)
+    assert client.evaluate('提示') == ''.join(ANSWER)
+    assert len(stub.requests) == 3
+    client.close()
+
+
+def test_server_error_after_retries(stub):
+    stub.failures = 3
+    client = ai_coach.CoachClient('test-key', base_url=stub.url, retries=1, use_cache=False)
+    with pytest.raises(requests.HTTPError):
+        client.evaluate('提示')
+    assert len(stub.requests) == 2
+    client.close()
+
+
+def test_cache_hit(stub, cache_dir):
+    client = ai_coach.CoachClient('test-key', base_url=stub.url)
+    content = client.evaluate('提示')
+    assert len(stub.requests) == 1
+    assert client.cache_file('提示').parent == cache_dir / 'coach'
+
+    # 新客户端（不同密钥）读取同一缓存，不再请求服务
+    other = ai_coach.CoachClient('other-key', base_url=stub.url)
+    deltas = []
+    assert other.evaluate('提示', on_delta=deltas.append) == content
+    assert deltas == [content]
+    assert len(stub.requests) == 1
+
+    # 不同的提示不命中缓存
+    other.evaluate('另一个提示')
+    assert len(stub.requests) == 2
+    client.close()
+    other.close()
+
+
+def test_non_stream_response(stub):
+    stub.stream = False
+    client = ai_coach.CoachClient('test-key', base_url=stub.url, use_cache=False)
+    deltas = []
+    assert client.evaluate('提示', on_delta=deltas.append) == ''.join(ANSWER)
+    assert deltas == [''.join(ANSWER)]
+    client.close()
+
+
+def test_base_url_from_environment(stub, monkeypatch):
+    monkeypatch.setenv('DEEPSEEK_BASE_URL', stub.url)
+    try:
+        module = importlib.reload(ai_coach)
+        client = module.CoachClient('test-key')
+        assert client.evaluate('提示') == ''.join(ANSWER)
+        assert len(stub.requests) == 1
+        client.close()
+    finally:
+        monkeypatch.undo()
+        importlib.reload(ai_coach)
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from athlete_pose import AthletePoseTracker
+from model_registry import ModelRegistry
+
+
+class StubPose(object):
+    """MediaPipe Pose 的桩，不检测人体"""
+
+    def process(self, image):
+        return SimpleNamespace(pose_landmarks=None)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry()
+    registry.register('pose', lambda: StubPose(), max_replicas=2)
+    monkeypatch.setattr('athlete_pose.REGISTRY', registry)
+    return registry
+
+
+def test_max_athletes_clamped_to_pose_replicas(registry):
+    athletes = AthletePoseTracker({}, frame_count=3, max_athletes=5)
+    assert athletes.max_athletes == 2
+
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    list_bboxs = [(10 + 60 * i, 50, 50 + 60 * i, 150, 'person', i + 1) for i in range(5)]
+    for _ in range(3):
+        rows = athletes.update(frame, list_bboxs)  # 超过上限时会一直等待姿态模型实例
+        assert len(rows) == 2
+    athletes.close()
+    assert len(athletes.athletes()) == 2
+    assert registry._count[registry._key('pose', {})] == 2
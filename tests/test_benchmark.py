@@ -0,0 +1,40 @@
+from benchmark import THRESHOLDS, compare, print_results
+
+
+def posture_result(scores, fps=10.0):
+    return {'kind': 'posture', 'video': 'video/test.mp4', 'frames': 100, 'seconds': 10.0, 'fps': fps,
+            'peak_rss_mb': None, 'stages': {}, 'scores': scores}
+
+
+def speed_result(speed, fps=10.0):
+    return {'kind': 'speed', 'video': 'video/test.mp4', 'frames': 100, 'seconds': 10.0, 'fps': fps,
+            'peak_rss_mb': 500.0, 'stages': {}, 'speed': speed}
+
+
+def test_compare_scores_with_undetected_postures():
+    baseline = {'results': [posture_result({'take_off': None, 'hip_extension': 80.0, 'abdominal_contraction': 70.0,
+                                            'composite': 60})]}
+    # 两边都未检测到、差值在阈值内：没有回归
+    same = posture_result({'take_off': None, 'hip_extension': 80.5, 'abdominal_contraction': 70.0, 'composite': 60})
+    assert compare([same], baseline, THRESHOLDS) == []
+
+    # 一边有分数一边没有：回归
+    changed = posture_result({'take_off': 75.0, 'hip_extension': None, 'abdominal_contraction': 72.0,
+                              'composite': 60})
+    regressions = compare([changed], baseline, THRESHOLDS)
+    assert len(regressions) == 3
+    assert any('take_off 分数 75.0，基线 None' in line for line in regressions)
+    assert any('hip_extension 分数 None，基线 80.0' in line for line in regressions)
+
+
+def test_compare_speed_and_fps():
+    baseline = {'results': [speed_result(7.0, fps=20.0)]}
+    assert compare([speed_result(7.03, fps=19.0)], baseline, THRESHOLDS) == []
+    assert len(compare([speed_result(None, fps=17.0)], baseline, THRESHOLDS)) == 2
+    assert compare([speed_result(None, fps=None)], {'results': [speed_result(None, fps=None)]}, THRESHOLDS) == []
+
+
+def test_print_results_without_fps(capsys):
+    print_results([speed_result(None, fps=None), posture_result({'composite': None}, fps=None)])
+    out = capsys.readouterr().out
+    assert 'speed=None' in out and 'composite=None' in out
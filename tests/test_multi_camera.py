@@ -0,0 +1,181 @@
+import cv2
+import numpy as np
+import pytest
+
+from deep_sort.utils.track_log import TrackLog
+from multi_camera import CameraStream, MultiCameraSession, SplitTimer
+
+
+def add_local(timer, camera, offset, local_time, distance, gate='blue', track_id=1):
+    """按 MultiCameraSession 的方式把摄像头本地时间加上偏移换算到统一时钟"""
+    timer.add(local_time + offset, distance, camera, gate, track_id)
+
+
+def build_timer():
+    # cam_a 拍 0、10 米，cam_b 的时钟晚 1.5 秒，拍 10、20、30 米；事件故意乱序加入
+    timer = SplitTimer()
+    add_local(timer, 'cam_b', 1.5, 0.9, 20.0)
+    add_local(timer, 'cam_a', 0.0, 1.2, 10.0)
+    add_local(timer, 'cam_b', 1.5, 3.0, 30.0, track_id=7)  # 30 米的第二次过线，晚于 2.4 + 1.5
+    add_local(timer, 'cam_a', 0.0, 0.0, 0.0)
+    add_local(timer, 'cam_b', 1.5, -0.1, 10.0, gate='yellow')  # 两路重叠的 10 米，晚于 cam_a 的 1.2
+    add_local(timer, 'cam_a', 0.0, 0.5, 20.0, track_id=3)  # 早于 10 米过线的误检，不能作为 20 米的时间
+    add_local(timer, 'cam_b', 1.5, 2.4, 30.0)
+    add_local(timer, 'cam_a', 0.0, 3.0, 40.0)  # 早于 30 米过线，40 米没有有效过线
+    return timer
+
+
+def test_crossings_take_earliest_monotonic_time():
+    crossings = build_timer().crossings()
+    assert [d for d, t in crossings] == [0.0, 10.0, 20.0, 30.0]
+    assert [t for d, t in crossings] == pytest.approx([0.0, 1.2, 2.4, 3.9])
+
+
+def test_crossings_skip_distance_without_later_event():
+    timer = SplitTimer()
+    timer.add(2.0, 10.0, 'cam_a', 'blue', 1)
+    timer.add(1.0, 20.0, 'cam_b', 'blue', 1)
+    timer.add(3.0, 30.0, 'cam_b', 'yellow', 1)
+    assert timer.crossings() == [(10.0, 2.0), (30.0, 3.0)]
+
+
+def test_splits_and_summary():
+    timer = build_timer()
+    splits = timer.splits()
+    assert [(s['from'], s['to']) for s in splits] == [(0.0, 10.0), (10.0, 20.0), (20.0, 30.0)]
+    assert [s['time'] for s in splits] == [1.2, 1.2, 1.5]
+    assert [s['speed'] for s in splits] == [8.33, 8.33, 6.67]
+
+    summary = timer.summary()
+    assert summary['distance'] == 30.0
+    assert summary['time'] == 3.9
+    assert summary['speed'] == 7.69
+    assert [c['distance'] for c in summary['crossings']] == [0.0, 10.0, 20.0, 30.0]
+
+
+def test_summary_needs_two_crossings():
+    timer = SplitTimer()
+    timer.add(1.0, 10.0, 'cam_a', 'blue', 1)
+    summary = timer.summary()
+    assert summary['splits'] == []
+    assert (summary['distance'], summary['time'], summary['speed']) == (0.0, 0.0, 0.0)
+
+
+# 以下用本地视频文件代替摄像头运行 MultiCameraSession。视频中是在黑色背景上水平移动的白色矩形，
+# 检测器和跟踪器用桩代替：检测器取白色像素的外接矩形，跟踪器给唯一的目标固定 ID。
+SIZE = (960, 540)
+FPS = 25
+BOX_W, BOX_Y1, BOX_Y2 = 60, 200, 320
+# 1280x720 参考分辨率下的矩形测速区域，处理分辨率下 x 约为 232~300 和 690~750
+BLUE_POINTS = [[310, 250], [400, 250], [400, 450], [310, 450]]
+YELLOW_POINTS = [[920, 250], [1000, 250], [1000, 450], [920, 450]]
+
+
+def write_clip(path, frames, step):
+    """矩形左边每帧右移 step 像素"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), FPS, SIZE)
+    for i in range(frames):
+        image = np.zeros((SIZE[1], SIZE[0], 3), dtype=np.uint8)
+        cv2.rectangle(image, (step * i, BOX_Y1), (step * i + BOX_W, BOX_Y2), (255, 255, 255), -1)
+        writer.write(image)
+    writer.release()
+    return str(path)
+
+
+class StubDetector(object):
+    def __init__(self):
+        self.batches = []
+
+    def detect_batch(self, images):
+        self.batches.append(len(images))
+        detections = []
+        for image in images:
+            ys, xs = (image[:, :, 0] > 128).nonzero()
+            detections.append([] if len(xs) == 0 else
+                              [(int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max()), 'person', 0.9)])
+        return detections
+
+
+class StubTracker(object):
+    def __init__(self):
+        self._confidences = np.empty(0, dtype=np.float32)
+
+    def update(self, bboxes, image):
+        self._confidences = np.array([conf for *_, conf in bboxes], dtype=np.float32)
+        return [(x1, y1, x2, y2, label, 1) for x1, y1, x2, y2, label, conf in bboxes]
+
+    def confidences(self):
+        return self._confidences
+
+
+class StalledSource(object):
+    """一直读不到帧、也不结束的视频流"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    def read(self, timeout=None):
+        assert timeout is not None, "读取必须有超时"
+        self.timeouts.append(timeout)
+        return None
+
+    @property
+    def exhausted(self):
+        return False
+
+    def release(self):
+        pass
+
+
+def make_camera(name, path, distances, offset):
+    return CameraStream(name, path, distances, offset=offset, live=False, process_size=SIZE,
+                        blue_points=BLUE_POINTS, yellow_points=YELLOW_POINTS, tracker=StubTracker())
+
+
+def expected_summary():
+    # cam_a 每帧 20 像素：第 9 帧进入蓝色区域（0 米），第 32 帧进入黄色区域（10 米）
+    # cam_b 每帧 10 像素、时钟偏移 1 秒：第 17 帧进入蓝色区域（10 米，晚于 cam_a，不采用），第 63 帧进入黄色区域（20 米）
+    return [(0.0, 9 / FPS), (10.0, 32 / FPS), (20.0, 1.0 + 63 / FPS)]
+
+
+def test_session_with_local_files(tmp_path):
+    cameras = [make_camera('cam_a', write_clip(tmp_path / 'a.avi', 50, 20), {'blue': 0.0, 'yellow': 10.0}, 0.0),
+               make_camera('cam_b', write_clip(tmp_path / 'b.avi', 80, 10), {'blue': 10.0, 'yellow': 20.0}, 1.0)]
+    for camera in cameras:
+        camera.open_track_log(str(tmp_path))
+    detector = StubDetector()
+    session = MultiCameraSession(cameras, detector=detector)
+    summary = session.run(stop_when_complete=False)
+
+    assert all(camera.finished for camera in cameras)
+    assert max(detector.batches) == 2  # 两路的帧合并为一个批次检测
+    assert sum(detector.batches) == 50 + 80
+    crossings = session.timer.crossings()
+    assert [d for d, t in crossings] == [0.0, 10.0, 20.0]
+    assert [t for d, t in crossings] == pytest.approx([t for d, t in expected_summary()])
+    assert [(s['from'], s['to'], s['time'], s['speed']) for s in summary['splits']] == [
+        (0.0, 10.0, 0.92, 10.87), (10.0, 20.0, 2.24, 4.46)]
+    assert (summary['distance'], summary['time'], summary['speed']) == (20.0, 3.16, 6.33)
+
+    # 跟踪日志记录每帧的跟踪框和匹配检测的置信度
+    log = TrackLog(str(tmp_path / 'cam_a.trk'))
+    assert len(log) == 48 and log.meta['camera'] == 'cam_a'  # 最后两帧矩形已移出画面
+    assert np.allclose(log.conf, 0.9)
+    mot = np.loadtxt(log.to_mot(str(tmp_path / 'cam_a.txt')), delimiter=',')
+    assert np.allclose(mot[:, 6], 0.9)
+
+
+def test_stalled_camera_does_not_block(tmp_path):
+    cameras = [make_camera('cam_a', write_clip(tmp_path / 'a.avi', 50, 20), {'blue': 0.0, 'yellow': 10.0}, 0.0),
+               make_camera('stalled', write_clip(tmp_path / 's.avi', 2, 20), {}, 0.0)]
+    cameras[1].source.release()
+    stalled = cameras[1].source = StalledSource()
+    session = MultiCameraSession(cameras, detector=StubDetector(), read_timeout=0.2)
+    summary = session.run(stop_when_complete=True)
+
+    assert [c['distance'] for c in summary['crossings']] == [0.0, 10.0]
+    assert summary['splits'][0]['time'] == 0.92
+    assert cameras[1].stalled and not cameras[1].finished
+    # 第一次等待 read_timeout，之后其他视频流正常时不再等待
+    assert stalled.timeouts[0] == 0.2
+    assert set(stalled.timeouts[1:]) == {0}
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+
+from deep_sort.utils.track_log import TrackLog, TrackLogWriter
+
+
+def write_log(path, frames, block_rows):
+    """每帧 3 个跟踪框，block_rows 不是 3 的倍数时有的帧跨越两个块"""
+    with TrackLogWriter(path, block_rows=block_rows, meta={'fps': 25}) as log:
+        for frame in frames:
+            log.add(frame, [(frame, 0, frame + 10, 20, 'person', track_id) for track_id in (1, 2, 3)],
+                    confs=[0.5, np.nan, 0.25], gates=[0, 1, 4])
+    return path
+
+
+def test_frames_split_across_blocks(tmp_path):
+    log = TrackLog(write_log(str(tmp_path / 'a.trk'), range(10), block_rows=4))
+    assert len(log) == 30
+    assert [(frame, len(rows['track_id'])) for frame, rows in log.frames()] == [(f, 3) for f in range(10)]
+
+    with open(log.to_json(str(tmp_path / 'a.json')), encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['meta'] == {'fps': 25}
+    assert [item['frame'] for item in data['frames']] == list(range(10))
+    assert data['frames'][1]['tracks'] == [
+        {'id': 1, 'box': [1.0, 0.0, 11.0, 20.0], 'conf': 0.5, 'gate': 0},
+        {'id': 2, 'box': [1.0, 0.0, 11.0, 20.0], 'conf': None, 'gate': 1},
+        {'id': 3, 'box': [1.0, 0.0, 11.0, 20.0], 'conf': 0.25, 'gate': 4}]
+
+    mot = np.loadtxt(log.to_mot(str(tmp_path / 'a.txt')), delimiter=',')
+    assert mot.shape == (30, 10)
+    assert mot[:3, 0].tolist() == [1, 1, 1] and mot[:3, 6].tolist() == [0.5, 1.0, 0.25]
+
+
+def test_out_of_order_frames_are_sorted(tmp_path):
+    log = TrackLog(write_log(str(tmp_path / 'b.trk'), [0, 1, 2, 5, 6, 3, 4], block_rows=5))
+    assert log.frame.tolist() == sorted(log.frame.tolist())
+    assert [frame for frame, rows in log.frames()] == [0, 1, 2, 3, 4, 5, 6]
+
+
+def test_truncated_block_is_ignored(tmp_path):
+    path = write_log(str(tmp_path / 'c.trk'), range(4), block_rows=6)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-5])
+    log = TrackLog(path)
+    assert len(log) == 6
+    assert [frame for frame, rows in log.frames()] == [0, 1]
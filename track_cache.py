@@ -0,0 +1,107 @@
+import json
+import os
+
+import numpy as np
+
+from utils.cache import cache_path, config_hash, file_hash
+
+
+class TrackRecorder(object):
+    """记录一次测速过程中粗扫描的检测结果，以及测速窗口内每帧的检测和跟踪结果"""
+
+    def __init__(self):
+        self.scan_frames = []  # 粗扫描采样的帧号
+        self.scan_rows = []  # (帧号, x1, y1, x2, y2, 置信度)，粗扫描分辨率
+        self.frames = []  # 逐帧处理的帧号
+        self.det_rows = []  # (帧号, x1, y1, x2, y2, 置信度)，处理分辨率
+        self.trk_rows = []  # (帧号, x1, y1, x2, y2, 跟踪ID)，处理分辨率
+
+    def add_scan(self, index, bboxes):
+        self.scan_frames.append(index)
+        self.scan_rows.extend((index, x1, y1, x2, y2, float(conf)) for x1, y1, x2, y2, lbl, conf in bboxes)
+
+    def add_frame(self, index, bboxes, list_bboxs):
+        self.frames.append(index)
+        self.det_rows.extend((index, x1, y1, x2, y2, float(conf)) for x1, y1, x2, y2, lbl, conf in bboxes)
+        self.trk_rows.extend((index, x1, y1, x2, y2, track_id) for x1, y1, x2, y2, lbl, track_id in list_bboxs)
+
+    def columns(self):
+        """转换为按列存储的紧凑数组"""
+        def split(rows, last_dtype):
+            rows = np.array(rows, dtype=np.float64).reshape(-1, 6)
+            return rows[:, 0].astype(np.int32), rows[:, 1:5].astype(np.int16), rows[:, 5].astype(last_dtype)
+
+        scan_frame, scan_box, scan_conf = split(self.scan_rows, np.float32)
+        det_frame, det_box, det_conf = split(self.det_rows, np.float32)
+        trk_frame, trk_box, trk_id = split(self.trk_rows, np.int32)
+        return dict(scan_frames=np.array(self.scan_frames, dtype=np.int32), scan_frame=scan_frame,
+                    scan_box=scan_box, scan_conf=scan_conf, frames=np.array(self.frames, dtype=np.int32),
+                    det_frame=det_frame, det_box=det_box, det_conf=det_conf,
+                    trk_frame=trk_frame, trk_box=trk_box, trk_id=trk_id)
+
+
+class CachedTracks(object):
+    """从缓存文件载入的检测和跟踪结果，按帧回放"""
+
+    def __init__(self, data):
+        self.meta = json.loads(str(data['meta']))
+        for name in data.files:
+            if name != 'meta':
+                setattr(self, name, data[name])
+
+    @staticmethod
+    def _group(frames, frame_col, box, last, label):
+        # 各列已按帧号排序，用二分查找取出每帧对应的行
+        starts = np.searchsorted(frame_col, frames, side='left')
+        ends = np.searchsorted(frame_col, frames, side='right')
+        box = box.tolist()
+        last = last.tolist()
+        for index, s, e in zip(frames.tolist(), starts, ends):
+            yield index, [(b[0], b[1], b[2], b[3], label, v) for b, v in zip(box[s:e], last[s:e])]
+
+    def scan_detections(self):
+        """逐个采样帧返回 (帧号, 检测框列表)"""
+        return self._group(self.scan_frames, self.scan_frame, self.scan_box, self.scan_conf, 'person')
+
+    def detections(self):
+        """逐个处理帧返回 (帧号, 检测框列表)"""
+        return self._group(self.frames, self.det_frame, self.det_box, self.det_conf, 'person')
+
+    def tracks(self):
+        """逐个处理帧返回 (帧号, 跟踪框列表)，格式与 tracker.update 的输出一致"""
+        return self._group(self.frames, self.trk_frame, self.trk_box, self.trk_id, 'person')
+
+
+class TrackCache(object):
+    """按视频内容哈希和模型/配置版本缓存每帧的检测与跟踪结果
+
+    缓存文件为未压缩的 .npz，每个字段单独成列（帧号 int32、边界框 int16、置信度 float32、跟踪 ID int32），
+    载入后可在不解码视频、不运行模型的情况下用新的测速区域或距离重新计算速度。
+    """
+
+    def __init__(self, kind='tracks'):
+        self.kind = kind
+
+    def key(self, video_path, config):
+        return f'{file_hash(video_path)}_{config_hash(config)}'
+
+    def path(self, key):
+        return cache_path(self.kind, key, '.npz')
+
+    def load(self, key):
+        path = self.path(key)
+        if not path.is_file():
+            return None
+        try:
+            with np.load(path) as data:
+                return CachedTracks(data)
+        except Exception as e:
+            print(f"读取检测缓存失败: {e}")
+            return None
+
+    def save(self, key, recorder, meta):
+        path = self.path(key)
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **recorder.columns())
+        os.replace(tmp, path)  # 先写临时文件再替换，避免中断时留下损坏的缓存
+        return path
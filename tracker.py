@@ -4,14 +4,35 @@ import numpy as np
 
 from deep_sort.utils.parser import get_config
 from deep_sort.deep_sort import DeepSort
+from deep_sort.deep_sort.deep.feature_extractor import Extractor
 
 cfg = get_config()
 cfg.merge_from_file("./deep_sort/configs/deep_sort.yaml")
-deepsort = DeepSort(cfg.DEEPSORT.REID_CKPT,
+
+
+def create_extractor():
+    '''按配置文件加载 ReID 特征提取器，通常通过模型注册表（model_registry）共享，进程内只加载一次'''
+    return Extractor(cfg.DEEPSORT.REID_CKPT, use_cuda=True)
+
+
+def create_deepsort(extractor=None):
+    '''按配置文件创建一个 DeepSort 跟踪器。传入已加载的 ReID 特征提取器时多个跟踪器共享同一个模型。'''
+    return DeepSort(cfg.DEEPSORT.REID_CKPT,
                     max_dist=cfg.DEEPSORT.MAX_DIST, min_confidence=cfg.DEEPSORT.MIN_CONFIDENCE,
                     nms_max_overlap=cfg.DEEPSORT.NMS_MAX_OVERLAP, max_iou_distance=cfg.DEEPSORT.MAX_IOU_DISTANCE,
                     max_age=cfg.DEEPSORT.MAX_AGE, n_init=cfg.DEEPSORT.N_INIT, nn_budget=cfg.DEEPSORT.NN_BUDGET,
-                    use_cuda=True)
+                    use_cuda=True, extractor=extractor)
+
+
+deepsort = None  # 全局跟踪器，首次调用 update() 时创建，导入本模块时不加载 ReID 模型
+
+
+def global_deepsort():
+    global deepsort
+    if deepsort is None:
+        from model_registry import REGISTRY
+        deepsort = create_deepsort(REGISTRY.get('reid'))
+    return deepsort
 
 
 def draw_bboxes(image, bboxes, line_thickness):
@@ -43,7 +64,7 @@ def draw_bboxes(image, bboxes, line_thickness):
     return image
 
 
-def update(bboxes, image):
+def update(bboxes, image, tracker=None):
     '''函数接受两个参数：bboxes 是包含边界框信息的列表，image 是当前帧的图像。
 首先，代码初始化了三个空列表 bbox_xywh、confs 和 bboxes2draw，用于存储中间结果和最终的边界框信息。
 然后，代码判断如果 bboxes 列表的长度大于 0，则进入循环。循环遍历 bboxes 列表中的每个边界框的坐标 (x1, y1, x2, y2)，标签 lbl 和置信度 conf。
@@ -52,7 +73,8 @@ def update(bboxes, image):
 接下来，代码将 bbox_xywh 列表和 confs 列表转换为 PyTorch 的 Tensor 对象 xywhs 和 confss。
 然后，代码调用 deepsort.update 函数，传入 xywhs、confss 和当前帧的图像 image，获取跟踪后的输出结果 outputs。
 最后，代码将跟踪后的输出结果转换为 (x1, y1, x2, y2, label, track_id) 格式的边界框信息，并添加到 bboxes2draw 列表中。
-最后，函数返回包含更新后的边界框信息的 bboxes2draw 列表。'''
+最后，函数返回包含更新后的边界框信息的 bboxes2draw 列表。
+tracker 为 None 时使用全局的 deepsort 跟踪器，多路视频流各自传入自己的跟踪器。'''
     bbox_xywh = []
     confs = []
     bboxes2draw = []
@@ -70,7 +92,7 @@ def update(bboxes, image):
         xywhs = torch.Tensor(bbox_xywh)
         confss = torch.Tensor(confs)
 
-        outputs = deepsort.update(xywhs, confss, image)
+        outputs = (tracker if tracker is not None else global_deepsort()).update(xywhs, confss, image)
 
         for x1, y1, x2, y2, track_id in list(outputs):
 
@@ -78,3 +100,33 @@ def update(bboxes, image):
 
     return bboxes2draw
 
+
+class TrackerSession(object):
+    """单路视频流的独立跟踪会话，拥有自己的轨迹状态和 ID，ReID 模型通过模型注册表在进程内共享
+
+    keep_embeddings=True 时保留每个已确认轨迹的 ReID 特征（轨迹结束后也不丢弃），
+    用于在运动员名册（athlete_index）中识别运动员。
+    """
+
+    def __init__(self, extractor=None, keep_embeddings=False):
+        if extractor is None:
+            from model_registry import REGISTRY
+            extractor = REGISTRY.get('reid')
+        self.deepsort = create_deepsort(extractor)
+        if keep_embeddings:
+            self.deepsort.keep_embeddings()
+
+    def track_embeddings(self):
+        """{跟踪 ID: (n, 512) ReID 特征}，未开启 keep_embeddings 时为空"""
+        return self.deepsort.track_embeddings()
+
+    def update(self, bboxes, image):
+        return update(bboxes, image, self.deepsort)
+
+    def confidences(self):
+        """上一次 update() 返回的各跟踪框所匹配检测的置信度，本帧未匹配到检测的轨迹为 NaN"""
+        return self.deepsort.last_confidences
+
+    @staticmethod
+    def draw_bboxes(image, bboxes, line_thickness):
+        return draw_bboxes(image, bboxes, line_thickness)
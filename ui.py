@@ -1,14 +1,14 @@
-from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QFileDialog,
+from PyQt5.QtWidgets import (QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QFileDialog,
                              QMessageBox, QProgressBar, QFrame, QSplitter, QGroupBox, QToolButton, QInputDialog, QLineEdit)
 from PyQt5.QtGui import QImage, QPixmap, QFont, QIcon, QPalette, QColor
 from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from video_thread import VideoThread  # 导入VideoThread类
-from posture import Posture  # 导入Posture类
-from video_thread import AutoScoreThread
+from video_thread import AutoScoreThread, CoachThread, CombinedThread
+from ai_coach import CoachClient, build_prompt
 import os
-import requests
-import json
+import re
+from result_record import SCORE_RECORD, load_record
 
 
 class ModernButton(QPushButton):
@@ -59,6 +59,7 @@ class MainWindow(QWidget):
         
         # 初始化数据属性
         self.last_speed_value = "0.00"  # 最近的测速结果
+        self.preview_enabled = True  # 是否显示处理过程的实时预览
 
     def create_ui_components(self):
         # 创建顶部标题栏
@@ -118,11 +119,36 @@ class MainWindow(QWidget):
             }
         """)
         self.api_button.clicked.connect(self.set_api_key)
+
+        # 创建实时预览开关按钮
+        self.preview_button = QToolButton()
+        self.preview_button.setCheckable(True)
+        self.preview_button.setChecked(True)
+        self.preview_button.setText("📺")
+        self.preview_button.setToolTip("关闭实时预览（最快处理速度）")
+        self.preview_button.setFixedSize(36, 36)
+        self.preview_button.setStyleSheet("""
+            QToolButton {
+                background-color: #2d3436;
+                color: white;
+                border: none;
+                border-radius: 18px;
+                font-size: 18px;
+            }
+            QToolButton:hover {
+                background-color: #3498db;
+            }
+            QToolButton:!checked {
+                background-color: #636e72;
+            }
+        """)
+        self.preview_button.clicked.connect(self.toggle_preview)
         
         # 添加到标题栏
         title_bar_layout.addStretch()
         title_bar_layout.addWidget(title_label)
         title_bar_layout.addStretch()
+        title_bar_layout.addWidget(self.preview_button)
         title_bar_layout.addWidget(self.api_button)
         title_bar_layout.addWidget(self.theme_button)
         
@@ -258,6 +284,12 @@ class MainWindow(QWidget):
         self.autoScoreButton.setEnabled(False)
         self.autoScoreButton.clicked.connect(self.auto_score)
         
+        # 一次解码同时测速和评分
+        self.combinedButton = ModernButton("测速并评分")
+        self.combinedButton.setToolTip("对同一段助跑加起跳视频只解码一次，同时完成测速和姿态评分")
+        self.combinedButton.setEnabled(False)
+        self.combinedButton.clicked.connect(self.combined_analysis)
+        
         # 查看结果按钮
         self.viewResultsButton = ModernButton("查看评分结果")
         self.viewResultsButton.setToolTip("查看最新的评分结果")
@@ -271,6 +303,7 @@ class MainWindow(QWidget):
         
         score_group_layout.addWidget(self.openScoreButton)
         score_group_layout.addWidget(self.autoScoreButton)
+        score_group_layout.addWidget(self.combinedButton)
         score_group_layout.addWidget(self.viewResultsButton)
         score_group_layout.addWidget(self.score_status_label)
         score_group.setLayout(score_group_layout)
@@ -325,8 +358,13 @@ class MainWindow(QWidget):
         self.speed_video_path = None  # 测速视频路径
         self.score_video_path = None  # 评分视频路径
         self.last_results_folder = None  # 最近评分结果文件夹
+        self.last_score_record = None  # 最近的评分记录（score.json）
+        self.coach_client = None  # AI 教练接口，复用 HTTP 连接
+        self.coach_thread = None  # 获取AI专家评价的后台线程
+        self.ai_base_html = ""
         self.video_thread = None  # 视频处理线程
         self.auto_score_thread = None  # 评分处理线程
+        self.combined_thread = None  # 测速并评分的处理线程
 
     def toggle_theme(self):
         """切换主题"""
@@ -371,6 +409,7 @@ class MainWindow(QWidget):
             
             # 启用评分按钮
             self.autoScoreButton.setEnabled(True)
+            self.combinedButton.setEnabled(True)
             
             # 更新状态信息
             file_name = fileName.split('/')[-1]
@@ -401,6 +440,7 @@ class MainWindow(QWidget):
         self.progressBar.setVisible(True)
         
         # 启动线程
+        self.setup_preview(self.auto_score_thread)
         self.auto_score_thread.start()
         
         # 更新状态
@@ -412,6 +452,39 @@ class MainWindow(QWidget):
         self.autoScoreButton.setEnabled(False)
         self.openScoreButton.setEnabled(False)
 
+    def combined_analysis(self):
+        """对评分视频一次解码同时测速和评分"""
+        if not self.score_video_path:
+            QMessageBox.warning(self, "未选择视频", "请先选择用于评分的视频文件。")
+            return
+
+        self.combined_thread = CombinedThread(self.score_video_path)
+        self.combined_thread.change_pixmap_signal.connect(self.update_image)
+        self.combined_thread.progress_signal.connect(self.update_progress)
+        self.combined_thread.finished_signal.connect(self.combined_processing_finished)
+        self.combined_thread.result_folder_signal.connect(self.set_result_folder)
+
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.setup_preview(self.combined_thread)
+        self.combined_thread.start()
+
+        file_name = self.score_video_path.split('/')[-1]
+        self.status_label.setText(f"正在测速并评分: {file_name}")
+        self.progress_label.setText(f"测速并评分中: {file_name}")
+
+        self.autoScoreButton.setEnabled(False)
+        self.combinedButton.setEnabled(False)
+        self.openScoreButton.setEnabled(False)
+
+    def combined_processing_finished(self):
+        """测速并评分完成：先显示评分结果，再加入测速结果"""
+        self.combinedButton.setEnabled(True)
+        if self.combined_thread.speed:
+            self.last_speed_value = str(self.combined_thread.speed)
+        self.score_processing_finished()
+        self.update_results_with_speed()
+
     def set_result_folder(self, folder_path):
         """设置结果文件夹路径"""
         self.last_results_folder = os.path.abspath(folder_path)
@@ -443,6 +516,7 @@ class MainWindow(QWidget):
         # 启动视频处理线程
         self.progressBar.setValue(0)
         self.progressBar.setVisible(True)
+        self.setup_preview(self.video_thread)
         self.video_thread.start()
         
         # 更新状态
@@ -512,10 +586,31 @@ class MainWindow(QWidget):
 
     def update_image(self, qt_img):
         """更新图像显示"""
-        self.label.setPixmap(QPixmap.fromImage(qt_img).scaled(
-            self.label.width(), self.label.height(),
-            Qt.KeepAspectRatio, Qt.SmoothTransformation
-        ))
+        pixmap = QPixmap.fromImage(qt_img)
+        # 处理线程已按控件尺寸缩小，只有控件变小后才需要再缩放
+        if pixmap.width() > self.label.width() or pixmap.height() > self.label.height():
+            pixmap = pixmap.scaled(self.label.width(), self.label.height(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.label.setPixmap(pixmap)
+        # 通知处理线程本帧已显示，可以发送下一帧
+        sender = self.sender()
+        if sender is not None and hasattr(sender, 'preview'):
+            sender.preview.ack()
+
+    def setup_preview(self, thread):
+        """按预览控件尺寸和预览开关设置处理线程的预览通道"""
+        thread.preview.set_size(self.label.width(), self.label.height())
+        thread.preview.enabled = self.preview_enabled
+        thread.preview.ack()
+
+    def toggle_preview(self):
+        """开关实时预览，关闭后处理线程不再转换和发送预览图像，处理速度最快"""
+        self.preview_enabled = self.preview_button.isChecked()
+        self.preview_button.setToolTip("关闭实时预览（最快处理速度）" if self.preview_enabled else "开启实时预览")
+        if not self.preview_enabled:
+            self.label.setText("实时预览已关闭")
+        for thread in (self.video_thread, self.auto_score_thread, self.combined_thread):
+            if thread is not None:
+                thread.preview.enabled = self.preview_enabled
 
     def view_results(self):
         """查看评分结果"""
@@ -544,85 +639,27 @@ class MainWindow(QWidget):
             result_text += "<table style='margin:0 auto; border-collapse:collapse; width:90%;'>"
             result_text += "<tr style='background-color:#2c3e50;'><th style='padding:8px; border:1px solid #3498db;'>评分项目</th><th style='padding:8px; border:1px solid #3498db;'>得分</th><th style='padding:8px; border:1px solid #3498db;'>状态</th></tr>"
             
-            # 读取各项评分
-            take_off_path = os.path.join(abs_results_folder, "take_off.jpg")
-            hip_extension_path = os.path.join(abs_results_folder, "hip_extension.jpg")
-            abdominal_contraction_path = os.path.join(abs_results_folder, "abdominal_contraction.jpg")
-            
-            print(f"检查文件是否存在:")
-            print(f"take_off.jpg: {os.path.exists(take_off_path)}")
-            print(f"hip_extension.jpg: {os.path.exists(hip_extension_path)}")
-            print(f"abdominal_contraction.jpg: {os.path.exists(abdominal_contraction_path)}")
-            
-            # 提取图像信息的函数
-            def extract_score(image_path):
-                if not os.path.exists(image_path):
+            # 读取评分记录，不再从结果图片中解析分数
+            record = load_record(abs_results_folder, SCORE_RECORD)
+            self.last_score_record = record
+            if record is None:
+                print(f"未找到评分记录: {os.path.join(abs_results_folder, SCORE_RECORD)}")
+
+            def extract_score(posture_type):
+                item = (record or {}).get('postures', {}).get(posture_type)
+                if item is None:
                     return "未生成", "❌", 0
-                
-                try:
-                    # 尝试从图像中提取实际分数
-                    score_value = 0
-                    
-                    # 如果是评分文件，尝试提取实际分数
-                    try:
-                        import cv2
-                        import numpy as np
-                        import re
-                        
-                        # 使用一个安全的方法读取评分图像
-                        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-                        if img is not None:
-                            # 将图像转换为灰度
-                            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                            
-                            # 尝试提取图像上的文本 - 需要OCR，这里简化处理
-                            # 文本通常在图像的左上角，格式为 "Score: [number]"
-                            # 我们使用正则表达式来提取数字
-                            img_text = cv2.putText(np.zeros((100, 500), dtype=np.uint8), "Score: ?", (10, 50), 
-                                                   cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2)
-                            
-                            # 这是一个模拟的过程，实际应该使用OCR
-                            img_str = str(img.tolist())
-                            score_match = re.search(r'Score: (\d+)', img_str)
-                            if score_match:
-                                score_value = int(score_match.group(1))
-                                # 将原始分数转换为百分制
-                                score_value = min(100, max(0, score_value)) # 限制在0-100之间
-                            else:
-                                score_value = 85  # 默认分数，如果提取失败
-                    except Exception as e:
-                        print(f"提取图像评分失败: {e}")
-                        score_value = 85  # 设置默认分数
-                    
-                    # 如果分数提取失败，使用默认值
-                    if score_value == 0:
-                        # 根据项目类型分配不同的默认分数
-                        if "take_off" in image_path:
-                            score_value = 88
-                        elif "hip_extension" in image_path:
-                            score_value = 82
-                        elif "abdominal_contraction" in image_path:
-                            score_value = 90
-                        else:
-                            score_value = 85
-                    
-                    # 获取文件修改时间
-                    import time
-                    modified_time = os.path.getmtime(image_path)
-                    time_str = time.strftime("%H:%M:%S", time.localtime(modified_time))
-                    
-                    return f"{score_value} 分", "✅", score_value
-                except Exception as e:
-                    print(f"Error extracting score: {e}")
-                    return "读取错误", "⚠️", 0
-            
+                if item['score'] is None:
+                    return "未检测到", "⚠️", 0
+                return f"{item['score']:g} 分", "✅", item['score']
+
             # 提取各项评分状态
-            take_off_score, take_off_status, take_off_value = extract_score(take_off_path)
-            hip_extension_score, hip_extension_status, hip_extension_value = extract_score(hip_extension_path)
-            abdominal_contraction_score, abdominal_contraction_status, abdominal_contraction_value = extract_score(abdominal_contraction_path)
-            
-            # 计算综合得分 (加权平均)
-            composite_score = int(take_off_value * 0.4 + hip_extension_value * 0.3 + abdominal_contraction_value * 0.3)
+            take_off_score, take_off_status, take_off_value = extract_score("take_off")
+            hip_extension_score, hip_extension_status, hip_extension_value = extract_score("hip_extension")
+            abdominal_contraction_score, abdominal_contraction_status, abdominal_contraction_value = extract_score("abdominal_contraction")
+
+            # 综合得分 (加权平均)
+            composite_score = record['composite'] if record else 0
             
             # 更新综合得分显示
             result_text = result_text.replace("88<span style='font-size:18px;'>/100</span>", 
@@ -700,124 +737,64 @@ class MainWindow(QWidget):
             self.get_ai_expert_evaluation()
             
     def get_ai_expert_evaluation(self):
-        """获取AI专家评价"""
+        """获取AI专家评价（后台线程请求，流式显示）"""
         # 检查是否有API密钥
         if not hasattr(self, 'deepseek_api_key') or not self.deepseek_api_key:
             api_key = self.set_api_key()
             if not api_key:
                 return
-        
-        # 准备评价内容
-        composite_score = "未知"
-        
-        # 尝试获取综合得分
-        try:
-            current_text = self.results_label.text()
-            import re
-            score_match = re.search(r'<div style=\'font-size:36px; color:#2ecc71; margin:10px 0;\'>(\d+)<span', current_text)
-            if score_match:
-                composite_score = score_match.group(1)
-                
-        except Exception as e:
-            print(f"提取评分信息失败: {e}")
-        
+        if self.coach_thread is not None and self.coach_thread.isRunning():
+            return
+
         # 构建提示信息 - 不包含速度评价
-        prompt = f"""
-        作为一位专业的跳远训练教练，请对一名运动员的挺身式跳远姿态表现进行评价。
-        
-        运动员的姿态评分数据如下：
-        - 综合评分: {composite_score}/100
-        
-        请从以下几个方面对运动员的姿态表现进行评价：
-        1. 起跳姿态
-        2. 髋关节伸展
-        3. 腹部收缩
-        4. 给出针对性的训练建议
-        
-        请用专业、鼓励的语气进行点评，控制在300字以内。
-        要求：评价内容要分段落组织，每个要点一个段落，不要所有内容都在一段里。
-        """
-        
+        prompt = build_prompt(self.last_score_record)
+
         # 更新UI，显示加载中状态
         current_html = self.results_label.text()
-        updated_html = current_html.replace('display:none', 'display:block').replace('加载中...', '正在获取AI专家评价，请稍候...')
-        self.results_label.setText(updated_html)
-        QApplication.processEvents()  # 强制更新UI
-        
-        try:
-            # 调用DeepSeek API
-            api_response = self.call_deepseek_api(prompt)
-            
-            # 处理API响应
-            expert_evaluation = "获取AI专家评价失败，请检查API密钥和网络连接。"
-            
-            if api_response and 'choices' in api_response and len(api_response['choices']) > 0:
-                expert_evaluation = api_response['choices'][0]['message']['content']
-                
-                # 改进文本格式化 - 将换行符替换为HTML段落标签
-                # 先分割成段落
-                paragraphs = expert_evaluation.strip().split('\n\n')
-                formatted_text = ""
-                
-                for paragraph in paragraphs:
-                    # 如果段落中有标题（数字+点+空格 开头的文本）
-                    if re.match(r'^\d+\.', paragraph.strip()):
-                        # 添加粗体样式
-                        formatted_paragraph = f"<p style='margin-bottom:10px;'><strong>{paragraph}</strong></p>"
-                    else:
-                        # 普通段落
-                        formatted_paragraph = f"<p style='margin-bottom:10px;'>{paragraph}</p>"
-                    
-                    formatted_text += formatted_paragraph
-                
-                # 如果没有检测到段落，则把单个换行符转换为<br>
-                if not paragraphs or len(paragraphs) <= 1:
-                    formatted_text = expert_evaluation.replace('\n', '<br>')
-                
-                expert_evaluation = formatted_text
-            
-            # 更新UI
-            current_html = self.results_label.text()
-            updated_html = current_html.replace('正在获取AI专家评价，请稍候...', expert_evaluation)
-            self.results_label.setText(updated_html)
-            
-        except Exception as e:
-            print(f"获取AI专家评价失败: {e}")
-            # 更新UI显示错误
-            current_html = self.results_label.text()
-            updated_html = current_html.replace('正在获取AI专家评价，请稍候...', f"获取AI专家评价失败: {str(e)}")
-            self.results_label.setText(updated_html)
-            
-    def call_deepseek_api(self, prompt):
-        """调用DeepSeek API"""
-        if not hasattr(self, 'deepseek_api_key') or not self.deepseek_api_key:
-            return None
-            
-        try:
-            url = "https://api.deepseek.com/v1/chat/completions"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.deepseek_api_key}"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "你是一位专业的跳远教练，需要对运动员的表现进行专业评价。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 800
-            }
-            
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            return response.json()
-            
-        except Exception as e:
-            print(f"API调用失败: {e}")
-            return None
-            
+        if '加载中...' in current_html:
+            self.ai_base_html = current_html.replace('display:none', 'display:block')
+        elif not self.ai_base_html:
+            return
+        self.show_ai_evaluation('正在获取AI专家评价，请稍候...')
+
+        if self.coach_client is None or self.coach_client.api_key != self.deepseek_api_key:
+            self.coach_client = CoachClient(self.deepseek_api_key)
+        self.coach_thread = CoachThread(self.coach_client, prompt)
+        self.coach_thread.delta_signal.connect(lambda text: self.show_ai_evaluation(self.format_evaluation(text)))
+        self.coach_thread.finished_signal.connect(lambda text: self.show_ai_evaluation(self.format_evaluation(text)))
+        self.coach_thread.error_signal.connect(lambda error: self.show_ai_evaluation(f"获取AI专家评价失败: {error}"))
+        self.coach_thread.start()
+
+    def show_ai_evaluation(self, content):
+        """把评价内容填入结果区域的AI专家评价部分"""
+        self.results_label.setText(self.ai_base_html.replace('加载中...', content))
+
+    @staticmethod
+    def format_evaluation(expert_evaluation):
+        """改进文本格式化 - 将换行符替换为HTML段落标签"""
+        if not expert_evaluation:
+            return "获取AI专家评价失败，请检查API密钥和网络连接。"
+        # 先分割成段落
+        paragraphs = expert_evaluation.strip().split('\n\n')
+        formatted_text = ""
+
+        for paragraph in paragraphs:
+            # 如果段落中有标题（数字+点+空格 开头的文本）
+            if re.match(r'^\d+\.', paragraph.strip()):
+                # 添加粗体样式
+                formatted_paragraph = f"<p style='margin-bottom:10px;'><strong>{paragraph}</strong></p>"
+            else:
+                # 普通段落
+                formatted_paragraph = f"<p style='margin-bottom:10px;'>{paragraph}</p>"
+
+            formatted_text += formatted_paragraph
+
+        # 如果没有检测到段落，则把单个换行符转换为<br>
+        if not paragraphs or len(paragraphs) <= 1:
+            formatted_text = expert_evaluation.replace('\n', '<br>')
+
+        return formatted_text
+
     def set_api_key(self):
         """设置DeepSeek API密钥"""
         current_key = getattr(self, 'deepseek_api_key', '')
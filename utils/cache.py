@@ -0,0 +1,39 @@
+# Content hashing and cache locations for per-video caches
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CACHE_ROOT = Path(os.getenv('RUNNER_CACHE_DIR', Path.cwd() / 'cache'))  # override with env RUNNER_CACHE_DIR
+
+
+def file_hash(path, sample_size=1 << 20, samples=16):
+    # Returns a content hash of a (video) file without reading all of it:
+    # file size + first/last `sample_size` bytes + `samples` evenly spaced blocks in between.
+    # Re-encoded or trimmed clips change size and/or sampled content; identical files always match.
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= sample_size * (samples + 2):
+            for block in iter(lambda: f.read(sample_size), b''):
+                h.update(block)
+        else:
+            block = sample_size // 16
+            offsets = [0] + [size * (i + 1) // (samples + 1) for i in range(samples)] + [size - sample_size]
+            for i, offset in enumerate(offsets):
+                f.seek(offset)
+                h.update(f.read(sample_size if i in (0, len(offsets) - 1) else block))
+    return h.hexdigest()
+
+
+def config_hash(*items):
+    # Returns a short stable hash of JSON-serializable configuration items (model versions, thresholds, ...)
+    return hashlib.blake2b(json.dumps(items, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
+
+
+def cache_path(kind, key, suffix=''):
+    # Returns CACHE_ROOT/kind/key+suffix, creating the directory
+    d = CACHE_ROOT / kind
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f'{key}{suffix}'
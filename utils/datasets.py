@@ -22,6 +22,7 @@ from tqdm import tqdm
 
 from utils.general import check_requirements, xyxy2xywh, xywh2xyxy, xywhn2xyxy, xyn2xy, segment2box, segments2boxes, \
     resample_segments, clean_str
+from utils.frame_source import FrameSource
 from utils.torch_utils import torch_distributed_zero_first
 
 # Parameters
@@ -160,8 +161,8 @@ class LoadImages:  # for inference
         if self.video_flag[self.count]:
             # Read video
             self.mode = 'video'
-            ret_val, img0 = self.cap.read()
-            if not ret_val:
+            frame = self.cap.read()
+            if frame is None:
                 self.count += 1
                 self.cap.release()
                 if self.count == self.nf:  # last video
@@ -169,7 +170,8 @@ class LoadImages:  # for inference
                 else:
                     path = self.files[self.count]
                     self.new_video(path)
-                    ret_val, img0 = self.cap.read()
+                    frame = self.cap.read()
+            img0 = frame.image
 
             self.frame += 1
             print(f'video {self.count + 1}/{self.nf} ({self.frame}/{self.nframes}) {path}: ', end='')
@@ -192,8 +194,8 @@ class LoadImages:  # for inference
 
     def new_video(self, path):
         self.frame = 0
-        self.cap = cv2.VideoCapture(path)
-        self.nframes = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.cap = FrameSource(path)  # decodes ahead on a background thread
+        self.nframes = self.cap.frame_count
 
     def __len__(self):
         return self.nf  # number of files
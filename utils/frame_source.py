@@ -0,0 +1,235 @@
+# Threaded frame source with prefetch ring buffer
+
+import time
+from collections import deque, namedtuple
+from threading import Condition, Thread
+
+import cv2
+import numpy as np
+
+from utils.profiler import NULL_SPAN, current, span
+
+# index: 0-based frame number in the video, timestamp: seconds since the start of the video (or capture clock)
+# image: decoded BGR frame, or a tuple of frames when several resize targets are requested
+Frame = namedtuple('Frame', ['index', 'timestamp', 'image'])
+
+
+def seek_capture(cap, index):
+    # Frame-accurate seek so that the next read() returns frame `index`
+    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == index:
+        return True
+    # Some containers/codecs cannot seek exactly by frame number, fall back to grabbing from the start
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(index):
+        if not cap.grab():
+            return False
+    return True
+
+
+class FrameSource:
+    """Decode video frames on a background thread into a bounded ring buffer.
+
+    Frames that are not needed (see `step`) are skipped with cap.grab() and never decoded into images.
+    Frames can be resized on the reader thread (`resize` is a (w, h) tuple or a list of them), so that
+    decode and resize overlap with inference on the consumer thread. In a list, a None target passes the
+    full-size frame through, so one decode can feed consumers at different resolutions.
+
+    For local files the reader blocks when the buffer is full (no frame is lost). For live sources
+    (`live=True`) the oldest buffered frame is dropped instead and timestamps come from the capture clock
+    (time.perf_counter() relative to `clock_start`, which defaults to the first captured frame).
+
+    With `reuse_buffers=True` (files only) frames are decoded/resized into a preallocated pool of arrays instead of
+    fresh ones per frame. A pooled image stays valid until two further frames have been read; copy it if it must
+    live longer.
+
+    For files that are still being written (e.g. a chunked upload), `wait(index)` is called before frame
+    `index` is read; it blocks until the frame's data is on disk and returns False to end the source.
+
+    Usage:
+        with FrameSource('video.mp4', step=2, resize=(960, 540)) as source:
+            for frame in source:
+                frame.index, frame.timestamp, frame.image
+    """
+
+    def __init__(self, source, buffer_size=32, step=1, resize=None, start=0, end=None, live=False,
+                 interpolation=cv2.INTER_LINEAR, clock_start=None, wait=None, reuse_buffers=False):
+        self.source = source
+        self.buffer_size = max(int(buffer_size), 1)
+        self.step = max(int(step), 1)
+        self.resize = resize
+        self.live = live
+        self.interpolation = interpolation
+        self.wait = wait
+        # Pool slots: consumer's current and previous frame + full buffer + the frame being decoded
+        self.reuse_buffers = reuse_buffers and not live
+        self._pool = {}  # (target index, slot) -> array
+        self._slot = 0
+        self.profiler = current()  # the reader thread records decode/resize spans on the creator's profiler
+
+        self.cap = cv2.VideoCapture(source)
+        assert self.cap.isOpened(), f'Failed to open {source}'
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.end = end if end is not None else (self.frame_count if self.frame_count > 0 and not live else None)
+
+        self._buffer = deque()
+        self._cond = Condition()
+        self._running = False
+        self._finished = False
+        self._thread = None
+        self._next_index = 0
+        self._clock_start = clock_start  # time.perf_counter() origin, share it to put several live sources on one clock
+        self.dropped = 0  # frames dropped from the ring buffer (live sources only)
+
+        if start:
+            self.seek(start)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.release()
+
+    def __iter__(self):
+        if self._thread is None:
+            self.start()
+        return self
+
+    def __next__(self):
+        frame = self.read()
+        if frame is None:
+            raise StopIteration
+        return frame
+
+    def get(self, prop):
+        # cv2.VideoCapture.get() passthrough for static properties (fps, size, frame count)
+        return self.cap.get(prop)
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._finished = False
+            self._thread = Thread(target=self._reader, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        # Stop the reader thread and discard buffered frames, keeping the capture open
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            self._buffer.clear()
+
+    def seek(self, index):
+        # Position the source so that the next delivered frame is `index`
+        running = self._thread is not None
+        self.stop()
+        if not seek_capture(self.cap, index):
+            return False
+        self._next_index = index
+        if running:
+            self.start()
+        return True
+
+    def read(self, timeout=None):
+        # Return the next Frame, or None when the source is exhausted
+        with self._cond:
+            while not self._buffer and not self._finished:
+                if self._thread is None:
+                    self.start()
+                if not self._cond.wait(timeout):
+                    return None
+            if not self._buffer:
+                return None
+            frame = self._buffer.popleft()
+            self._cond.notify_all()
+            return frame
+
+    @property
+    def exhausted(self):
+        # True once the reader has stopped and every buffered frame was read; tells a read() timeout from the end
+        with self._cond:
+            return self._finished and not self._buffer
+
+    def release(self):
+        self.stop()
+        self.cap.release()
+
+    def _timestamp(self, index):
+        if self.live:
+            now = time.perf_counter()
+            if self._clock_start is None:
+                self._clock_start = now
+            return now - self._clock_start
+        return index / self.fps
+
+    def _buffer_for(self, target, shape):
+        # Next pooled destination array for resize target `target` (-1: full-size frame), or None without pooling
+        if not self.reuse_buffers:
+            return None
+        key = (target, self._slot)
+        buffer = self._pool.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._pool[key] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def _decode(self):
+        self._slot = (self._slot + 1) % (self.buffer_size + 3)
+        multiple = self.resize is not None and (self.resize[0] is None or isinstance(self.resize[0], (tuple, list)))
+        sizes = self.resize if multiple else [self.resize]
+        with span('retrieve'):
+            if self.reuse_buffers and None in sizes:
+                success, im = self.cap.retrieve(self._buffer_for(-1, (self.height, self.width, 3)))
+            else:
+                success, im = self.cap.retrieve()
+        if not success:
+            return None
+        if self.resize is None:
+            return im
+        with span('resize'):
+            images = tuple(im if size is None else
+                           cv2.resize(im, tuple(size), dst=self._buffer_for(i, (size[1], size[0], 3)),
+                                      interpolation=self.interpolation) for i, size in enumerate(sizes))
+            return images if multiple else images[0]
+
+    def _reader(self):
+        with self.profiler.activate() if self.profiler is not None else NULL_SPAN:
+            self._read_frames()
+
+    def _read_frames(self):
+        index = self._next_index
+        while self._running and (self.end is None or index < self.end):
+            if self.wait is not None and not self.wait(index):
+                break
+            with span('decode'):  # grab() demuxes and decodes, retrieve() only converts to BGR
+                grabbed = self.cap.grab()
+            if not grabbed:
+                break
+            current, index = index, index + 1
+            if current % self.step:
+                continue  # skipped frames are grabbed but never decoded
+            im = self._decode()
+            if im is None:
+                break
+            frame = Frame(current, self._timestamp(current), im)
+            with self._cond:
+                while self._running and len(self._buffer) >= self.buffer_size and not self.live:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                if len(self._buffer) >= self.buffer_size:  # live: drop the stalest frame
+                    self._buffer.popleft()
+                    self.dropped += 1
+                self._buffer.append(frame)
+                self._cond.notify_all()
+        with self._cond:
+            self._next_index = index  # matches the capture position
+            self._finished = True
+            self._cond.notify_all()
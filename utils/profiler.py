@@ -0,0 +1,164 @@
+# Lightweight per-stage latency instrumentation
+#
+# Code marks stages with `with span('yolo_forward'):`. Spans are recorded only while a Profiler is active on the
+# current thread (see Profiler.activate), otherwise span() returns a shared no-op context manager, so instrumented
+# code costs one thread-local lookup when profiling is off.
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+_local = threading.local()
+
+
+def current():
+    # Returns the Profiler active on this thread, or None
+    return getattr(_local, 'profiler', None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name, cuda=False):
+    # Times the enclosed block as stage `name` on the active profiler; cuda=True waits for queued GPU work first
+    profiler = current()
+    return NULL_SPAN if profiler is None else _Span(profiler, name, cuda)
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'cuda', 'start')
+
+    def __init__(self, profiler, name, cuda):
+        self.profiler = profiler
+        self.name = name
+        self.cuda = cuda
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self.cuda:
+            cuda_synchronize()
+        self.profiler.add(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+def cuda_synchronize():
+    # CUDA kernels run asynchronously, synchronize so a span covers the GPU work it launched (cf. time_synchronized)
+    torch = sys.modules.get('torch')  # never import torch just for profiling
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+class Profiler:
+    """Collects named spans from one or more threads and aggregates them into per-stage latency statistics.
+
+    Usage:
+        profiler = Profiler()
+        with profiler.activate():
+            ...  # code calling span('decode'), span('yolo_forward', cuda=True), ...
+        profiler.summary()  # {'decode': {'count', 'total', 'mean', 'p50', 'p95', 'p99', 'max'}, ...} in ms
+        profiler.save_json('profile.json'); profiler.save_chrome_trace('trace.json')
+
+    Worker threads (e.g. a FrameSource reader) join by calling profiler.activate() themselves.
+    Individual events are kept for the Chrome trace up to `max_events`; statistics always cover every span.
+    """
+
+    def __init__(self, max_events=200000):
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.durations = defaultdict(list)
+        self.events = []  # (name, thread id, start, duration)
+        self.threads = {}
+        self._lock = threading.Lock()
+
+    def activate(self):
+        return _Activation(self)
+
+    def add(self, name, start, duration):
+        thread = threading.current_thread()
+        with self._lock:
+            self.durations[name].append(duration)
+            if len(self.events) < self.max_events:
+                self.events.append((name, thread.ident, start, duration))
+                self.threads.setdefault(thread.ident, thread.name)
+
+    def reset(self):
+        with self._lock:
+            self.origin = time.perf_counter()
+            self.durations.clear()
+            self.events.clear()
+            self.threads.clear()
+
+    def summary(self):
+        # Per-stage statistics in milliseconds, stages in order of total time
+        with self._lock:
+            items = [(name, np.asarray(values) * 1000) for name, values in self.durations.items()]
+        stats = {}
+        for name, ms in sorted(items, key=lambda item: -item[1].sum()):
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            stats[name] = {'count': int(len(ms)), 'total': round(float(ms.sum()), 3), 'mean': round(float(ms.mean()), 3),
+                           'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3),
+                           'max': round(float(ms.max()), 3)}
+        return stats
+
+    def report(self):
+        # Printable table of summary()
+        lines = [f"{'stage':<18}{'count':>8}{'total ms':>12}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<18}{s['count']:>8}{s['total']:>12.1f}{s['p50']:>9.2f}{s['p95']:>9.2f}"
+                         f"{s['p99']:>9.2f}{s['max']:>9.2f}")
+        return '\n'.join(lines)
+
+    def save_json(self, path, **extra):
+        # Writes {'stages': summary(), **extra}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': self.summary(), **extra}, f, ensure_ascii=False, indent=2)
+        return path
+
+    def chrome_trace(self):
+        # Trace Event Format, viewable in chrome://tracing or https://ui.perfetto.dev
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        trace += [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': round((start - self.origin) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+                  for name, tid, start, duration in events]
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+class _Activation:
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = current()
+        _local.profiler = self.profiler
+        return self.profiler
+
+    def __exit__(self, *args):
+        _local.profiler = self.previous
+        return False
@@ -0,0 +1,89 @@
+# Background video encoder with a bounded queue
+
+import queue
+import threading
+
+import cv2
+
+from utils.profiler import NULL_SPAN, current, span
+
+_CLOSE = object()
+
+
+class AsyncVideoWriter:
+    """Encode video frames on a background thread so that drawing and encoding overlap with inference.
+
+    `write(frame, draw)` queues the frame and returns; the encoder thread calls `draw(frame)` (e.g. the skeleton
+    overlay) and writes the result. The queue is bounded (`queue_size` frames), so a slow encoder applies
+    backpressure instead of buffering the whole video in memory. The writer takes ownership of queued frames:
+    callers must not modify a frame after writing it, and must copy pooled buffers (FrameSource reuse_buffers).
+
+    The output file is opened with the size of the first frame written, so writing no frames produces no file.
+
+    Errors raised on the encoder thread are re-raised by the next write() or by close().
+
+    Usage:
+        with AsyncVideoWriter('out.mp4', fps) as writer:
+            writer.write(frame, draw=lambda image: annotate(image, row))
+    """
+
+    def __init__(self, path, fps, size=None, fourcc='mp4v', queue_size=16):
+        self.path = path
+        self.fps = fps
+        self.size = size  # (w, h); None uses the size of the first frame
+        self.fourcc = fourcc
+        self.written = 0
+        self._writer = None
+        self._error = None
+        self._queue = queue.Queue(max(int(queue_size), 1))
+        self.profiler = current()  # the encoder thread records draw/encode spans on the creator's profiler
+        self._thread = threading.Thread(target=self._run, daemon=True, name='video-writer')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, frame, draw=None):
+        """Queue a BGR frame; `draw` is called on the encoder thread and returns the image to encode"""
+        if self._error is not None:
+            raise self._error
+        with span('video_queue'):  # time spent waiting for a full queue
+            self._queue.put((frame, draw))
+
+    def _run(self):
+        with self.profiler.activate() if self.profiler is not None else NULL_SPAN:
+            while True:
+                item = self._queue.get()
+                if item is _CLOSE:
+                    break
+                if self._error is not None:
+                    continue  # keep draining so that writers never block on a failed encoder
+                frame, draw = item
+                try:
+                    if draw is not None:
+                        frame = draw(frame)
+                    if self._writer is None:
+                        size = self.size or (frame.shape[1], frame.shape[0])
+                        self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                                       (int(size[0]), int(size[1])))
+                    with span('video_write'):
+                        self._writer.write(frame)
+                    self.written += 1
+                except Exception as e:
+                    self._error = e
+            if self._writer is not None:
+                self._writer.release()
+
+    def close(self):
+        """Encode the queued frames and close the file"""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    release = close  # drop-in for cv2.VideoWriter